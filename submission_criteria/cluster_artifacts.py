@@ -0,0 +1,102 @@
+"""On-disk cluster artifacts so restarts don't refit the clustering."""
+
+# System
+import os
+import logging
+import tempfile
+
+# Third Party
+import numpy as np
+
+# Bump whenever the clustering or the artifact contents change
+ARTIFACT_VERSION = 1
+ARTIFACT_DIR = os.environ.get("CLUSTER_ARTIFACT_DIR")
+
+
+def get_path(local_dir, tournament, round_number, checksum):
+    """Return the artifact path of a round's dataset
+
+    Parameters:
+    -----------
+    local_dir : string
+        Directory artifacts are stored under unless CLUSTER_ARTIFACT_DIR is set
+
+    tournament : int
+        Tournament of the competition round
+
+    round_number : int
+        Numerical ID of the competition round of the tournament
+
+    checksum : string
+        Checksum of the round's dataset
+
+    Returns:
+    --------
+    path : string
+        Path of the versioned artifact
+    """
+    return os.path.join(ARTIFACT_DIR or local_dir, "t{}".format(tournament),
+                        str(round_number), "clusters-v{}-{}.npz".format(
+                            ARTIFACT_VERSION, checksum))
+
+
+def save(path, variables):
+    """Atomically write the centroids and cluster labels of a round
+
+    Parameters:
+    -----------
+    path : string
+        Artifact path from get_path
+
+    variables : dictionary
+        Competition variables holding "centroids" and "cluster_1" to "cluster_3"
+    """
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".npz.tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(
+                f,
+                version=ARTIFACT_VERSION,
+                centroids=variables["centroids"],
+                cluster_1=variables["cluster_1"].astype(np.uint8),
+                cluster_2=variables["cluster_2"].astype(np.uint8),
+                cluster_3=variables["cluster_3"].astype(np.uint8))
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    logging.getLogger().info("Saved cluster artifact {}".format(path))
+
+
+def load(path):
+    """Read the centroids and cluster labels of a round
+
+    Parameters:
+    -----------
+    path : string
+        Artifact path from get_path
+
+    Returns:
+    --------
+    artifact : dictionary
+        "centroids" and "cluster_1" to "cluster_3", or None when there is no
+        usable artifact at path
+    """
+    if not os.path.isfile(path):
+        return None
+    try:
+        with np.load(path) as data:
+            if int(data["version"]) != ARTIFACT_VERSION:
+                return None
+            artifact = {
+                key: data[key]
+                for key in ["centroids", "cluster_1", "cluster_2", "cluster_3"]
+            }
+    except Exception:
+        logging.exception("Could not read cluster artifact {}".format(path))
+        return None
+    logging.getLogger().info("Loaded cluster artifact {}".format(path))
+    return artifact
@@ -4,6 +4,8 @@ Commonly used functions.
 
 # System
 import os
+import atexit
+import threading
 
 # Third Party
 import pandas as pd
@@ -12,6 +14,14 @@ from psycopg2 import connect
 import boto3
 import botocore
 from submission_criteria import tournament_common as tc
+from submission_criteria import round_dataset
+from submission_criteria import validation_cache
+from submission_criteria.postgres_pool import ConnectionPool
+from submission_criteria.write_buffer import WriteBuffer
+from submission_criteria import metadata_cache
+from submission_criteria import metrics
+from submission_criteria.submission_cache import SubmissionData
+from submission_criteria.rank_correlation import RankCorrelation
 
 S3_BUCKET = os.environ.get("S3_UPLOAD_BUCKET", "numerai-production-uploads")
 S3_ACCESS_KEY = os.environ.get("S3_ACCESS_KEY")
@@ -20,6 +30,25 @@ s3 = boto3.resource("s3",
                     aws_access_key_id=S3_ACCESS_KEY,
                     aws_secret_access_key=S3_SECRET_KEY)
 
+# Score every target of the dataset, not just the tournament's own target
+SCORE_ALL_TARGETS = os.environ.get("SCORE_ALL_TARGETS", "") == "1"
+POSTGRES_POOL_MIN = int(os.environ.get("POSTGRES_POOL_MIN", "1"))
+POSTGRES_POOL_MAX = int(os.environ.get("POSTGRES_POOL_MAX", "4"))
+
+# Results buffered before a flush, milliseconds between flushes and results
+# buffered at most
+WRITE_BATCH_SIZE = int(os.environ.get("WRITE_BATCH_SIZE", "500"))
+WRITE_BATCH_DELAY_MS = int(os.environ.get("WRITE_BATCH_DELAY_MS", "1000"))
+WRITE_BUFFER_MAX_PENDING = int(
+    os.environ.get("WRITE_BUFFER_MAX_PENDING", "50000"))
+
+_postgres_pool = None
+_postgres_pool_lock = threading.Lock()
+_write_buffer = None
+_metadata_cache = metadata_cache.MetadataCache(
+    rounds_ttl=int(os.environ.get("ROUNDS_TTL", metadata_cache.ROUNDS_TTL)),
+    users_ttl=int(os.environ.get("USERS_TTL", metadata_cache.USERS_TTL)))
+
 TARGETS = [
     "sentinel",
     "target_bernie",
@@ -43,42 +72,94 @@ def get_secret(key):
     return secret
 
 
-def get_round(postgres_db, submission_id):
-    query = """
-        SELECT r.tournament, r.number, r.dataset_path
-        FROM submissions s
-        INNER JOIN rounds r
-          ON s.round_id = r.id
-            AND s.id = %s
-        """
+SUBMISSION_CONTEXT_QUERY = "SELECT round_id, user_id, filename FROM submissions WHERE id = %s"
+
+
+def query_submission_context(postgres_db, submission_id):
+    """Query the round, file and owner of a submission
+
+    Only the submission is queried, its round and owner come from the
+    MetadataCache of the process, see get_metadata_cache, so this is one
+    round trip unless the round or the owner is not cached.
+
+    Parameters:
+    -----------
+    postgres_db : connection
+        Postgres connection
+
+    submission_id : string
+        ID of the submission
+
+    Returns:
+    --------
+    context : dictionary
+        "tournament", "round_number" and "dataset_path" of the round,
+        "filename" and "username" of the submission, and "s3_file", the key of
+        the submission in S3_BUCKET
+    """
     cursor = postgres_db.cursor()
-    cursor.execute(query, [submission_id])
-    tournament, round_number, dataset_path = cursor.fetchone()
+    cursor.execute(SUBMISSION_CONTEXT_QUERY, [submission_id])
+    result = cursor.fetchone()
     cursor.close()
-    return tournament, round_number, dataset_path
+    if result is None:
+        raise ValueError("Unknown submission {}".format(submission_id))
+    round_id, user_id, filename = result
+    metadata = get_metadata_cache()
+    tournament, round_number, dataset_path = metadata.get_round(
+        postgres_db, round_id)
+    username = metadata.get_username(postgres_db, user_id)
+    return {
+        "tournament": tournament,
+        "round_number": round_number,
+        "dataset_path": dataset_path,
+        "filename": filename,
+        "username": username,
+        "s3_file": "{}/{}".format(username, filename),
+    }
+
+
+def get_submission_context(submission, pool=None):
+    """Return the context of a submission work item, see query_submission_context
+
+    The context is queried once and cached on the work item under "context",
+    so every later stage handling the item reuses it.
+
+    Parameters:
+    -----------
+    submission : dictionary
+        Work item holding the "submission_id"
+
+    pool : ConnectionPool, optional, default: None
+        Pool to query with, the pool of the process when not given
+    """
+    context = submission.get("context")
+    if context is None:
+        with (pool or get_postgres_pool()).connection() as postgres_db:
+            context = query_submission_context(postgres_db,
+                                               submission["submission_id"])
+        submission["context"] = context
+    return context
+
+
+def get_round(postgres_db, submission_id):
+    context = query_submission_context(postgres_db, submission_id)
+    return context["tournament"], context["round_number"], context[
+        "dataset_path"]
 
 
 def get_filename(postgres_db, submission_id):
-    query = "SELECT filename, user_id FROM submissions WHERE id = '{}'".format(
-        submission_id)
-    cursor = postgres_db.cursor()
-    cursor.execute(query)
-    results = cursor.fetchone()
-    filename = results[0]
-    user_id = results[1]
-    query = "SELECT username FROM users WHERE id = '{}'".format(user_id)
-    cursor.execute(query)
-    username = cursor.fetchone()[0]
-    cursor.close()
-    return "{}/{}".format(username, filename), filename
+    context = query_submission_context(postgres_db, submission_id)
+    return context["s3_file"], context["filename"]
 
 
-def read_csv(postgres_db, submission_id):
-    global s3
-    bucket = S3_BUCKET
+def read_submission(s3_file):
+    """Read a submission from its key in S3_BUCKET"""
+    return pd.read_csv(f's3://{S3_BUCKET}/{s3_file}')
+
 
+def read_csv(postgres_db, submission_id):
     s3_file, _ = get_filename(postgres_db, submission_id)
-    return pd.read_csv(f's3://{bucket}/{s3_file}')
+    return read_submission(s3_file)
 
 
 def connect_to_postgres():
@@ -93,48 +174,155 @@ def connect_to_postgres():
     return connect(postgres_url)
 
 
+def get_postgres_pool():
+    """Return the Postgres connection pool shared by the whole process"""
+    global _postgres_pool
+    with _postgres_pool_lock:
+        if _postgres_pool is None:
+            _postgres_pool = ConnectionPool(connect_to_postgres,
+                                            min_size=POSTGRES_POOL_MIN,
+                                            max_size=POSTGRES_POOL_MAX)
+        return _postgres_pool
+
+
+def get_write_buffer():
+    """Return the WriteBuffer of the process, flushed in the background and at exit"""
+    global _write_buffer
+    pool = get_postgres_pool()
+    with _postgres_pool_lock:
+        if _write_buffer is None:
+            _write_buffer = WriteBuffer(pool,
+                                        max_results=WRITE_BATCH_SIZE,
+                                        max_delay=WRITE_BATCH_DELAY_MS /
+                                        1000.0,
+                                        max_pending=WRITE_BUFFER_MAX_PENDING
+                                        ).start()
+            atexit.register(_write_buffer.close)
+        return _write_buffer
+
+
+def get_metadata_cache():
+    """Return the MetadataCache of the rounds and users of the process"""
+    return _metadata_cache
+
+
 def calc_correlation(targets, predictions):
     return np.corrcoef(targets, predictions.rank(pct=True, method="first"))[0,
                                                                             1]
 
 
-# update logloss and auroc
-def update_metrics(submission_id):
-    """Insert validation scores into the Postgres database."""
-    print("Updating loglosses...", submission_id)
-    postgres_db = connect_to_postgres()
-    cursor = postgres_db.cursor()
-    submission = read_csv(postgres_db, submission_id).set_index('id')
-    submission.rename(columns=lambda col: 'probability'
-                      if col.startswith('prediction_', ) else col,
-                      inplace=True)
-    tournament, _round_number, dataset_path = get_round(
-        postgres_db, submission_id)
-
-    # Get the truth data
+def calc_era_correlations(targets, predictions, era_offsets):
+    """Correlation of targets with the ranked predictions of every era at once
+
+    Gives the same result as calc_correlation on every era, see RankCorrelation.
+    Rounds reuse their kernels through MetricsEngine instead.
+
+    Parameters:
+    -----------
+    targets : ndarray
+        Targets grouped by era
+
+    predictions : ndarray
+        Predictions in the same order as targets
+
+    era_offsets : ndarray
+        Era i spans era_offsets[i]:era_offsets[i + 1]
+
+    Returns:
+    --------
+    correlations : ndarray
+        Correlation of every era
+    """
+    eras = np.repeat(np.arange(len(era_offsets) - 1), np.diff(era_offsets))
+    return RankCorrelation(targets, eras)(predictions)
+
+
+def score_metrics(validation_data, probabilities, targets):
+    """Score aligned predictions against targets of the validation data
+
+    The predictions are ranked once and every metric of metrics.METRICS is
+    read off that ranking for every target at once, see MetricsEngine.
+    Without eras in the validation data only the validation correlation is
+    scored.
+
+    Parameters:
+    -----------
+    validation_data : ValidationData
+        Validation data of the dataset version of the round
+
+    probabilities : ndarray
+        Predictions aligned to validation_data, see ValidationData.align
+
+    targets : tuple
+        Target columns to score against
+
+    Returns:
+    --------
+    scores : dictionary
+        Value of every metric scored, one per target
+    """
+    if not len(validation_data.era_names):
+        correlation = validation_data.get_correlation(targets)
+        return {"validation_correlation": correlation(probabilities)[0]}
+    scores = validation_data.get_metrics_engine(targets).score(probabilities)
+    return {metric: scores[metric] for metric in metrics.METRICS}
+
+
+def update_metrics(submission, filemanager=None):
+    """Score a submission and buffer its metrics for the Postgres database.
+
+    submission is the work item holding the "submission_id", its context is
+    cached on it, see get_submission_context.
+
+    The submission is read, aligned to the validation data and ranked once,
+    and the validation correlation, consistency, sharpe and max drawdown are
+    all scored from that, see score_metrics. With SCORE_ALL_TARGETS they are
+    scored against every target of the validation data in the same pass and
+    written to the target metrics table too. When a filemanager is given the
+    submission is read through its submission cache and the validation data
+    is shared through the RoundDataset of the round and cached per dataset
+    version, both are read from S3 for this submission only otherwise.
+    """
+    submission_id = submission["submission_id"]
+    print("Updating metrics...", submission_id)
+    context = get_submission_context(submission)
+    tournament, round_number = context["tournament"], context["round_number"]
+    dataset_path = context["dataset_path"]
+
+    # Get the submission and the truth data
     print("Getting validation data...", submission_id)
-    dataset_version = dataset_path.split('/')[0]
-    validation_data = tc.get_validation_data(s3,
-                                             dataset_version).set_index('id')
+    dataset_version = round_dataset.get_dataset_version(dataset_path)
+    if filemanager is not None:
+        submission_data = filemanager.read_submission(context["s3_file"])
+        validation_data = round_dataset.get_round_dataset(
+            filemanager, tournament, round_number,
+            dataset_version).validation_data
+    else:
+        submission_data = SubmissionData.from_frame(
+            read_submission(context["s3_file"]))
+        validation_data = validation_cache.ValidationData.from_frame(
+            tc.get_validation_data(s3, dataset_version))
 
     # Sort submission data
     print("Getting validation subset of data...", submission_id)
-    submission_validation_data = submission.loc[validation_data.index]
-
-    # Calculate correlation
-    print("Calculating validation_correlation...", submission_id)
-    validation_correlation = calc_correlation(
-        validation_data[f"target_{tournament}"],
-        submission_validation_data.probability)
-
-    # Insert values into Postgres
-    print("Updating validation_correlation...", submission_id)
-    query = "UPDATE submissions SET validation_correlation={} WHERE id = '{}'".format(
-        validation_correlation, submission_id)
-    print(query)
-    cursor.execute(query)
-    print("Updated {} with validation_correlation={}'".format(
-        submission_id, validation_correlation))
-    postgres_db.commit()
-    cursor.close()
-    postgres_db.close()
+    probabilities = submission_data.get_aligned(
+        ("validation_data", dataset_version), validation_data.align)
+
+    # Calculate every metric from one ranking of the submission
+    print("Calculating metrics...", submission_id)
+    target = f"target_{tournament}"
+    targets = validation_data.target_names if SCORE_ALL_TARGETS else (
+        target, )
+    scores = score_metrics(validation_data, probabilities, targets)
+    values = {
+        metric: scores[metric][targets.index(target)]
+        for metric in scores
+    }
+
+    # Buffer the values, they are written to Postgres in bulk
+    print("Updating metrics...", submission_id)
+    write_buffer = get_write_buffer()
+    write_buffer.update_submission(submission_id, **values)
+    if SCORE_ALL_TARGETS:
+        write_buffer.write_target_metrics(submission_id, targets, scores)
+    print("Buffered {} with {}".format(submission_id, values))
@@ -2,16 +2,117 @@
 """Concordance Checking."""
 import logging
 import os
-import functools
 
 # Third Party
 from sklearn.cluster import MiniBatchKMeans
-from scipy.stats import ks_2samp
 import numpy as np
 import pandas as pd
 
 # First Party
 from submission_criteria import common
+from submission_criteria import cluster_artifacts
+from submission_criteria import ks_statistic
+from submission_criteria import quantized
+from submission_criteria import round_dataset
+from submission_criteria.dataset_archive import open_dataset
+from submission_criteria.id_index import IdIndex
+
+
+N_CLUSTERS = 5
+BATCH_SIZE = 32
+BATCH_VALUES = 1 << 19
+# Rows per chunk when clustering in streaming mode, 0 loads the datasets whole
+CLUSTER_CHUNK_SIZE = int(os.environ.get("CLUSTER_CHUNK_SIZE", "0"))
+# Hold features as uint8 codes instead of float64 frames while clustering
+QUANTIZE_FEATURES = os.environ.get("QUANTIZE_FEATURES", "") == "1"
+QUANTIZE_CHUNK_SIZE = 100000
+
+
+def make_cluster_layout(c, n_clusters=N_CLUSTERS):
+    """Group the positions of a clustered split by cluster
+
+    Parameters:
+    -----------
+    c : ndarray
+        Cluster label of every sorted id of the split
+
+    n_clusters : int, optional, default: N_CLUSTERS
+        Number of clusters
+
+    Returns:
+    --------
+    layout : dictionary
+        "order" is the int32 permutation of the split grouping it by cluster,
+        "labels" the uint8 cluster label of every permuted position and
+        "offsets" the int32 start of every cluster in the permuted split
+    """
+    order = np.argsort(c, kind="mergesort").astype(np.int32)
+    labels = np.asarray(c)[order].astype(np.uint8)
+    return {
+        "order": order,
+        "labels": labels,
+        "offsets": ks_statistic.cluster_offsets(labels, n_clusters),
+    }
+
+
+def batch_ks_scores(P1, P2, P3, layouts, max_values=BATCH_VALUES):
+    """Mean KS score of many submissions scored against one cluster layout
+
+    Parameters:
+    -----------
+    P1, P2, P3 : ndarray
+        Validation, test and live probabilities sorted by id, one row per submission
+
+    layouts : tuple
+        Cluster layouts of the validation, test and live splits
+
+    max_values : int, optional, default: BATCH_VALUES
+        Number of values scored in one vectorized pass. The KS step is bound
+        by memory bandwidth, so passes are kept small enough to stay in cache
+
+    Returns:
+    --------
+    scores : ndarray
+        Mean KS score of every submission
+    """
+    samples = []
+    for P, layout in zip((P1, P2, P3), layouts):
+        if P.shape[-1] != len(layout["order"]):
+            raise IndexError("Submission has {} rows but the split has {}".format(
+                P.shape[-1], len(layout["order"])))
+        samples.append(P[:, layout["order"]])
+    offsets = [layout["offsets"] for layout in layouts]
+    validation_clusters = np.diff(layouts[0]["offsets"]) > 0
+
+    n_rows = samples[0].shape[0]
+    step = max(1, max_values // sum(sample.shape[1] for sample in samples))
+    scores = np.empty(n_rows)
+    for start in range(0, n_rows, step):
+        statistics = ks_statistic.layout_ks_statistics(
+            [sample[start:start + step] for sample in samples], offsets)
+        scores[start:start + step] = np.mean(
+            statistics.max(axis=0)[:, validation_clusters], axis=1)
+    return scores
+
+
+def ks_score(P1, P2, P3, layouts):
+    """Mean over the validation clusters of the largest pairwise KS statistic
+
+    Parameters:
+    -----------
+    P1, P2, P3 : ndarray
+        Sorted validation, test and live submission probabilities based on the id
+
+    layouts : tuple
+        Cluster layouts of the validation, test and live splits
+
+    Returns:
+    --------
+    score : float
+        Mean KS score of the clustered submission data
+    """
+    return batch_ks_scores(P1.reshape(1, -1), P2.reshape(1, -1),
+                           P3.reshape(1, -1), layouts)[0]
 
 
 def has_concordance(P1, P2, P3, c1, c2, c3, threshold=0.12):
@@ -28,14 +129,15 @@ def has_concordance(P1, P2, P3, c1, c2, c3, threshold=0.12):
     P3 : ndarray
         Sorted live submission probabilities based on the id
 
-    c1 : ndarray
-        Clustered validation from the tournament data
+    c1 : ndarray or dictionary
+        Clustered validation from the tournament data, or its precomputed
+        layout, see make_cluster_layout
 
-    c2 : ndarray
-        Clustered test from the tournament data
+    c2 : ndarray or dictionary
+        Clustered test from the tournament data, or its precomputed layout
 
-    c3 : ndarray
-        Clustered live from the tournament data
+    c3 : ndarray or dictionary
+        Clustered live from the tournament data, or its precomputed layout
 
     threshold : float, optional, default: 0.12
         The threshold in which our mean ks_score has to be under to have "concordance"
@@ -45,59 +147,76 @@ def has_concordance(P1, P2, P3, c1, c2, c3, threshold=0.12):
     concordance : bool
         Boolean value of the clustered submission data having concordance
     """
-    ks = []
-    for i in set(c1):
-
-        ks_score = max(
-            ks_2samp(P1.reshape(-1)[c1 == i],
-                     P2.reshape(-1)[c2 == i])[0],
-            ks_2samp(P1.reshape(-1)[c1 == i],
-                     P3.reshape(-1)[c3 == i])[0],
-            ks_2samp(P3.reshape(-1)[c3 == i],
-                     P2.reshape(-1)[c2 == i])[0])
+    layouts = tuple(c if isinstance(c, dict) else make_cluster_layout(c)
+                    for c in (c1, c2, c3))
+    score = ks_score(P1, P2, P3, layouts)
+    logging.getLogger().info("Noticed score {}".format(score))
+    return score < threshold
 
-        ks.append(ks_score)
-    logging.getLogger().info("Noticed score {}".format(np.mean(ks)))
-    return np.mean(ks) < threshold
 
-
-def make_clusters(X, X_1, X_2, X_3):
-    """Split submission data into 3 clusters using K-Means clustering
+def fit_clusters(X):
+    """Fit the K-Means clustering of the competition round
 
     Parameters:
     -----------
     X: ndarray
         tournament data for the competition round
 
-    X_1: ndarray
-        sorted validation data ids from tournament data
+    Returns:
+    --------
+    kmeans : MiniBatchKMeans
+        Fitted clustering
+    """
+    logging.getLogger().info("New competition, clustering dataset")
+    kmeans = MiniBatchKMeans(n_clusters=N_CLUSTERS, random_state=1337)
+
+    kmeans.fit(X)
+    logging.getLogger().info("Finished clustering")
+    return kmeans
 
-    X_2: ndarray
-        sorted test ids data from tournament data
 
-    X_3: ndarray
-        sorted live ids data from tournament data
+def fit_clusters_partial(chunks):
+    """Fit the K-Means clustering of the competition round one chunk at a time
+
+    Parameters:
+    -----------
+    chunks : iterable
+        Chunks of tournament data for the competition round
 
     Returns:
     --------
-    c1: nparray
-        Clustered validation data
-    c2: nparray
-        Clustered test data
-    c3: nparray
-        Cluster live data
+    kmeans : MiniBatchKMeans
+        Clustering fitted with one partial_fit call per chunk
     """
-    logging.getLogger().info("New competition, clustering dataset")
-    kmeans = MiniBatchKMeans(n_clusters=5, random_state=1337)
+    logging.getLogger().info("New competition, clustering dataset in chunks")
+    kmeans = MiniBatchKMeans(n_clusters=N_CLUSTERS, random_state=1337)
 
-    kmeans.fit(X)
-    c1, c2, c3 = kmeans.predict(X_1), kmeans.predict(X_2), kmeans.predict(X_3)
+    for X in chunks:
+        if len(X) >= N_CLUSTERS:
+            kmeans.partial_fit(X)
     logging.getLogger().info("Finished clustering")
-    return c1, c2, c3
+    return kmeans
 
 
-@functools.lru_cache(maxsize=2)
-def get_ids(filemanager, tournament_number, round_number):
+def read_feature_chunks(paths, features, chunk_size):
+    """Yield the float32 features of CSV files or ArchiveMembers chunk_size rows at a time"""
+    dtype = {c: np.float32 for c in features}
+    for path in paths:
+        with open_dataset(path) as f:
+            for chunk in pd.read_csv(f, usecols=features, dtype=dtype,
+                                     chunksize=chunk_size):
+                # See the dropna TODO in get_competition_variables_from_df
+                yield chunk[features].dropna().values
+
+
+def get_features(path):
+    """Return the feature columns of a CSV file or ArchiveMember"""
+    with open_dataset(path) as f:
+        return [c for c in pd.read_csv(f, nrows=0) if "feature" in c]
+
+
+def get_ids(filemanager, tournament_number, round_number,
+            dataset_version=None):
     """Gets the ids from submission data based on the round_number
 
     Parameters:
@@ -106,26 +225,23 @@ def get_ids(filemanager, tournament_number, round_number):
         S3 Bucket data access object for querying competition datasets
     round_number : int
         The numerical id of the competition
+    dataset_version : string, optional, default: None
+        Dataset version of the round, see round_dataset.get_dataset_version
 
     Returns:
     --------
-    val : list
-        List of all ids in the 'validation' dataset
+    val : ndarray
+        All ids in the 'validation' dataset, sorted
 
-    test : list
-        List of all ids in the 'test' dataset
+    test : ndarray
+        All ids in the 'test' dataset, sorted
 
-    live : list
-        List of all ids in the 'live' dataset
+    live : ndarray
+        All ids in the 'live' dataset, sorted
     """
-    extract_dir = filemanager.download_dataset(tournament_number, round_number)
-    tournament = pd.read_csv(
-        os.path.join(extract_dir, "numerai_tournament_data.csv"))
-    val = tournament[tournament["data_type"] == "validation"]
-    test = tournament[tournament["data_type"] == "test"]
-    live = tournament[tournament["data_type"] == "live"]
-
-    return list(val["id"]), list(test["id"]), list(live["id"])
+    return round_dataset.get_round_dataset(filemanager, tournament_number,
+                                           round_number,
+                                           dataset_version).get_ids()
 
 
 def get_sorted_split(data, val_ids, test_ids, live_ids):
@@ -157,56 +273,153 @@ def get_sorted_split(data, val_ids, test_ids, live_ids):
     live : ndarray
         Live data features sorted by id
     """
-    validation = data[data["id"].isin(val_ids)]
-    test = data[data["id"].isin(test_ids)]
-    live = data[data["id"].isin(live_ids)]
+    return IdIndex(val_ids, test_ids, live_ids).get_sorted_split(data)
 
-    validation = validation.sort_values("id")
-    test = test.sort_values("id")
-    live = live.sort_values("id")
 
-    if any(["feature" in c for c in list(validation)]):
-        f = [c for c in list(validation) if "feature" in c]
-    else:
-        f = ["probability"]
-    validation = validation[f]
-    test = test[f]
-    live = live[f]
+def get_id_index(filemanager, tournament_number, round_number,
+                 dataset_version=None):
+    """Gets the id index of the competition round
 
-    return validation.as_matrix(), test.as_matrix(), live.as_matrix()
+    Parameters:
+    -----------
+    filemanager : FileManager
+        S3 Bucket data access object for querying competition datasets
+    round_number : int
+        The numerical id of the competition
+    dataset_version : string, optional, default: None
+        Dataset version of the round, see round_dataset.get_dataset_version
+
+    Returns:
+    --------
+    id_index : IdIndex
+        Index of the validation, test and live ids sorted by id
+    """
+    return round_dataset.get_round_dataset(filemanager, tournament_number,
+                                           round_number,
+                                           dataset_version).id_index
 
 
-@functools.lru_cache(maxsize=2)
-def get_competition_variables(tournament_number, round_number, filemanager):
+def get_competition_variables(tournament_number, round_number, filemanager,
+                              dataset_version=None):
     """Return the K-Means Clustered tournament data for the competition round
 
     Parameters:
     -----------
-    round_id : string
-        UUID of the competition round of the tournament
+    tournament_number : int
+        Tournament of the competition round
 
-    db_manager : DatabaseManager
-        DB data access object that has read and write functions to NoSQL DB
+    round_number : int
+        Numerical ID of the competition round of the tournament
 
     filemanager : FileManager
         S3 Bucket data access object for querying competition datasets
 
+    dataset_version : string, optional, default: None
+        Dataset version of the round, see round_dataset.get_dataset_version
+
     Returns:
     --------
     variables : dictionary
         Holds clustered tournament data and the round_number
     """
-    extract_dir = filemanager.download_dataset(tournament_number, round_number)
+    return get_round_clusters(
+        round_dataset.get_round_dataset(filemanager, tournament_number,
+                                        round_number, dataset_version))
 
-    training = pd.read_csv(
-        os.path.join(extract_dir, "numerai_training_data.csv"))
-    tournament = pd.read_csv(
-        os.path.join(extract_dir, "numerai_tournament_data.csv"))
 
-    val_ids, test_ids, live_ids = get_ids(filemanager, tournament_number,
-                                          round_number)
-    return get_competition_variables_from_df(
-        round_number, training, tournament, val_ids, test_ids, live_ids)
+def get_round_clusters(dataset):
+    """Return the K-Means Clustered tournament data of a RoundDataset
+
+    The clustering is loaded or computed once per dataset and shared by every
+    thread scoring the round.
+
+    Parameters:
+    -----------
+    dataset : RoundDataset
+        Shared data of the competition round
+
+    Returns:
+    --------
+    variables : dictionary
+        Holds clustered tournament data, its cluster layouts and the round_number
+    """
+    return dataset.get(
+        "competition_variables", lambda: load_competition_variables(
+            dataset.tournament, dataset.round_number, dataset.filemanager,
+            dataset.id_index))
+
+
+def load_competition_variables(tournament_number, round_number, filemanager,
+                               id_index):
+    """Load the clustering of the competition round, or compute and save it
+
+    Parameters:
+    -----------
+    tournament_number : int
+        Tournament of the competition round
+
+    round_number : int
+        Numerical ID of the competition round of the tournament
+
+    filemanager : FileManager
+        S3 Bucket data access object for querying competition datasets
+
+    id_index : IdIndex
+        Index of the validation, test and live ids of the round
+
+    Returns:
+    --------
+    variables : dictionary
+        Holds clustered tournament data, its cluster layouts and the round_number
+    """
+    training_path = filemanager.dataset_member(tournament_number, round_number,
+                                               "numerai_training_data.csv")
+    tournament_path = filemanager.dataset_member(
+        tournament_number, round_number, "numerai_tournament_data.csv")
+
+    # Reuse the clustering of a previous process on the same dataset
+    checksum = filemanager.dataset_checksum(tournament_number, round_number)
+    if QUANTIZE_FEATURES:
+        checksum = "{}-quantized".format(checksum)
+    if CLUSTER_CHUNK_SIZE:
+        checksum = "{}-chunks{}".format(checksum, CLUSTER_CHUNK_SIZE)
+    artifact_path = cluster_artifacts.get_path(
+        filemanager.local_dir, tournament_number, round_number, checksum)
+    artifact = cluster_artifacts.load(artifact_path)
+    if artifact is not None:
+        filemanager.disk_cache.touch(artifact_path)
+        return make_competition_variables(
+            round_number, artifact["cluster_1"], artifact["cluster_2"],
+            artifact["cluster_3"], artifact["centroids"])
+
+    if QUANTIZE_FEATURES:
+        f = get_features(tournament_path)
+        read_chunk_size = CLUSTER_CHUNK_SIZE or QUANTIZE_CHUNK_SIZE
+        training, _ = quantized.read_csv(training_path, f, read_chunk_size)
+        tournament, tournament_ids = quantized.read_csv(
+            tournament_path, f, read_chunk_size, columns=["id"])
+        variables = get_competition_variables_from_quantized(
+            round_number, training, tournament, tournament_ids["id"].values,
+            id_index, CLUSTER_CHUNK_SIZE)
+    elif CLUSTER_CHUNK_SIZE:
+        variables = get_competition_variables_from_csv(
+            round_number, training_path, tournament_path, id_index,
+            CLUSTER_CHUNK_SIZE)
+    else:
+        tournament_store = filemanager.dataset_store(
+            tournament_number, round_number, "numerai_tournament_data.csv")
+        f = [c for c in tournament_store.columns if "feature" in c]
+        training = filemanager.dataset_store(
+            tournament_number, round_number,
+            "numerai_training_data.csv").read(f)
+        tournament = tournament_store.read(["id"] + f)
+
+        val_ids, test_ids, live_ids = id_index.split(id_index.index.values)
+        variables = get_competition_variables_from_df(
+            round_number, training, tournament, val_ids, test_ids, live_ids)
+    cluster_artifacts.save(artifact_path, variables)
+    filemanager.disk_cache.add(artifact_path)
+    return variables
 
 
 def get_competition_variables_from_df(
@@ -220,25 +433,160 @@ def get_competition_variables_from_df(
     X = np.append(X, tournament[f].as_matrix(), axis=0)
 
     X_1, X_2, X_3 = get_sorted_split(tournament, val_ids, test_ids, live_ids)
-    c1, c2, c3 = make_clusters(X, X_1, X_2, X_3)
+    kmeans = fit_clusters(X)
+    c1, c2, c3 = kmeans.predict(X_1), kmeans.predict(X_2), kmeans.predict(X_3)
+
+    return make_competition_variables(round_number, c1, c2, c3,
+                                      kmeans.cluster_centers_)
+
+
+def get_competition_variables_from_csv(round_number, training_path,
+                                       tournament_path, id_index, chunk_size):
+    """Cluster the competition round with memory bounded by chunk_size
+
+    Training and tournament data are streamed from CSV in chunks of chunk_size
+    rows to fit the clustering, and the tournament data is streamed once more
+    to assign the cluster of every id, so neither file is ever fully loaded.
+
+    Parameters:
+    -----------
+    round_number : int
+        Numerical ID of the competition round of the tournament
+
+    training_path, tournament_path : string or ArchiveMember
+        CSV files, or members of the dataset zip, holding the training and
+        tournament data
+
+    id_index : IdIndex
+        Index of the validation, test and live ids of the round
+
+    chunk_size : int
+        Number of rows held in memory at once
+
+    Returns:
+    --------
+    variables : dictionary
+        Holds clustered tournament data, its cluster layouts and the round_number
+    """
+    f = get_features(tournament_path)
+    kmeans = fit_clusters_partial(
+        read_feature_chunks([training_path, tournament_path], f, chunk_size))
+
+    labels = np.zeros(len(id_index), dtype=np.uint8)
+    dtype = {c: np.float32 for c in f}
+    with open_dataset(tournament_path) as tournament:
+        for chunk in pd.read_csv(tournament, usecols=["id"] + f, dtype=dtype,
+                                 chunksize=chunk_size):
+            codes = id_index.get_codes(chunk["id"].values)
+            known = codes >= 0
+            labels[codes[known]] = kmeans.predict(chunk[f].values[known])
+    c1, c2, c3 = id_index.split(labels)
+
+    return make_competition_variables(round_number, c1, c2, c3,
+                                      kmeans.cluster_centers_)
+
+
+def get_competition_variables_from_quantized(round_number,
+                                             training,
+                                             tournament,
+                                             tournament_ids,
+                                             id_index,
+                                             chunk_size=0):
+    """Cluster the competition round from uint8 quantized features
+
+    The features stay quantized, only float32 copies of one chunk at a time are
+    decoded when chunk_size is set, otherwise a single float32 copy is decoded
+    to fit the clustering.
+
+    Parameters:
+    -----------
+    round_number : int
+        Numerical ID of the competition round of the tournament
+
+    training, tournament : QuantizedMatrix
+        Quantized training and tournament features
+
+    tournament_ids : ndarray
+        Id of every row of the tournament features
+
+    id_index : IdIndex
+        Index of the validation, test and live ids of the round
+
+    chunk_size : int, optional, default: 0
+        Number of rows decoded at once, 0 decodes everything at once
+
+    Returns:
+    --------
+    variables : dictionary
+        Holds clustered tournament data, its cluster layouts and the round_number
+    """
+    # See the dropna TODO in get_competition_variables_from_df
+    X = quantized.QuantizedMatrix.concatenate([training.dropna(), tournament])
+    if chunk_size:
+        kmeans = fit_clusters_partial(X.chunks(chunk_size))
+    else:
+        kmeans = fit_clusters(X.to_float())
+    del X
+
+    labels = np.zeros(len(id_index), dtype=np.uint8)
+    codes = id_index.get_codes(tournament_ids)
+    step = max(1, chunk_size or len(tournament))
+    for start in range(0, len(tournament), step):
+        chunk_codes = codes[start:start + step]
+        known = chunk_codes >= 0
+        labels[chunk_codes[known]] = kmeans.predict(
+            tournament.to_float(start, start + step)[known])
+    c1, c2, c3 = id_index.split(labels)
+
+    return make_competition_variables(round_number, c1, c2, c3,
+                                      kmeans.cluster_centers_)
+
+
+def make_competition_variables(round_number, c1, c2, c3, centroids):
+    """Bundle the clustered tournament data of the competition round
+
+    Parameters:
+    -----------
+    round_number : int
+        Numerical ID of the competition round of the tournament
 
+    c1, c2, c3 : ndarray
+        Clustered validation, test and live data
+
+    centroids : ndarray
+        Cluster centers of the fitted clustering
+
+    Returns:
+    --------
+    variables : dictionary
+        Holds clustered tournament data, its cluster layouts and the round_number
+    """
     variables = {
         "round_number": round_number,
+        "centroids": centroids,
         "cluster_1": c1,
         "cluster_2": c2,
         "cluster_3": c3,
+        "layout_1": make_cluster_layout(c1),
+        "layout_2": make_cluster_layout(c2),
+        "layout_3": make_cluster_layout(c3),
     }
     return variables
 
 
-def get_submission_pieces(submission_id, tournament, round_number, db_manager,
-                          filemanager):
-    """Get validation, test, and live ids sorted from submission_id
+def get_submission_pieces(submission,
+                          tournament,
+                          round_number,
+                          db_manager,
+                          filemanager,
+                          id_index=None):
+    """Get validation, test, and live ids sorted from a submission
 
     Parameters:
     -----------
-    submission_id : string
-        ID of the submission
+    submission : dictionary
+        Work item holding the ID of the submission, see
+        common.get_submission_context
 
     round_number : int
         Numerical ID of the competition round of the tournament
@@ -249,6 +597,9 @@ def get_submission_pieces(submission_id, tournament, round_number, db_manager,
     filemanager : FileManager
         S3 Bucket data access object for querying competition datasets
 
+    id_index : IdIndex, optional, default: None
+        Index of the ids of the round, loaded through get_id_index when not given
+
     Returns:
     --------
     validation : ndarray
@@ -260,12 +611,13 @@ def get_submission_pieces(submission_id, tournament, round_number, db_manager,
     live : ndarray
         Sorted live ids from submission data
     """
-    s3_file, _ = common.get_filename(db_manager.postgres_db, submission_id)
-    data = filemanager.read_csv(s3_file)
-    val_ids, test_ids, live_ids = get_ids(filemanager, tournament,
-                                          round_number)
-    validation, tests, live = get_sorted_split(data, val_ids, test_ids,
-                                               live_ids)
+    context = common.get_submission_context(submission, db_manager.pool)
+    data = filemanager.read_submission(context["s3_file"]).frame
+    if id_index is None:
+        id_index = get_id_index(
+            filemanager, tournament, round_number,
+            round_dataset.get_dataset_version(context["dataset_path"]))
+    validation, tests, live = id_index.get_sorted_split(data)
     return validation, tests, live
 
 
@@ -283,24 +635,179 @@ def submission_concordance(submission, db_manager, filemanager):
     filemanager : FileManager
             S3 Bucket data access object for querying competition datasets
     """
-    tournament, round_number, _dataset_path = common.get_round(
-        db_manager.postgres_db, submission["submission_id"])
-    clusters = get_competition_variables(tournament, round_number, filemanager)
-    P1, P2, P3 = get_submission_pieces(submission["submission_id"], tournament,
-                                       round_number, db_manager, filemanager)
-    c1, c2, c3 = clusters["cluster_1"], clusters["cluster_2"], clusters[
-        "cluster_3"]
+    context = common.get_submission_context(submission, db_manager.pool)
+    tournament, round_number = context["tournament"], context["round_number"]
+    dataset_version = round_dataset.get_dataset_version(context["dataset_path"])
+
+    def score():
+        dataset = round_dataset.get_round_dataset(filemanager, tournament,
+                                                  round_number, dataset_version)
+        clusters = get_round_clusters(dataset)
+        P1, P2, P3 = get_submission_pieces(submission, tournament,
+                                           round_number, db_manager,
+                                           filemanager, dataset.id_index)
+        layouts = clusters["layout_1"], clusters["layout_2"], clusters[
+            "layout_3"]
+        return has_concordance(P1, P2, P3, *layouts)
 
     try:
-        concordance = has_concordance(P1, P2, P3, c1, c2, c3)
+        concordance = score()
     except IndexError:
-        # If we had an indexing error, that is because the round restart, and we need to try getting the new competition variables.
-        get_competition_variables.cache_clear()
-        clusters = get_competition_variables(tournament, round_number,
-                                             filemanager)
-        c1, c2, c3 = clusters["cluster_1"], clusters["cluster_2"], clusters[
-            "cluster_3"]
-        concordance = has_concordance(P1, P2, P3, c1, c2, c3)
-
-    print('writing concordance', submission['submission_id'], concordance)
+        # If we had an indexing error, the round may have restarted since its
+        # dataset was last revalidated, in which case we retry once with the
+        # new dataset
+        if filemanager.revalidate_dataset(tournament, round_number,
+                                          force=True):
+            raise
+        round_dataset.invalidate(tournament, round_number)
+        concordance = score()
+
+    print('buffering concordance', submission['submission_id'], concordance)
     db_manager.write_concordance(submission['submission_id'], concordance)
+
+
+def batch_submission_concordance(submissions,
+                                 tournament,
+                                 round_number,
+                                 db_manager,
+                                 filemanager,
+                                 threshold=0.12,
+                                 batch_size=BATCH_SIZE):
+    """Determine concordance of many submissions of one round and write the results to DB
+
+    The submissions are read batch_size at a time, aligned into one id-ordered
+    matrix and scored together against the shared cluster layout, and all
+    results are buffered for DB at once. Submissions that could not be
+    aligned get no result, see score_concordances.
+
+    Parameters:
+    -----------
+    submissions : list
+        Submission data that holds the ids of the submissions, all of the same round
+
+    tournament : int
+        Tournament of the competition round
+
+    round_number : int
+        Numerical ID of the competition round of the tournament
+
+    db_manager : DatabaseManager
+        DB data access object that has read and write functions to NoSQL DB
+
+    filemanager : FileManager
+        S3 Bucket data access object for querying competition datasets
+
+    threshold : float, optional, default: 0.12
+        The threshold in which our mean ks_score has to be under to have "concordance"
+
+    batch_size : int, optional, default: BATCH_SIZE
+        Number of submissions aligned into one matrix
+
+    Returns:
+    --------
+    scores : ndarray
+        Mean KS score of every submission, NaN for submissions that could not be aligned
+
+    scored : ndarray
+        Whether every submission was aligned and scored, its score may still be
+        NaN, e.g. when a cluster is empty
+    """
+    submission_ids = [s["submission_id"] for s in submissions]
+    if not submission_ids:
+        return np.empty(0), np.zeros(0, dtype=bool)
+    dataset_path = common.get_submission_context(
+        submissions[0], db_manager.pool)["dataset_path"]
+    dataset = round_dataset.get_round_dataset(
+        filemanager, tournament, round_number,
+        round_dataset.get_dataset_version(dataset_path))
+    clusters = get_round_clusters(dataset)
+    layouts = clusters["layout_1"], clusters["layout_2"], clusters["layout_3"]
+    id_index = dataset.id_index
+
+    scores = np.full(len(submission_ids), np.nan)
+    scored = np.zeros(len(submission_ids), dtype=bool)
+    for start in range(0, len(submission_ids), batch_size):
+        rows, P = [], []
+        for row, submission in enumerate(submissions[start:start + batch_size],
+                                         start):
+            try:
+                s3_file = common.get_submission_context(
+                    submission, db_manager.pool)["s3_file"]
+                P.append(
+                    id_index.get_sorted_column(
+                        filemanager.read_submission(s3_file).frame))
+            except Exception:
+                logging.exception("Exception aligning submission {}".format(
+                    submission["submission_id"]))
+                continue
+            rows.append(row)
+        if rows:
+            P1, P2, P3 = id_index.split(np.vstack(P))
+            scores[rows] = batch_ks_scores(P1, P2, P3, layouts)
+            scored[rows] = True
+
+    rows = np.flatnonzero(scored)
+    logging.getLogger().info("Scored concordance of {} of {} submissions".format(
+        len(rows), len(submission_ids)))
+    db_manager.write_concordances([submission_ids[row] for row in rows],
+                                  [bool(scores[row] < threshold) for row in rows])
+    return scores, scored
+
+
+def score_concordances(submissions, db_manager, filemanager):
+    """Determine the concordance of queued submissions and write the results to DB
+
+    Submissions of the same round and dataset version are scored together by
+    batch_submission_concordance. A submission alone in its round, or one the
+    batch could not align, is scored by submission_concordance, which retries
+    after a round restart and raises otherwise.
+
+    Parameters:
+    -----------
+    submissions : list
+        Work items holding the ids of the submissions, of any rounds
+
+    db_manager : DatabaseManager
+        DB data access object that has read and write functions to NoSQL DB
+
+    filemanager : FileManager
+        S3 Bucket data access object for querying competition datasets
+
+    Returns:
+    --------
+    failed : list
+        Submissions whose concordance could not be determined
+    """
+    rounds, failed = {}, []
+    for submission in submissions:
+        try:
+            context = common.get_submission_context(submission, db_manager.pool)
+        except Exception:
+            logging.exception("Exception getting submission {}".format(
+                submission["submission_id"]))
+            failed.append(submission)
+            continue
+        rounds.setdefault(
+            (context["tournament"], context["round_number"],
+             round_dataset.get_dataset_version(context["dataset_path"])),
+            []).append(submission)
+
+    for (tournament, round_number, _), batch in rounds.items():
+        single = batch
+        if len(batch) > 1:
+            try:
+                _, scored = batch_submission_concordance(
+                    batch, tournament, round_number, db_manager, filemanager)
+                single = [s for s, done in zip(batch, scored) if not done]
+            except Exception:
+                logging.exception(
+                    "Exception scoring concordance of round {}-{}".format(
+                        tournament, round_number))
+        for submission in single:
+            try:
+                submission_concordance(submission, db_manager, filemanager)
+            except Exception:
+                logging.exception("Exception scoring concordance of {}".format(
+                    submission["submission_id"]))
+                failed.append(submission)
+    return failed
@@ -0,0 +1,61 @@
+"""Dataset CSVs read straight from the zip of a round, without extracting it."""
+
+# System
+import os
+import zipfile
+import contextlib
+
+
+class ArchiveMember():
+    """One CSV of a dataset zip, e.g. numerai_tournament_data.csv
+
+    The member is decompressed while it is read, so it never takes disk space
+    besides the zip itself.
+    """
+
+    def __init__(self, zip_path, filename):
+        """
+        Parameters:
+        -----------
+        zip_path : string
+            Downloaded dataset zip
+
+        filename : string
+            File name of the member, found in any directory of the zip
+
+        Raises:
+        -------
+        KeyError
+            If the zip holds no such file
+        """
+        self.zip_path = zip_path
+        self.filename = filename
+        with zipfile.ZipFile(zip_path) as zip_ref:
+            infos = [
+                i for i in zip_ref.infolist()
+                if os.path.basename(i.filename) == filename
+            ]
+        if not infos:
+            raise KeyError("{} is not in {}".format(filename, zip_path))
+        self.info = infos[0]
+
+    def __repr__(self):
+        return "{}:{}".format(self.zip_path, self.info.filename)
+
+    @contextlib.contextmanager
+    def open(self):
+        """Open the member as a binary file object, closed with the zip on exit"""
+        with zipfile.ZipFile(self.zip_path) as zip_ref:
+            with zip_ref.open(self.info) as f:
+                yield f
+
+    def stamp(self):
+        """Size and CRC32 of the member, which change with its content"""
+        return {"size": self.info.file_size, "crc": self.info.CRC}
+
+
+def open_dataset(source):
+    """Open a dataset CSV path or ArchiveMember as a binary file object in a with statement"""
+    if isinstance(source, ArchiveMember):
+        return source.open()
+    return open(source, "rb")
@@ -0,0 +1,212 @@
+"""Byte budgeted LRU cache of the files written under the local directory."""
+
+# System
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+
+# Bytes of downloads and derived artifacts kept on disk
+MAX_BYTES = int(os.environ.get("DISK_CACHE_GB", "20")) * 2**30
+MANIFEST = "cache_manifest.json"
+# Seconds the manifest may lag behind the accesses, pins and metadata updates
+SAVE_INTERVAL = 60
+
+
+def _get_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(directory, f))
+        for directory, _, files in os.walk(path) for f in files)
+
+
+class DiskCache():
+    """Manifest of the cached files and directories under a root directory
+
+    Every file or directory written is added with its size, and the least
+    recently used entries are deleted as soon as the total exceeds max_bytes.
+    Entries under a pinned prefix, e.g. the datasets of the rounds being
+    scored, are never deleted. Nothing on disk is scanned besides the entry
+    being added, the manifest knows the size and last access of every entry.
+    The manifest is saved whenever entries are added or deleted, accesses,
+    pins and metadata updates are saved with them or every SAVE_INTERVAL
+    seconds, see flush.
+    """
+
+    def __init__(self, root, max_bytes=MAX_BYTES):
+        """
+        Parameters:
+        -----------
+        root : string
+            Directory holding the cached entries and the manifest
+
+        max_bytes : int, optional, default: MAX_BYTES
+            Bytes kept on disk
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pins = {}
+        self._entries = self._load()
+        self._dirty = False
+        self._saved = time.time()
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.root, MANIFEST)) as f:
+                entries = json.load(f)["entries"]
+        except (OSError, ValueError, KeyError):
+            return {}
+        # Pins only live as long as the process holding them
+        for entry in entries.values():
+            entry["pins"] = 0
+        return entries
+
+    def _save(self):
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        path = os.path.join(self.root, MANIFEST)
+        for key, entry in self._entries.items():
+            entry["pins"] = sum(n for p, n in self._pins.items()
+                                if self._is_under(key, p))
+        with open(path + ".tmp", "w") as f:
+            json.dump({"entries": self._entries}, f)
+        os.replace(path + ".tmp", path)
+        self._dirty = False
+        self._saved = time.time()
+
+    def _save_later(self):
+        self._dirty = True
+        if time.time() - self._saved >= SAVE_INTERVAL:
+            self._save()
+
+    def flush(self):
+        """Save the manifest if it lags behind"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _key(self, path):
+        return os.path.relpath(os.path.abspath(path),
+                               os.path.abspath(self.root))
+
+    @staticmethod
+    def _is_under(key, prefix):
+        return key == prefix or key.startswith(prefix.rstrip(os.sep) + os.sep)
+
+    def _is_pinned(self, key):
+        return any(self._is_under(key, p) for p in self._pins)
+
+    def add(self, path, **metadata):
+        """Add or update a file or directory, then evict down to the budget
+
+        Paths outside of the root directory are not cached. Keyword arguments
+        are stored in the manifest entry, e.g. the ETag of a download.
+        """
+        key = self._key(path)
+        if key.startswith(os.pardir):
+            return
+        size = _get_size(path)
+        with self._lock:
+            entry = self._entries.setdefault(key, {"pins": 0})
+            entry.update(metadata)
+            entry["size"] = size
+            entry["last_access"] = time.time()
+            self._evict(keep=key)
+            self._save()
+
+    def get(self, path):
+        """Return a copy of the manifest entry of a path, None if it is not cached"""
+        with self._lock:
+            entry = self._entries.get(self._key(path))
+            return None if entry is None else dict(entry)
+
+    def update(self, path, **metadata):
+        """Store metadata in the manifest entry of a cached path"""
+        with self._lock:
+            entry = self._entries.get(self._key(path))
+            if entry is not None:
+                entry.update(metadata)
+                self._save_later()
+
+    def touch(self, path):
+        """Mark an entry as used now"""
+        with self._lock:
+            entry = self._entries.get(self._key(path))
+            if entry is not None:
+                entry["last_access"] = time.time()
+                self._save_later()
+
+    def remove(self, path):
+        """Delete an entry from disk and from the manifest"""
+        with self._lock:
+            self._remove(self._key(path))
+            self._save()
+
+    def remove_prefix(self, prefix):
+        """Delete every entry under prefix, pinned or not, e.g. a stale round"""
+        prefix = self._key(prefix)
+        with self._lock:
+            for key in [k for k in self._entries if self._is_under(k, prefix)]:
+                self._remove(key)
+            self._save()
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        path = os.path.join(self.root, key)
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def pin(self, prefix):
+        """Protect every entry under prefix, e.g. a round directory, from eviction"""
+        key = self._key(prefix)
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+            self._save_later()
+
+    def unpin(self, prefix):
+        """Undo one pin of prefix"""
+        key = self._key(prefix)
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+            self._save_later()
+
+    def evict(self):
+        """Delete least recently used entries until the total fits the budget"""
+        with self._lock:
+            self._evict()
+            self._save()
+
+    def _evict(self, keep=None):
+        total = sum(e["size"] for e in self._entries.values())
+        for key in sorted(self._entries,
+                          key=lambda k: self._entries[k]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep or self._is_pinned(key):
+                continue
+            total -= self._entries[key]["size"]
+            logging.getLogger().info("Evicting {} from the disk cache".format(
+                key))
+            self._remove(key)
+
+    def usage(self):
+        """Return the bytes and number of entries cached, and the pinned prefixes"""
+        with self._lock:
+            return {
+                "bytes": sum(e["size"] for e in self._entries.values()),
+                "entries": len(self._entries),
+                "pinned": sorted(self._pins),
+            }
@@ -2,20 +2,29 @@
 
 # System
 import os
+import time
 import zipfile
 import logging
-import datetime
-import glob
+import hashlib
 
 # Third Party
 import boto3
 import botocore
 import pandas as pd
 
+# First Party
+from submission_criteria import dataset_archive
+from submission_criteria import disk_cache
+from submission_criteria import round_store
+from submission_criteria import s3_download
+from submission_criteria import submission_cache
+
 S3_BUCKET = os.environ.get("S3_UPLOAD_BUCKET", "numerai-production-uploads")
 S3_DATASET_BUCKET = "numerai-datasets"
 S3_ACCESS_KEY = os.environ.get("S3_ACCESS_KEY")
 S3_SECRET_KEY = os.environ.get("S3_SECRET_KEY")
+# Seconds a downloaded object is trusted before its ETag is checked again
+REVALIDATE_INTERVAL = int(os.environ.get("S3_REVALIDATE_SECONDS", "300"))
 
 
 class FileManager():
@@ -27,13 +36,9 @@ class FileManager():
             aws_secret_access_key=S3_SECRET_KEY)
         self.bucket = S3_BUCKET
         self.log = log
-
-    def __hash__(self):
-        """
-        We want to implement the hash function so we can use this with a lru_cache
-        but we don't actually care about hashing it.
-        """
-        return 90210
+        self.submissions = submission_cache.SubmissionCache(
+            self.s3, os.path.join(local_dir, "submissions"))
+        self.disk_cache = disk_cache.DiskCache(local_dir)
 
     def download(self, files):
         """
@@ -55,13 +60,18 @@ class FileManager():
             if not os.path.exists(nested_dir_name):
                 os.makedirs(nested_dir_name)
 
-            if not os.path.isfile(full_filename):
+            if not self.is_fresh(self.bucket, s3_file, full_filename):
                 print("Downloading {} from S3 bucket {}".format(
                     full_filename, self.bucket))
                 try:
-                    self.s3.meta.client.download_file(self.bucket, s3_file,
-                                                      full_filename)
-                except botocore.exceptions.EndpointConnectionError:
+                    etag = s3_download.download_file(self.s3.meta.client,
+                                                     self.bucket, s3_file,
+                                                     full_filename)
+                    self.disk_cache.add(full_filename,
+                                        etag=etag,
+                                        validated=time.time())
+                except (botocore.exceptions.EndpointConnectionError,
+                        s3_download.DownloadError):
 
                     if self.log:
                         logging.getLogger().info(
@@ -73,18 +83,73 @@ class FileManager():
 
         return local_files
 
+    def is_fresh(self, bucket, s3_file, local_path, force=False):
+        """
+        Whether a downloaded object still matches S3. Its ETag is compared with a
+        HEAD request at most every REVALIDATE_INTERVAL seconds, or right away with
+        force, and a stale file is deleted. When S3 cannot be reached the local file
+        is trusted, and checked again on the next call.
+        """
+        if not os.path.isfile(local_path):
+            return False
+        entry = self.disk_cache.get(local_path) or {}
+        if not force and (time.time() - entry.get("validated", 0) <
+                          REVALIDATE_INTERVAL):
+            return True
+        try:
+            etag = self.s3.meta.client.head_object(Bucket=bucket,
+                                                   Key=s3_file)["ETag"]
+        except (botocore.exceptions.ClientError,
+                botocore.exceptions.EndpointConnectionError) as e:
+            logging.getLogger().warning(
+                "Could not revalidate {} with S3, using the local copy: {}".
+                format(s3_file, e))
+            return True
+        if entry.get("etag", etag) != etag:
+            logging.getLogger().info("{} changed in S3".format(s3_file))
+            self.disk_cache.remove(local_path)
+            return False
+        # Files downloaded before ETags were recorded are trusted once
+        self.disk_cache.add(local_path, etag=etag, validated=time.time())
+        return True
+
+    def revalidate_dataset(self, tournament, round_number, force=False):
+        """
+        Whether the downloaded dataset of a round, if any, still matches S3, see
+        is_fresh. When the dataset was replaced, e.g. the round restarted, the zip
+        and everything derived from it on disk are deleted.
+        """
+        s3_path = "t{}/{}/numerai_datasets.zip".format(tournament,
+                                                       round_number)
+        local_path = os.path.join(self.local_dir, s3_path)
+        if (not os.path.isfile(local_path) or
+                self.is_fresh(S3_DATASET_BUCKET, s3_path, local_path,
+                              force=force)):
+            return True
+        self.disk_cache.remove_prefix(os.path.dirname(local_path))
+        return False
+
     def read_csv(self, s3_file):
         res = self.s3.Bucket(self.bucket).Object(s3_file).get()
         return pd.read_csv(res.get('Body'))
 
+    def read_submission(self, s3_file, prefetch=False):
+        """
+        Parsed ids and predictions of a submission, downloaded once and shared by
+        every stage through the submission cache. prefetch marks a read ahead of
+        the use of the submission, see SubmissionCache.get.
+        """
+        return self.submissions.get(self.bucket, s3_file, prefetch=prefetch)
+
     def download_dataset(self, tournament, round_number):
+        """
+        Download the dataset zip of a round once, returning its local path. The zip
+        is not extracted, its members are read straight from it, see dataset_member.
+        """
         bucket = S3_DATASET_BUCKET
         s3_path = "t{}/{}/numerai_datasets.zip".format(tournament,
                                                        round_number)
-        extract_dir = "t{}/{}/numerai_datasets/".format(
-            tournament, round_number)
         local_path = os.path.join(self.local_dir, s3_path)
-        local_extract = os.path.join(self.local_dir, extract_dir)
 
         if not os.path.exists(
                 os.path.join(self.local_dir, "t" + str(tournament))):
@@ -97,31 +162,66 @@ class FileManager():
                 os.path.join(self.local_dir, "t" + str(tournament),
                              str(round_number)))
 
-        if not os.path.isfile(local_path):
+        if not self.revalidate_dataset(tournament, round_number) or (
+                not os.path.isfile(local_path)):
             print("Attempting to get file {} from bucket {} to {}".format(
                 s3_path, bucket, local_path))
-            self.s3.meta.client.download_file(bucket, s3_path, local_path)
+            etag = s3_download.download_file(self.s3.meta.client, bucket,
+                                             s3_path, local_path)
+            self.disk_cache.add(local_path, etag=etag, validated=time.time())
+        else:
+            self.disk_cache.touch(local_path)
 
-            with zipfile.ZipFile(local_path, "r") as zip_ref:
-                zip_ref.extractall(local_extract)
+        return local_path
 
-        return local_extract
+    def dataset_member(self, tournament, round_number, filename):
+        """
+        One dataset CSV of a round, e.g. numerai_training_data.csv, streamed from the
+        dataset zip whenever it is read.
+        """
+        return dataset_archive.ArchiveMember(
+            self.download_dataset(tournament, round_number), filename)
 
-    def clean_up(self):
+    def dataset_store(self, tournament, round_number, filename):
         """
-            Delete all files in local_dir that is older than 1 week
+        Columnar store of one dataset CSV, e.g. numerai_tournament_data.csv, converted
+        once per round straight from the zip so later reads only load the columns
+        they need.
         """
-        print(f"cleaning up {self.local_dir}")
-        now = datetime.datetime.now()
-        min_datetime = now - datetime.timedelta(weeks=1)
-        min_timestamp = min_datetime.timestamp()
-        files = glob.iglob(
-            os.path.join(self.local_dir, "**/*"), recursive=True)
-        for f in files:
-            last_modifed_timestamp = os.stat(f).st_mtime
-            if last_modifed_timestamp < min_timestamp:
-                print(f"deleting {f}")
-                try:
-                    os.remove(f)
-                except Exception as e:
-                    print(e)
+        store_path = os.path.join(
+            self.local_dir, "t{}/{}/numerai_datasets/".format(
+                tournament, round_number),
+            "{}.columns".format(os.path.splitext(filename)[0]))
+        store = round_store.get_store(
+            self.dataset_member(tournament, round_number, filename),
+            store_path=store_path)
+        self.disk_cache.add(store.path)
+        return store
+
+    def pin_round(self, tournament, round_number):
+        """
+        Keep the dataset and every artifact of a round on disk until unpin_round.
+        """
+        self.disk_cache.pin(
+            os.path.join(self.local_dir, "t{}/{}".format(tournament,
+                                                         round_number)))
+
+    def unpin_round(self, tournament, round_number):
+        self.disk_cache.unpin(
+            os.path.join(self.local_dir, "t{}/{}".format(tournament,
+                                                         round_number)))
+
+    def dataset_checksum(self, tournament, round_number):
+        """
+        Checksum of a downloaded dataset, cheaply derived from the name, size and
+        CRC32 of every member recorded in the zip's central directory.
+        """
+        s3_path = "t{}/{}/numerai_datasets.zip".format(tournament,
+                                                       round_number)
+        local_path = os.path.join(self.local_dir, s3_path)
+        digest = hashlib.sha1()
+        with zipfile.ZipFile(local_path, "r") as zip_ref:
+            for info in sorted(zip_ref.infolist(), key=lambda i: i.filename):
+                digest.update("{} {} {}\n".format(
+                    info.filename, info.file_size, info.CRC).encode())
+        return digest.hexdigest()[:16]
@@ -0,0 +1,82 @@
+"""Id to position index of a competition round."""
+
+# Third Party
+import numpy as np
+import pandas as pd
+
+
+class IdIndex():
+    """Interns the ids of a round to int32 codes
+
+    Codes are assigned in split order (validation, test, live) and sorted by id
+    within every split, so the rows of a split sorted by id are a contiguous
+    range of codes and splitting data is a single hash lookup of its ids.
+    """
+
+    def __init__(self, val_ids, test_ids, live_ids):
+        splits = [np.sort(np.asarray(ids)) for ids in (val_ids, test_ids, live_ids)]
+        self.offsets = np.zeros(len(splits) + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in splits], out=self.offsets[1:])
+        self.index = pd.Index(np.concatenate(splits))
+
+    def __len__(self):
+        return len(self.index)
+
+    def get_codes(self, ids):
+        """Return the int32 code of every id, -1 for ids not in the round"""
+        return self.index.get_indexer(ids).astype(np.int32)
+
+    def get_positions(self, ids):
+        """Return the position in ids of every code of the round
+
+        Raises:
+        -------
+        IndexError
+            If ids do not cover every id of the round
+        """
+        codes = self.get_codes(ids)
+        known = codes >= 0
+        positions = np.full(len(self.index), -1, dtype=np.int32)
+        positions[codes[known]] = np.flatnonzero(known)
+        missing = np.count_nonzero(positions < 0)
+        if missing:
+            raise IndexError("Data is missing {} of the {} ids of the round".format(
+                missing, len(self.index)))
+        return positions
+
+    def get_sorted_column(self, data, column="probability"):
+        """Return one column of data ordered by code, i.e. by split and by id"""
+        return data[column].values[self.get_positions(data["id"].values)]
+
+    def split(self, values):
+        """Split values ordered by code along their last axis into validation, test, and live"""
+        return tuple(values[..., start:end]
+                     for start, end in zip(self.offsets[:-1], self.offsets[1:]))
+
+    def get_sorted_split(self, data):
+        """Split data into validation, test, and live sorted by id
+
+        Parameters:
+        -----------
+        data : DataFrame
+            Tournament or submission data holding an id column
+
+        Returns:
+        --------
+        validation : ndarray
+            Validation data features sorted by id
+
+        test : ndarray
+            Test data features sorted by id
+
+        live : ndarray
+            Live data features sorted by id
+        """
+        positions = self.get_positions(data["id"].values)
+        if any(["feature" in c for c in list(data)]):
+            f = [c for c in list(data) if "feature" in c]
+        else:
+            f = ["probability"]
+        values = data[f].values[positions]
+        return tuple(values[start:end]
+                     for start, end in zip(self.offsets[:-1], self.offsets[1:]))
@@ -0,0 +1,200 @@
+"""Vectorized two-sample Kolmogorov-Smirnov statistics."""
+
+# Third Party
+import numpy as np
+
+# Pairs of (validation, test, live) splits compared by the concordance check
+PAIRS = ((0, 1), (0, 2), (2, 1))
+
+
+def cluster_offsets(labels, n_clusters):
+    """Return the start offset of every cluster in a cluster-sorted array
+
+    Parameters:
+    -----------
+    labels : ndarray
+        Cluster label of every sample
+
+    n_clusters : int
+        Number of clusters
+
+    Returns:
+    --------
+    offsets : ndarray
+        int32 array of length n_clusters + 1, cluster i spans offsets[i]:offsets[i + 1]
+    """
+    offsets = np.zeros(n_clusters + 1, dtype=np.int32)
+    np.cumsum(np.bincount(labels, minlength=n_clusters), out=offsets[1:])
+    return offsets
+
+
+def _segment_max(values, offsets):
+    """Maximum of every [offsets[i], offsets[i + 1]) segment, NaN for empty ones"""
+    out = np.full(len(offsets) - 1, np.nan)
+    nonempty = offsets[1:] > offsets[:-1]
+    if nonempty.any():
+        out[nonempty] = np.maximum.reduceat(values, offsets[:-1][nonempty])
+    return out
+
+
+def _grouped_ks(values, source, offsets, n_samples, pairs):
+    """KS statistics of values that are sorted within every cluster segment
+
+    For a pair (a, b) every value of a weighs 1 / n_a and every value of b
+    weighs -1 / n_b within its segment, so a single running sum gives the
+    difference of both empirical CDFs and returns to zero at every segment end.
+
+    Parameters:
+    -----------
+    values : ndarray
+        Values of all samples, contiguous per cluster and sorted within each cluster
+
+    source : ndarray
+        Index of the sample every value belongs to
+
+    offsets : ndarray
+        Cluster segment offsets into values
+
+    n_samples : int
+        Number of samples mixed into values
+
+    pairs : tuple
+        Pairs of sample indices to compare
+
+    Returns:
+    --------
+    statistics : ndarray
+        Array of shape (len(pairs), n_segments)
+    """
+    n_segments = len(offsets) - 1
+    sizes = np.diff(offsets)
+    key = np.repeat(np.arange(n_segments, dtype=np.int64) * n_samples, sizes)
+    key += source
+    counts = np.bincount(key, minlength=n_segments * n_samples).reshape(
+        n_segments, n_samples)
+
+    # The empirical CDFs only need to be compared after the last of every run of ties
+    last = np.ones(len(values), dtype=bool)
+    last[:-1] = values[1:] != values[:-1]
+    last[offsets[1:][sizes > 0] - 1] = True
+    ties = not last.all()
+    if ties:
+        ends = np.flatnonzero(last)
+        offsets = np.searchsorted(ends, offsets)
+
+    statistics = np.empty((len(pairs), n_segments))
+    for p, (a, b) in enumerate(pairs):
+        valid = (counts[:, a] > 0) & (counts[:, b] > 0)
+        weights = np.zeros((n_segments, n_samples))
+        weights[valid, a] = 1.0 / counts[valid, a]
+        weights[valid, b] -= 1.0 / counts[valid, b]
+        distance = np.cumsum(weights.reshape(-1)[key])
+        if ties:
+            distance = distance[ends]
+        np.abs(distance, out=distance)
+        statistics[p] = _segment_max(distance, offsets)
+        statistics[p][~valid] = np.nan
+    return statistics
+
+
+def ks_statistics(samples, labels, n_clusters=None, pairs=PAIRS):
+    """Compute the KS statistic of every pair of samples within every cluster
+
+    All samples are sorted together exactly once, grouped by cluster, and the
+    empirical CDF of every sample is read off a cumulative count over that
+    order, so every cluster and every pair is handled in a single vectorized
+    pass instead of one ks_2samp call per cluster and pair.
+
+    Parameters:
+    -----------
+    samples : list of ndarray
+        Values of every split, e.g. the validation, test and live predictions
+
+    labels : list of ndarray
+        Cluster label of every value in the matching sample
+
+    n_clusters : int, optional, default: None
+        Number of clusters, inferred from the labels when not given
+
+    pairs : tuple, optional, default: PAIRS
+        Pairs of sample indices to compare
+
+    Returns:
+    --------
+    statistics : ndarray
+        Array of shape (len(pairs), n_clusters) holding the KS statistic of
+        every pair within every cluster, NaN where a cluster is empty
+    """
+    values = np.concatenate([np.asarray(s, dtype=np.float64).reshape(-1)
+                             for s in samples])
+    label = np.concatenate([np.asarray(c).reshape(-1) for c in labels])
+    source = np.repeat(np.arange(len(samples), dtype=np.uint8),
+                       [np.size(s) for s in samples])
+    if n_clusters is None:
+        n_clusters = int(label.max()) + 1 if len(label) else 0
+    label = label.astype(np.uint8 if n_clusters <= 256 else np.int64)
+
+    # Sort by value, then stably by cluster, giving values sorted within clusters
+    order = np.argsort(values)
+    order = order[np.argsort(label[order], kind="mergesort")]
+    offsets = cluster_offsets(label, n_clusters)
+    return _grouped_ks(values[order], source[order], offsets, len(samples),
+                       pairs)
+
+
+def layout_ks_statistics(samples, offsets, pairs=PAIRS):
+    """Compute the KS statistic of every pair of samples laid out by cluster
+
+    Parameters:
+    -----------
+    samples : list of ndarray
+        Values of every split, contiguous per cluster. Either 1-D, or 2-D with
+        one row per submission scored against the same cluster layout
+
+    offsets : list of ndarray
+        Cluster offsets of every sample, cluster i spans offsets[i]:offsets[i + 1]
+
+    pairs : tuple, optional, default: PAIRS
+        Pairs of sample indices to compare
+
+    Returns:
+    --------
+    statistics : ndarray
+        Array of shape (len(pairs), n_clusters), or (len(pairs), n_rows,
+        n_clusters) for 2-D samples, holding the KS statistic of every pair
+        within every cluster, NaN where a cluster is empty
+    """
+    batch = np.ndim(samples[0]) == 2
+    samples = [np.atleast_2d(sample) for sample in samples]
+    n_rows = samples[0].shape[0]
+    n_clusters = len(offsets[0]) - 1
+    segments = [
+        sample[:, offset[i]:offset[i + 1]] for i in range(n_clusters)
+        for sample, offset in zip(samples, offsets)
+    ]
+    values = np.concatenate(segments, axis=1).astype(np.float64, copy=False)
+    source = np.empty(values.shape, dtype=np.uint8)
+    joint_offsets = np.sum(offsets, axis=0, dtype=np.int64)
+
+    # Clusters are already contiguous, so only sort within each of them. Within
+    # a cluster the samples follow each other, so the sample of a sorted value
+    # follows from its position before sorting
+    for i, (start, end) in enumerate(zip(joint_offsets[:-1], joint_offsets[1:])):
+        order = np.argsort(values[:, start:end], axis=1)
+        values[:, start:end] = np.take_along_axis(values[:, start:end], order,
+                                                  axis=1)
+        sample_starts = np.cumsum([offset[i + 1] - offset[i]
+                                   for offset in offsets])[:-1]
+        source[:, start:end] = np.searchsorted(sample_starts, order,
+                                               side="right")
+
+    # Every (row, cluster) pair is a segment of the flattened values
+    n_values = values.shape[1]
+    row_offsets = np.empty(n_rows * n_clusters + 1, dtype=np.int64)
+    row_offsets[:-1] = (np.arange(n_rows)[:, None] * n_values +
+                        joint_offsets[:-1]).reshape(-1)
+    row_offsets[-1] = n_rows * n_values
+    statistics = _grouped_ks(values.reshape(-1), source.reshape(-1),
+                             row_offsets, len(samples), pairs)
+    statistics = statistics.reshape((len(pairs), n_rows, n_clusters))
+    return statistics if batch else statistics[:, 0]
@@ -0,0 +1,214 @@
+"""In-process cache of the rounds and users rows submissions refer to."""
+
+# System
+import time
+import select
+import logging
+import threading
+import collections
+
+# Seconds the rounds are kept before they are read again
+ROUNDS_TTL = 300
+# Seconds a username is kept before it is read again
+USERS_TTL = 3600
+# Usernames kept in memory
+MAX_USERS = 10000
+# Channel a NOTIFY on which drops the cached rounds, e.g. from a trigger on rounds
+ROUNDS_CHANNEL = "rounds_changed"
+
+ROUNDS_QUERY = "SELECT id, tournament, number, dataset_path FROM rounds"
+USER_QUERY = "SELECT username FROM users WHERE id = %s"
+
+
+class MetadataCache():
+    """Rounds and usernames by id, each read from Postgres at most once per TTL
+
+    Every round is kept in memory and all of them are read in one query, again
+    when the TTL expired or an unknown round is asked for, e.g. a round that
+    just opened. Usernames are kept in an LRU of max_users. Lookups take the
+    connection of the caller to read what is missing, so a hit costs no query.
+    """
+
+    def __init__(self, rounds_ttl=ROUNDS_TTL, users_ttl=USERS_TTL,
+                 max_users=MAX_USERS):
+        """
+        Parameters:
+        -----------
+        rounds_ttl : float, optional, default: ROUNDS_TTL
+            Seconds the rounds are kept
+
+        users_ttl : float, optional, default: USERS_TTL
+            Seconds a username is kept
+
+        max_users : int, optional, default: MAX_USERS
+            Usernames kept
+        """
+        self.rounds_ttl = rounds_ttl
+        self.users_ttl = users_ttl
+        self.max_users = max_users
+        self._rounds = {}
+        self._rounds_loaded = None
+        self._users = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def get_round(self, postgres_db, round_id):
+        """Return the tournament, number and dataset path of a round
+
+        Parameters:
+        -----------
+        postgres_db : connection
+            Postgres connection the rounds are read with when needed
+
+        round_id : string
+            ID of the round
+
+        Returns:
+        --------
+        round : tuple
+            Tournament, round number and dataset path of the round
+
+        Raises:
+        -------
+        KeyError
+            If there is no such round
+        """
+        with self._lock:
+            loaded = self._rounds_loaded
+            fresh = (loaded is not None and
+                     time.monotonic() - loaded < self.rounds_ttl)
+            result = self._rounds.get(round_id) if fresh else None
+        if result is not None:
+            self._count("hits")
+            return result
+        self._count("misses")
+        self._load_rounds(postgres_db)
+        with self._lock:
+            return self._rounds[round_id]
+
+    def _load_rounds(self, postgres_db):
+        cursor = postgres_db.cursor()
+        cursor.execute(ROUNDS_QUERY)
+        rounds = {
+            round_id: (tournament, number, dataset_path)
+            for round_id, tournament, number, dataset_path in cursor.fetchall()
+        }
+        cursor.close()
+        with self._lock:
+            self._rounds = rounds
+            self._rounds_loaded = time.monotonic()
+
+    def get_username(self, postgres_db, user_id):
+        """Return the username of a user
+
+        Parameters:
+        -----------
+        postgres_db : connection
+            Postgres connection the user is read with when needed
+
+        user_id : string
+            ID of the user
+
+        Raises:
+        -------
+        KeyError
+            If there is no such user
+        """
+        with self._lock:
+            cached = self._users.get(user_id)
+            if (cached is not None and
+                    time.monotonic() - cached[1] < self.users_ttl):
+                self._users.move_to_end(user_id)
+                self._stats["hits"] += 1
+                return cached[0]
+            self._stats["misses"] += 1
+
+        cursor = postgres_db.cursor()
+        cursor.execute(USER_QUERY, [user_id])
+        result = cursor.fetchone()
+        cursor.close()
+        if result is None:
+            raise KeyError(user_id)
+        with self._lock:
+            self._users[user_id] = (result[0], time.monotonic())
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return result[0]
+
+    def invalidate_rounds(self):
+        """Drop the cached rounds, they are read again on the next lookup"""
+        with self._lock:
+            self._rounds_loaded = None
+            self._stats["invalidations"] += 1
+
+    def invalidate_users(self, user_id=None):
+        """Drop one cached username, or all of them when user_id is None"""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+            self._stats["invalidations"] += 1
+
+    def invalidate(self):
+        """Drop every cached round and username"""
+        self.invalidate_rounds()
+        self.invalidate_users()
+
+    def listen(self, connect, channel=ROUNDS_CHANNEL, timeout=60):
+        """Drop the cached rounds whenever a NOTIFY arrives on channel
+
+        Blocks forever, run it in a thread. The connection is dedicated to
+        listening and opened again when it is lost.
+
+        Parameters:
+        -----------
+        connect : callable
+            Opens a new Postgres connection
+
+        channel : string, optional, default: ROUNDS_CHANNEL
+            Channel to LISTEN on
+
+        timeout : float, optional, default: 60
+            Seconds to wait for a notification before checking the connection
+        """
+        while True:
+            postgres_db = None
+            try:
+                postgres_db = connect()
+                postgres_db.autocommit = True
+                cursor = postgres_db.cursor()
+                cursor.execute("LISTEN {}".format(channel))
+                cursor.close()
+                # Rounds may have changed while nobody was listening
+                self.invalidate_rounds()
+                while True:
+                    select.select([postgres_db], [], [], timeout)
+                    postgres_db.poll()
+                    if postgres_db.notifies:
+                        del postgres_db.notifies[:]
+                        logging.getLogger().info(
+                            "Rounds changed, dropping cached rounds")
+                        self.invalidate_rounds()
+            except Exception:
+                logging.exception("Lost the {} listener connection".format(
+                    channel))
+                if postgres_db is not None:
+                    try:
+                        postgres_db.close()
+                    except Exception:
+                        pass
+                time.sleep(timeout)
+
+    def stats(self):
+        """Return the number of hits, misses and invalidations"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["rounds"] = len(self._rounds)
+            stats["users"] = len(self._users)
+        return stats
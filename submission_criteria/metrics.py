@@ -0,0 +1,87 @@
+"""Validation metrics of a submission computed from one rank order."""
+
+# Third Party
+import numpy as np
+
+# First Party
+from submission_criteria.rank_correlation import RankCorrelation, rank_order
+
+# An era counts towards consistency when its correlation beats this
+BENCHMARK = 0.002
+METRICS = ("validation_correlation", "consistency", "sharpe", "max_drawdown")
+
+
+def chronological_order(era_names):
+    """Return the order of era names by era number, e.g. era2 before era10"""
+    def key(i):
+        digits = "".join(c for c in era_names[i] if c.isdigit())
+        return (int(digits) if digits else -1, era_names[i])
+
+    return np.array(sorted(range(len(era_names)), key=key), dtype=np.int64)
+
+
+class MetricsEngine():
+    """Every validation metric of a submission against fixed targets and eras
+
+    The submission is sorted once, the validation correlation and the
+    correlation of every era are read off that single order, and the era
+    statistics are a few vector operations on the era correlations. Adding a
+    metric costs no further pass over the submission.
+    """
+
+    def __init__(self, targets, era_codes, era_names):
+        """
+        Parameters:
+        -----------
+        targets : ndarray
+            Validation targets, 1-D or 2-D with one column per target
+
+        era_codes : ndarray
+            Index into era_names of every validation row
+
+        era_names : ndarray
+            Name of every era
+        """
+        self.correlation = RankCorrelation(targets)
+        self.era_correlation = RankCorrelation(targets, era_codes)
+        self.era_names = era_names
+        self.era_order = chronological_order(era_names)
+
+    def __len__(self):
+        return len(self.correlation)
+
+    def score(self, predictions):
+        """Compute every metric of aligned predictions
+
+        Parameters:
+        -----------
+        predictions : ndarray
+            Predictions of the validation rows, in the order of the targets
+
+        Returns:
+        --------
+        metrics : dictionary
+            "validation_correlation", "consistency" (percentage of eras beating
+            BENCHMARK), "sharpe" (mean over standard deviation of the era
+            correlations) and "max_drawdown" (largest drop of the cumulative
+            era correlation), one value per target, and "era_correlations" of
+            shape (n_eras, ) or (n_eras, n_targets) in chronological order
+        """
+        order = rank_order(predictions)
+        era_correlations = self.era_correlation(predictions,
+                                                order)[self.era_order]
+        cumulative = np.cumsum(era_correlations, axis=0)
+        sharpe = np.full(era_correlations.shape[1:], np.nan)
+        if len(era_correlations) > 1:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                sharpe = era_correlations.mean(axis=0) / era_correlations.std(
+                    axis=0, ddof=1)
+        return {
+            "validation_correlation": self.correlation(predictions, order)[0],
+            "era_correlations": era_correlations,
+            "consistency": np.count_nonzero(
+                era_correlations > BENCHMARK, axis=0) / len(self.era_names) * 100,
+            "sharpe": sharpe,
+            "max_drawdown": np.max(
+                np.maximum.accumulate(cumulative, axis=0) - cumulative, axis=0),
+        }
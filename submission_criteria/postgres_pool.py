@@ -0,0 +1,188 @@
+"""Thread-safe pool of Postgres connections."""
+
+# System
+import time
+import logging
+import threading
+import contextlib
+
+# Third Party
+import psycopg2
+import psycopg2.extensions
+
+# Connections idle for longer than this are checked before they are reused
+HEALTH_CHECK_INTERVAL = 30
+
+
+class PoolError(Exception):
+    """The pool is closed or no connection became available in time"""
+
+
+class ConnectionPool():
+    """Bounded pool of Postgres connections shared by every worker thread
+
+    At least min_size connections are kept open and at most max_size are ever
+    open at once. A checkout blocks until a connection is free, so concurrent
+    workers each get their own connection without reconnecting, and the time
+    spent waiting is recorded to size the pool.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=4, timeout=30,
+                 health_check_interval=HEALTH_CHECK_INTERVAL):
+        """
+        Parameters:
+        -----------
+        connect : callable
+            Opens a new connection
+
+        min_size : int, optional, default: 1
+            Connections opened up front and kept open
+
+        max_size : int, optional, default: 4
+            Most connections open at once
+
+        timeout : float, optional, default: 30
+            Seconds a checkout waits for a connection before raising PoolError
+
+        health_check_interval : float, optional, default: HEALTH_CHECK_INTERVAL
+            Seconds a connection may idle before it is checked on checkout
+        """
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError("Invalid pool size {}-{}".format(
+                min_size, max_size))
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "wait_time": 0.0,
+            "max_wait_time": 0.0,
+            "timeouts": 0,
+            "replaced": 0,
+        }
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise PoolError("Connection pool is closed")
+                if self._idle:
+                    connection, idle_since = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    connection, idle_since = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolError(
+                        "No Postgres connection available after {}s".format(
+                            self.timeout))
+                self._condition.wait(remaining)
+            waited = time.monotonic() - start
+            self._stats["checkouts"] += 1
+            self._stats["wait_time"] += waited
+            self._stats["max_wait_time"] = max(self._stats["max_wait_time"],
+                                               waited)
+
+        try:
+            if connection is None:
+                connection = self._connect()
+            elif not self._is_healthy(connection, idle_since):
+                self._discard(connection)
+                with self._condition:
+                    self._stats["replaced"] += 1
+                connection = self._connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        return connection
+
+    def _is_healthy(self, connection, idle_since):
+        if connection.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            logging.getLogger().info("Replacing broken Postgres connection")
+            return False
+
+    @staticmethod
+    def _discard(connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def _release(self, connection, broken=False):
+        if not broken and not connection.closed:
+            try:
+                status = connection.get_transaction_status()
+                if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                broken = True
+        with self._condition:
+            if broken or connection.closed or self._closed:
+                self._size -= 1
+                self._discard(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a with block
+
+        A transaction left open by the block is rolled back, so callers commit
+        what they want to keep. Connections that broke are replaced.
+        """
+        connection = self._acquire()
+        broken = False
+        try:
+            yield connection
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self._release(connection, broken)
+
+    def stats(self):
+        """Return checkout counts and wait times, in seconds, and the pool size"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+        stats["mean_wait_time"] = (stats["wait_time"] / stats["checkouts"]
+                                   if stats["checkouts"] else 0.0)
+        return stats
+
+    def close(self):
+        """Close every idle connection, checked out ones close on release"""
+        with self._condition:
+            self._closed = True
+            for connection, _ in self._idle:
+                self._discard(connection)
+            self._size -= len(self._idle)
+            self._idle = []
+            self._condition.notify_all()
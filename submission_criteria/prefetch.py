@@ -0,0 +1,100 @@
+"""Prefetch of submissions while they wait in the scoring queue."""
+
+# System
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# First Party
+from submission_criteria import common
+
+# Downloads running at once
+MAX_IN_FLIGHT = 4
+# Submissions waiting for a download slot, more are not prefetched
+MAX_PENDING = 1000
+
+
+class Prefetcher():
+    """Downloads and parses submissions into the submission cache on enqueue
+
+    The scoring workers then find the submission in memory, so the S3 latency
+    is hidden under the time the submission waits in the queue. Prefetching
+    is best effort: a submission is skipped when MAX_PENDING are waiting or
+    max_memory_bytes of prefetched submissions were not read by a worker yet,
+    so that prefetched submissions do not evict the ones about to be scored,
+    and failures are only logged as the worker downloads the submission
+    again.
+    """
+
+    def __init__(self, filemanager, max_in_flight=MAX_IN_FLIGHT,
+                 max_pending=MAX_PENDING, max_memory_bytes=None):
+        """
+        Parameters:
+        -----------
+        filemanager : FileManager
+            S3 Bucket data access object holding the submission cache
+
+        max_in_flight : int, optional, default: MAX_IN_FLIGHT
+            Downloads running at once
+
+        max_pending : int, optional, default: MAX_PENDING
+            Submissions waiting for a download slot
+
+        max_memory_bytes : int, optional, default: None
+            Bytes of prefetched submissions not read yet beyond which nothing
+            is prefetched, half of the budget of the submission cache when not
+            given
+        """
+        self.filemanager = filemanager
+        self.max_pending = max_pending
+        if max_memory_bytes is None:
+            max_memory_bytes = filemanager.submissions.max_memory_bytes // 2
+        self.max_memory_bytes = max_memory_bytes
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stats = {"prefetched": 0, "skipped": 0, "failed": 0}
+
+    def submit(self, submission):
+        """Start prefetching a submission work item, return whether it was started"""
+        cache = self.filemanager.submissions
+        with self._lock:
+            if (self._pending >= self.max_pending or
+                    cache.stats()["prefetched_bytes"] >=
+                    self.max_memory_bytes):
+                self._stats["skipped"] += 1
+                return False
+            self._pending += 1
+        try:
+            self._executor.submit(self._prefetch, dict(submission))
+        except RuntimeError:
+            # The prefetcher was closed
+            with self._lock:
+                self._pending -= 1
+                self._stats["skipped"] += 1
+            return False
+        return True
+
+    def _prefetch(self, submission):
+        try:
+            context = common.get_submission_context(submission)
+            self.filemanager.read_submission(context["s3_file"], prefetch=True)
+            outcome = "prefetched"
+        except Exception:
+            logging.exception("Could not prefetch submission {}".format(
+                submission["submission_id"]))
+            outcome = "failed"
+        with self._lock:
+            self._pending -= 1
+            self._stats[outcome] += 1
+
+    def stats(self):
+        """Return the number of prefetched, skipped, failed and pending submissions"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = self._pending
+        return stats
+
+    def close(self):
+        """Stop prefetching, waiting for the running downloads"""
+        self._executor.shutdown(wait=True)
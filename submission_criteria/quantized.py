@@ -0,0 +1,133 @@
+"""Compact uint8 storage for feature matrices with few distinct values."""
+
+# Third Party
+import numpy as np
+import pandas as pd
+
+# First Party
+from submission_criteria.dataset_archive import open_dataset
+
+MAX_LEVELS = 256
+
+
+class QuantizedMatrix():
+    """A feature matrix stored as uint8 codes into a small lookup table
+
+    Numerai features only take a handful of distinct values, so every value is
+    stored as the uint8 index of its entry in a sorted table, an eighth of the
+    size of the float64 matrix. Float views are decoded on demand, chunk by
+    chunk when memory matters.
+    """
+
+    def __init__(self, codes, table, columns=None):
+        self.codes = codes
+        self.table = table
+        self.columns = columns
+
+    @classmethod
+    def from_values(cls, values, columns=None):
+        """Quantize a float matrix
+
+        Raises:
+        -------
+        ValueError
+            If the matrix has more than MAX_LEVELS distinct values
+        """
+        values = np.asarray(values)
+        missing = np.isnan(values)
+        table = np.unique(values[~missing])
+        if missing.any():
+            table = np.append(table, np.nan)
+        if len(table) > MAX_LEVELS:
+            raise ValueError("Cannot quantize {} distinct values to uint8".format(
+                len(table)))
+        codes = np.searchsorted(table[:len(table) - missing.any()], values)
+        codes[missing] = len(table) - 1
+        return cls(codes.astype(np.uint8), table.astype(values.dtype), columns)
+
+    @classmethod
+    def concatenate(cls, matrices):
+        """Stack quantized matrices row-wise, merging their lookup tables"""
+        tables = [m.table for m in matrices]
+        table = np.unique(np.concatenate(tables))
+        if any(np.isnan(t).any() for t in tables):
+            table = np.append(table[~np.isnan(table)], np.nan)
+        if len(table) > MAX_LEVELS:
+            raise ValueError("Cannot quantize {} distinct values to uint8".format(
+                len(table)))
+        codes = []
+        for m in matrices:
+            # NaN sorts last in both tables, so searchsorted maps it as well
+            remap = np.searchsorted(table, m.table).astype(np.uint8)
+            codes.append(remap[m.codes])
+        return cls(np.concatenate(codes), table, matrices[0].columns)
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.table.nbytes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def take(self, rows):
+        """Return the quantized matrix of the given rows"""
+        return QuantizedMatrix(self.codes[rows], self.table, self.columns)
+
+    def dropna(self):
+        """Return the quantized matrix without the rows holding a NaN"""
+        if not np.isnan(self.table[-1:]).any():
+            return self
+        keep = ~(self.codes == len(self.table) - 1).any(axis=1)
+        return self.take(keep)
+
+    def to_float(self, start=None, stop=None, dtype=np.float32):
+        """Decode rows start:stop to floats"""
+        return self.table.astype(dtype)[self.codes[start:stop]]
+
+    def chunks(self, chunk_size, dtype=np.float32):
+        """Decode the matrix to floats chunk_size rows at a time"""
+        for start in range(0, len(self), chunk_size):
+            yield self.to_float(start, start + chunk_size, dtype)
+
+
+def read_csv(path, features, chunk_size, columns=None):
+    """Read the features of a CSV as a quantized matrix, chunk_size rows at a time
+
+    Parameters:
+    -----------
+    path : string or ArchiveMember
+        CSV file to read, or the member of a dataset zip holding it
+
+    features : list
+        Feature columns to quantize
+
+    chunk_size : int
+        Number of rows parsed at once
+
+    columns : list, optional, default: None
+        Other columns to read as a regular DataFrame
+
+    Returns:
+    --------
+    features : QuantizedMatrix
+        Quantized features
+
+    data : DataFrame
+        The other columns, or None when none were asked for
+    """
+    columns = columns or []
+    dtype = {c: np.float32 for c in features}
+    parts, frames = [], []
+    with open_dataset(path) as f:
+        for chunk in pd.read_csv(f, usecols=columns + features, dtype=dtype,
+                                 chunksize=chunk_size):
+            parts.append(QuantizedMatrix.from_values(chunk[features].values,
+                                                     features))
+            if columns:
+                frames.append(chunk[columns])
+    data = pd.concat(frames, ignore_index=True) if columns else None
+    return QuantizedMatrix.concatenate(parts), data
@@ -0,0 +1,137 @@
+"""Correlation of ranked predictions with fixed targets."""
+
+# System
+import threading
+
+# Third Party
+import numpy as np
+
+
+def rank_order(predictions):
+    """Return the order sorting predictions, ties broken by position
+
+    This is the order of rank(method="first"). An unstable sort is much faster
+    and gives the same order unless some predictions tie, only then the stable
+    sort is needed.
+    """
+    order = np.argsort(predictions)
+    ranked = predictions[order]
+    if (ranked[1:] == ranked[:-1]).any():
+        order = np.argsort(predictions, kind="mergesort")
+    return order
+
+
+class RankCorrelation():
+    """Correlation kernel of fixed targets, optionally within segments such as eras
+
+    The targets are standardized within every segment once. Ranks within a
+    segment are a permutation of 0 to n - 1, so their mean and norm only depend
+    on n, and the correlation of a prediction vector reduces to one sort and a
+    dot product of the standardized targets gathered in prediction order
+    with the rank positions. Ties are broken by position like
+    rank(method="first"), and a segment holding a NaN prediction has a NaN
+    correlation like np.corrcoef.
+    """
+
+    def __init__(self, targets, segments=None):
+        """
+        Parameters:
+        -----------
+        targets : ndarray
+            Targets, either 1-D, or 2-D with one column per target to score
+            against all targets at once
+
+        segments : ndarray, optional, default: None
+            Segment code from 0 to n_segments - 1 of every target row, a single
+            segment when not given. Every segment must hold a row
+        """
+        targets = np.asarray(targets, dtype=np.float64)
+        self.segments = None
+        if segments is None:
+            sizes = np.array([len(targets)])
+            grouped = targets
+        else:
+            # Small integers are radix sorted by the stable argsort
+            dtype = np.int16 if np.max(segments) < np.iinfo(np.int16).max else np.int32
+            self.segments = np.asarray(segments, dtype=dtype)
+            sizes = np.bincount(self.segments)
+            group = np.argsort(self.segments, kind="stable")
+            grouped = targets[group]
+        self.starts = np.zeros(len(sizes), dtype=np.int64)
+        np.cumsum(sizes[:-1], out=self.starts[1:])
+
+        # Segment statistics broadcast against 1-D and 2-D targets alike
+        self._column = (-1, ) + (1, ) * (targets.ndim - 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            centered = grouped - np.repeat(
+                np.add.reduceat(grouped, self.starts, axis=0) /
+                sizes.reshape(self._column), sizes, axis=0)
+            norms = np.sqrt(
+                np.add.reduceat(centered * centered, self.starts, axis=0))
+            standardized = centered / np.repeat(norms, sizes, axis=0)
+        if segments is None:
+            self.standardized = standardized
+        else:
+            self.standardized = np.empty_like(standardized)
+            self.standardized[group] = standardized
+        self.positions = (np.arange(len(targets)) -
+                          np.repeat(self.starts, sizes)).astype(np.float64)
+        self.rank_norms = np.sqrt(sizes * (sizes**2 - 1) / 12.0).reshape(
+            self._column)
+        self._local = threading.local()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _buffer(self):
+        """Per thread buffer the standardized targets are gathered into"""
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = np.empty(self.standardized.shape)
+        return buffer
+
+    def __call__(self, predictions, order=None):
+        """Return the correlation of the ranked predictions of every segment
+
+        Parameters:
+        -----------
+        predictions : ndarray
+            Predictions in the same order as the targets
+
+        order : ndarray, optional, default: None
+            rank_order of predictions, given to share one sort between kernels
+
+        Returns:
+        --------
+        correlations : ndarray
+            Correlation of every segment, of shape (n_segments, n_targets) for
+            2-D targets
+        """
+        if len(predictions) != len(self):
+            raise IndexError("Got {} predictions for {} targets".format(
+                len(predictions), len(self)))
+        if order is None:
+            order = rank_order(predictions)
+        if self.segments is not None:
+            # The stable sort keeps the rank order within every segment
+            order = order[np.argsort(self.segments[order], kind="stable")]
+
+        buffer = self._buffer()
+        np.take(self.standardized, order, axis=0, out=buffer)
+        if self.segments is None:
+            # A single matrix-vector product over every target
+            sums = np.dot(self.positions, buffer)[None]
+        else:
+            np.multiply(buffer, self.positions.reshape(self._column),
+                        out=buffer)
+            sums = np.add.reduceat(buffer, self.starts, axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            correlations = sums / self.rank_norms
+        missing = np.isnan(predictions)
+        if missing.any():
+            if self.segments is None:
+                correlations[:] = np.nan
+            else:
+                correlations[np.bincount(self.segments[missing],
+                                         minlength=len(self.starts)) > 0] = np.nan
+        return correlations
@@ -0,0 +1,263 @@
+"""Round data shared by the concordance, consistency and metrics pipelines."""
+
+# System
+import os
+import logging
+import threading
+import collections
+
+# Third Party
+import numpy as np
+
+# First Party
+from submission_criteria import validation_cache
+from submission_criteria.id_index import IdIndex
+
+TOURNAMENT_DATA = "numerai_tournament_data.csv"
+# Datasets kept in memory, enough for the current round of every tournament
+MAX_DATASETS = int(os.environ.get("MAX_ROUND_DATASETS", "9"))
+
+_datasets = collections.OrderedDict()
+_datasets_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+
+def get_dataset_version(dataset_path):
+    """Return the dataset version of a round from its rounds.dataset_path"""
+    return dataset_path.split('/')[0] if dataset_path else None
+
+
+class RoundDataset():
+    """Lazily loaded data of one competition round
+
+    Every artifact is loaded the first time it is asked for and then shared
+    by every thread, a lock per artifact makes sure it is loaded at most once
+    while other artifacts can still be loaded concurrently.
+    """
+
+    def __init__(self, filemanager, tournament, round_number,
+                 dataset_version=None):
+        self.filemanager = filemanager
+        self.tournament = tournament
+        self.round_number = round_number
+        self.dataset_version = dataset_version
+        self._artifacts = {}
+        self._locks = collections.defaultdict(threading.Lock)
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        """Return the artifact stored under key, calling loader to load it once
+
+        Parameters:
+        -----------
+        key : hashable
+            Name of the artifact
+
+        loader : callable
+            Called without arguments to load the artifact when it is missing
+
+        Returns:
+        --------
+        artifact : object
+            The artifact shared by every caller
+        """
+        if key in self._artifacts:
+            return self._artifacts[key]
+        with self._lock:
+            key_lock = self._locks[key]
+        with key_lock:
+            if key not in self._artifacts:
+                self._artifacts[key] = loader()
+            return self._artifacts[key]
+
+    @property
+    def tournament_store(self):
+        """Columnar store of the tournament data"""
+        return self.get(
+            "tournament_store", lambda: self.filemanager.dataset_store(
+                self.tournament, self.round_number, TOURNAMENT_DATA))
+
+    @property
+    def id_index(self):
+        """IdIndex of the validation, test and live ids"""
+        return self.get("id_index", self._load_id_index)
+
+    def _load_id_index(self):
+        data = self.tournament_store.read(["id", "data_type"])
+        return IdIndex(*[
+            data["id"].values[data["data_type"].values == data_type]
+            for data_type in ["validation", "test", "live"]
+        ])
+
+    def get_ids(self):
+        """Return the validation, test and live ids, each sorted by id"""
+        return self.id_index.split(self.id_index.index.values)
+
+    def get_validation_column(self, data, column="probability"):
+        """Return one column of data for every validation id in id order
+
+        Raises:
+        -------
+        IndexError
+            If data does not cover every validation id
+        """
+        n_validation = self.id_index.offsets[1]
+        codes = self.id_index.get_codes(data["id"].values)
+        in_validation = (codes >= 0) & (codes < n_validation)
+        values = np.full(n_validation, np.nan)
+        values[codes[in_validation]] = data[column].values[in_validation]
+        found = np.count_nonzero(in_validation)
+        if found < n_validation:
+            raise IndexError("Data is missing {} of the {} validation ids".format(
+                n_validation - found, n_validation))
+        return values
+
+    @property
+    def validation_positions(self):
+        """Rows of the tournament data holding the validation ids in id order"""
+        return self.get("validation_positions", self._load_validation_positions)
+
+    def _load_validation_positions(self):
+        ids = self.tournament_store.get_column("id")
+        positions = self.id_index.get_positions(ids)
+        return self.id_index.split(positions)[0]
+
+    @property
+    def eras(self):
+        """Names of the validation eras and the era code of every validation id
+
+        Returns:
+        --------
+        eras : tuple
+            Sorted era names and an int32 array indexing them, one per
+            validation id in id order
+        """
+        return self.get("eras", self._load_eras)
+
+    def _load_eras(self):
+        era = self.tournament_store.get_column("era")[self.validation_positions]
+        names, codes = np.unique(era, return_inverse=True)
+        return names, codes.astype(np.int32)
+
+    @property
+    def era_layout(self):
+        """Validation ids grouped by era
+
+        Returns:
+        --------
+        layout : dictionary
+            "names" are the sorted era names, "order" the int32 permutation of
+            the validation ids in id order grouping them by era, keeping them in
+            id order within every era, and era i spans
+            "offsets"[i]:"offsets"[i + 1] of the permuted ids
+        """
+        return self.get("era_layout", self._load_era_layout)
+
+    def _load_era_layout(self):
+        names, codes = self.eras
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(names)), out=offsets[1:])
+        return {
+            "names": names,
+            "order": np.argsort(codes, kind="mergesort").astype(np.int32),
+            "offsets": offsets,
+        }
+
+    def get_targets(self, target):
+        """Return one target column of the validation ids in id order"""
+        return self.get(
+            ("targets", target), lambda: np.asarray(
+                self.tournament_store.get_column(target)[
+                    self.validation_positions], dtype=np.float64))
+
+    @property
+    def validation_data(self):
+        """ValidationData of the dataset version, see validation_cache"""
+        return self.get("validation_data", self._load_validation_data)
+
+    def _load_validation_data(self):
+        if self.dataset_version is None:
+            raise ValueError("Round {}-{} has no dataset version".format(
+                self.tournament, self.round_number))
+        return validation_cache.get_validation_data(self.filemanager,
+                                                    self.dataset_version)
+
+
+def get_round_dataset(filemanager, tournament, round_number,
+                      dataset_version=None):
+    """Return the RoundDataset of a round, shared by every caller in the process
+
+    Parameters:
+    -----------
+    filemanager : FileManager
+        S3 Bucket data access object for querying competition datasets
+
+    tournament : int
+        Tournament of the competition round
+
+    round_number : int
+        Numerical ID of the competition round of the tournament
+
+    dataset_version : string, optional, default: None
+        Dataset version of the round, see get_dataset_version
+
+    Returns:
+    --------
+    dataset : RoundDataset
+        Dataset of the round, the MAX_DATASETS most recently used are kept
+    """
+    # A dataset replaced in S3 was deleted from disk with what derives from it
+    if not filemanager.revalidate_dataset(tournament, round_number):
+        invalidate(tournament, round_number)
+    key = (tournament, round_number, dataset_version)
+    with _datasets_lock:
+        dataset = _datasets.get(key)
+        _stats["hits" if dataset is not None else "misses"] += 1
+        if dataset is None:
+            logging.getLogger().info(
+                "Opening dataset of round {}-{} version {}".format(
+                    tournament, round_number, dataset_version))
+            dataset = RoundDataset(filemanager, tournament, round_number,
+                                   dataset_version)
+            _datasets[key] = dataset
+            # The files of the rounds being scored are never evicted from disk
+            filemanager.pin_round(tournament, round_number)
+        _datasets.move_to_end(key)
+        while len(_datasets) > MAX_DATASETS:
+            _, evicted = _datasets.popitem(last=False)
+            _stats["evictions"] += 1
+            logging.getLogger().info(
+                "Evicting dataset of round {}-{} version {}".format(
+                    evicted.tournament, evicted.round_number,
+                    evicted.dataset_version))
+            evicted.filemanager.unpin_round(evicted.tournament,
+                                            evicted.round_number)
+        return dataset
+
+
+def invalidate(tournament=None, round_number=None):
+    """Drop the datasets of a round, e.g. after the round restarted
+
+    Every round of the tournament is dropped when round_number is None, and
+    every dataset when tournament is None too. Return the number dropped.
+    """
+    with _datasets_lock:
+        keys = [
+            k for k in _datasets
+            if tournament in (None, k[0]) and round_number in (None, k[1])
+        ]
+        for key in keys:
+            dataset = _datasets.pop(key)
+            dataset.filemanager.unpin_round(dataset.tournament,
+                                            dataset.round_number)
+        _stats["invalidations"] += len(keys)
+        return len(keys)
+
+
+def stats():
+    """Return the hits, misses, evictions and invalidations of the datasets"""
+    with _datasets_lock:
+        result = dict(_stats)
+        result["datasets"] = len(_datasets)
+        result["max_datasets"] = MAX_DATASETS
+    return result
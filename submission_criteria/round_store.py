@@ -0,0 +1,229 @@
+"""Columnar store of the datasets of a competition round."""
+
+# System
+import os
+import json
+import shutil
+import logging
+import tempfile
+
+# Third Party
+import numpy as np
+import pandas as pd
+
+# First Party
+from submission_criteria.dataset_archive import ArchiveMember, open_dataset
+
+# Bump whenever the layout of a store changes
+STORE_VERSION = 1
+CHUNK_SIZE = 100000
+
+
+class RoundStore():
+    """One dataset CSV converted to one npy file per column
+
+    The CSV is parsed once, chunk by chunk, and every later read only maps the
+    npy files of the columns it asks for. Feature columns are stored as
+    float32, other numeric columns as float64 and text columns as fixed width
+    unicode so every column can be memory mapped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+
+    @property
+    def columns(self):
+        return list(self.manifest["columns"])
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def get_column(self, column, mmap=True):
+        """Return one column as an ndarray, memory mapped unless mmap is False"""
+        if column not in self.manifest["columns"]:
+            raise KeyError("Column {} is not in {}".format(column, self.path))
+        return np.load(os.path.join(self.path, "{}.npy".format(column)),
+                       mmap_mode="r" if mmap else None)
+
+    def read(self, columns=None):
+        """Read a column projection of the dataset as a DataFrame
+
+        Parameters:
+        -----------
+        columns : list, optional, default: None
+            Columns to read, every column when not given
+
+        Returns:
+        --------
+        data : DataFrame
+            The requested columns in the requested order
+        """
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({c: self.get_column(c) for c in columns},
+                            columns=columns)
+
+    def read_matrix(self, columns, dtype=np.float32):
+        """Read numeric columns as one (rows, columns) matrix"""
+        matrix = np.empty((len(self), len(columns)), dtype=dtype)
+        for i, column in enumerate(columns):
+            matrix[:, i] = self.get_column(column)
+        return matrix
+
+
+def _source_stamp(source):
+    if isinstance(source, ArchiveMember):
+        return source.stamp()
+    stat = os.stat(source)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def _count_rows(source):
+    """Count the data rows of a CSV without parsing it
+
+    Every line break counts, so this is an upper bound when the CSV has blank
+    lines or quoted values spanning lines.
+    """
+    rows = 0
+    last = b"\n"
+    with open_dataset(source) as f:
+        for block in iter(lambda: f.read(1 << 24), b""):
+            rows += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":
+        rows += 1
+    return rows - 1
+
+
+def build(source, store_path, chunk_size=CHUNK_SIZE):
+    """Convert a dataset CSV to a columnar store
+
+    The numeric columns are written straight into preallocated npy files and
+    the store only becomes visible once complete, so readers never see a
+    partial store.
+
+    Parameters:
+    -----------
+    source : string or ArchiveMember
+        Dataset CSV, or the member of the dataset zip it is streamed from
+
+    store_path : string
+        Directory of the store
+
+    chunk_size : int, optional, default: CHUNK_SIZE
+        Number of rows parsed at once
+
+    Returns:
+    --------
+    store : RoundStore
+        The built store
+    """
+    logging.getLogger().info("Building column store of {}".format(source))
+    with open_dataset(source) as f:
+        header = list(pd.read_csv(f, nrows=0))
+    dtype = {c: np.float32 for c in header if "feature" in c}
+    rows = _count_rows(source)
+
+    parent = os.path.dirname(os.path.abspath(store_path))
+    if not os.path.exists(parent):
+        os.makedirs(parent)
+    temp_path = tempfile.mkdtemp(dir=parent, suffix=".tmp")
+    try:
+        numeric, text = {}, {c: [] for c in header}
+        # Columns numeric in the first chunk but not in a later one
+        demoted = []
+        start = 0
+        with open_dataset(source) as f:
+            for chunk in pd.read_csv(f, dtype=dtype, chunksize=chunk_size):
+                for column in header:
+                    values = chunk[column].values
+                    if column not in numeric and values.dtype.kind in "fiub":
+                        if start == 0:
+                            numeric[column] = np.lib.format.open_memmap(
+                                os.path.join(temp_path,
+                                             "{}.npy".format(column)),
+                                mode="w+",
+                                dtype=dtype.get(column, np.float64),
+                                shape=(rows, ))
+                            del text[column]
+                    elif column in numeric and values.dtype.kind not in "fiub":
+                        del numeric[column]
+                        demoted.append(column)
+                    if column in numeric:
+                        numeric[column][start:start + len(chunk)] = values
+                    elif column in text:
+                        text[column].append(chunk[column].to_numpy(dtype=str))
+                start += len(chunk)
+        for column, values in numeric.items():
+            values.flush()
+        if start != rows:
+            # Blank lines and line breaks inside quoted values are counted as
+            # rows, cut the numeric columns down to the rows parsed
+            for column, values in numeric.items():
+                path = os.path.join(temp_path, "{}.npy".format(column))
+                np.save(path + ".tmp.npy", values[:start])
+                os.replace(path + ".tmp.npy", path)
+            rows = start
+        del numeric
+        if demoted:
+            # Read as text from the first row, so values keep their CSV spelling
+            with open_dataset(source) as f:
+                text.update({
+                    column: [values.to_numpy(dtype=str)]
+                    for column, values in pd.read_csv(
+                        f, usecols=demoted, dtype=str).items()
+                })
+        for column, values in text.items():
+            np.save(os.path.join(temp_path, "{}.npy".format(column)),
+                    np.concatenate(values) if values else np.array([], str))
+
+        with open(os.path.join(temp_path, "manifest.json"), "w") as f:
+            json.dump({
+                "version": STORE_VERSION,
+                "rows": rows,
+                "columns": header,
+                "source": _source_stamp(source),
+            }, f)
+        if os.path.exists(store_path):
+            shutil.rmtree(store_path)
+        os.rename(temp_path, store_path)
+    except Exception:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+    logging.getLogger().info("Built column store {}".format(store_path))
+    return RoundStore(store_path)
+
+
+def get_store(source, chunk_size=CHUNK_SIZE, store_path=None):
+    """Return the columnar store of a dataset CSV, building it on first use
+
+    The store is rebuilt when its source changes, e.g. when a restarted round
+    is downloaded again.
+
+    Parameters:
+    -----------
+    source : string or ArchiveMember
+        Dataset CSV, or the member of the dataset zip holding it
+
+    chunk_size : int, optional, default: CHUNK_SIZE
+        Number of rows parsed at once when building the store
+
+    store_path : string, optional, default: None
+        Directory of the store, next to the CSV when not given
+
+    Returns:
+    --------
+    store : RoundStore
+        Store of the dataset
+    """
+    if store_path is None:
+        store_path = "{}.columns".format(os.path.splitext(source)[0])
+    try:
+        store = RoundStore(store_path)
+        if (store.manifest["version"] == STORE_VERSION and
+                store.manifest["source"] == _source_stamp(source)):
+            return store
+    except (OSError, ValueError, KeyError):
+        pass
+    return build(source, store_path, chunk_size)
@@ -0,0 +1,202 @@
+"""Parallel, resumable and verified downloads of large S3 objects."""
+
+# System
+import os
+import json
+import time
+import fcntl
+import contextlib
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Bytes fetched by one ranged GET
+PART_SIZE = int(os.environ.get("S3_PART_SIZE_MB", "8")) * 2**20
+# Ranged GETs running at once
+MAX_CONCURRENCY = int(os.environ.get("S3_MAX_CONCURRENCY", "8"))
+
+PART_SUFFIX = ".part"
+STATE_SUFFIX = ".part.json"
+LOCK_SUFFIX = ".lock"
+
+# Local path -> (lock, threads using it), dropped once unused
+_path_locks = {}
+_path_locks_lock = threading.Lock()
+
+
+class DownloadError(Exception):
+    """The downloaded file does not match the S3 object"""
+
+
+def _read_state(state_path):
+    try:
+        with open(state_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(state_path, state):
+    temp_path = state_path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(temp_path, state_path)
+
+
+@contextlib.contextmanager
+def _lock_path(local_path):
+    """Hold the lock of a local path, across the threads and processes
+
+    The lock file is deleted when the lock is released. A process that locked
+    the file after it was deleted locks the file created since instead, so
+    every process holding the lock holds it on the same file.
+    """
+    with _path_locks_lock:
+        lock, users = _path_locks.get(local_path, (threading.Lock(), 0))
+        _path_locks[local_path] = (lock, users + 1)
+    try:
+        with lock:
+            lock_path = local_path + LOCK_SUFFIX
+            while True:
+                fd = os.open(lock_path, os.O_RDWR | os.O_CREAT)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    if os.stat(lock_path).st_ino == os.fstat(fd).st_ino:
+                        break
+                except FileNotFoundError:
+                    pass
+                os.close(fd)
+            try:
+                yield
+            finally:
+                os.remove(lock_path)
+                os.close(fd)
+    finally:
+        with _path_locks_lock:
+            lock, users = _path_locks.pop(local_path)
+            if users > 1:
+                _path_locks[local_path] = (lock, users - 1)
+
+
+def _md5(path, block_size=2**20):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def download_file(client, bucket, key, local_path, part_size=PART_SIZE,
+                  max_concurrency=MAX_CONCURRENCY):
+    """Download an S3 object with parallel ranged GETs
+
+    The parts are written into local_path + PART_SUFFIX, and the parts done
+    are recorded next to it so that an interrupted download resumes where it
+    stopped, unless the object changed in the meantime. Every GET requires the
+    ETag of the object so that all parts come from the same version. Once
+    complete the size is checked, and the MD5 too when the ETag is one, i.e.
+    the object was not uploaded in parts, before the file is atomically
+    renamed to local_path. local_path therefore only ever holds a complete
+    download. Downloads of the same local_path wait for each other, and one
+    that waited returns the file the other completed.
+
+    Parameters:
+    -----------
+    client : S3.Client
+        boto3 S3 client
+
+    bucket : string
+        S3 bucket
+
+    key : string
+        Key of the object
+
+    local_path : string
+        Path to download to
+
+    part_size : int, optional, default: PART_SIZE
+        Bytes fetched by one ranged GET
+
+    max_concurrency : int, optional, default: MAX_CONCURRENCY
+        Ranged GETs running at once
+
+    Returns:
+    --------
+    etag : string
+        ETag of the downloaded object
+
+    Raises:
+    -------
+    DownloadError
+        If the downloaded file does not match the object
+    """
+    started = time.time()
+    with _lock_path(local_path):
+        head = client.head_object(Bucket=bucket, Key=key)
+        if (os.path.isfile(local_path) and
+                os.path.getmtime(local_path) >= started and
+                os.path.getsize(local_path) == head["ContentLength"]):
+            # Completed by the download this one waited for
+            return head["ETag"]
+        return _download(client, bucket, key, local_path, head, part_size,
+                         max_concurrency)
+
+
+def _download(client, bucket, key, local_path, head, part_size,
+              max_concurrency):
+    size, etag = head["ContentLength"], head["ETag"]
+    part_path = local_path + PART_SUFFIX
+    state_path = local_path + STATE_SUFFIX
+
+    state = _read_state(state_path)
+    if (state is None or state["etag"] != etag or state["size"] != size or
+            state["part_size"] != part_size or
+            not os.path.isfile(part_path)):
+        state = {"etag": etag, "size": size, "part_size": part_size, "done": []}
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+        _write_state(state_path, state)
+    else:
+        logging.getLogger().info("Resuming download of {}, {} parts done".format(
+            key, len(state["done"])))
+
+    done = set(state["done"])
+    parts = [i for i in range(-(-size // part_size)) if i not in done]
+    lock = threading.Lock()
+
+    def fetch(i, fd):
+        start = i * part_size
+        end = min(start + part_size, size) - 1
+        res = client.get_object(Bucket=bucket, Key=key, IfMatch=etag,
+                                Range="bytes={}-{}".format(start, end))
+        body = res["Body"].read()
+        if len(body) != end - start + 1:
+            raise DownloadError("Got {} bytes of part {} of {}".format(
+                len(body), i, key))
+        os.pwrite(fd, body, start)
+        with lock:
+            state["done"].append(i)
+            _write_state(state_path, state)
+
+    fd = os.open(part_path, os.O_WRONLY)
+    try:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            for future in [executor.submit(fetch, i, fd) for i in parts]:
+                future.result()
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    if os.path.getsize(part_path) != size:
+        raise DownloadError("Downloaded {} bytes of the {} of {}".format(
+            os.path.getsize(part_path), size, key))
+    if "-" not in etag and _md5(part_path) != etag.strip('"'):
+        os.remove(part_path)
+        os.remove(state_path)
+        raise DownloadError("MD5 of {} does not match its ETag".format(key))
+    # Marks the file as completed now, for the downloads waiting on it
+    os.utime(part_path)
+    os.replace(part_path, local_path)
+    os.remove(state_path)
+    return etag
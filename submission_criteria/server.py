@@ -3,8 +3,10 @@
 
 # System
 import threading
+import signal
 import sys
 import os
+from queue import Empty
 from datetime import datetime
 import logging
 
@@ -14,12 +16,18 @@ from pqueue import Queue
 import numpy as np
 import schedule
 from bottle import run, request, route
-from file_manager import FileManager
 
 # First Party
-from database_manager import DatabaseManager
-import concordance
-import common
+# Imported through the package even though this file runs as a script, so that
+# the server and the modules it calls share one write buffer, metadata cache
+# and dataset registry
+from submission_criteria import common
+from submission_criteria import concordance
+from submission_criteria import round_dataset
+from submission_criteria import write_buffer
+from submission_criteria.database_manager import DatabaseManager
+from submission_criteria.file_manager import FileManager
+from submission_criteria.prefetch import Prefetcher
 
 PORT = os.environ.get("PORT", "5151")
 API_KEY = os.environ.get("API_KEY")
@@ -36,6 +44,8 @@ for d in [TEMP_DIR, OQ_DIR, CQ_DIR, LB_TEMP_DIR, LBQ_DIR]:
 
 concordance_queue = Queue(CQ_DIR, tempdir=TEMP_DIR)
 leaderboard_queue = Queue(LBQ_DIR, tempdir=LB_TEMP_DIR)
+# Downloads submissions while they wait in leaderboard_queue, set by main
+prefetcher = None
 
 
 @route('/', method='POST')
@@ -67,6 +77,33 @@ def queue_for_scoring():
     }
 
     leaderboard_queue.put(data)
+    if prefetcher is not None:
+        prefetcher.submit(data)
+
+
+@route('/metadata/invalidate', method='POST')
+def invalidate_metadata():
+    """Drop the cached rounds and users, or only the user with the posted user_id
+
+    The datasets of a tournament are dropped too when a tournament is posted,
+    only those of one round when a round_number is posted with it.
+    """
+    json = request.json
+    if API_KEY is None or json.get("api_key") != API_KEY:
+        logging.getLogger().info(
+            "Received invalid metadata invalidation with incorrect api_key")
+        return
+    metadata = common.get_metadata_cache()
+    if json.get("user_id"):
+        metadata.invalidate_users(json["user_id"])
+    else:
+        metadata.invalidate()
+    logging.getLogger().info("Invalidated metadata cache {}".format(
+        metadata.stats()))
+    if json.get("tournament") is not None:
+        round_dataset.invalidate(json["tournament"], json.get("round_number"))
+        logging.getLogger().info("Invalidated round datasets {}".format(
+            round_dataset.stats()))
 
 
 def put_submission_on_lb(db_manager, filemanager):
@@ -74,28 +111,36 @@ def put_submission_on_lb(db_manager, filemanager):
     while True:
         submission = leaderboard_queue.get()
         try:
-            common.update_metrics(submission["submission_id"])
+            common.update_metrics(submission, filemanager)
         except Exception:
             logging.exception(
                 "Exception calling update_metrics for submission.")
 
 
 def score_concordance(db_manager, filemanager):
-    """Pulls submission from concordance_queue for concordance check"""
+    """Pulls submissions from concordance_queue and checks their concordance
+
+    Whatever is queued, up to concordance.BATCH_SIZE submissions, is taken at
+    once so that the submissions of a round are scored together.
+    """
     while True:
-        submission = concordance_queue.get()
-        try:
-            concordance.submission_concordance(submission, db_manager,
-                                               filemanager)
+        submissions = [concordance_queue.get()]
+        while len(submissions) < concordance.BATCH_SIZE:
+            try:
+                submissions.append(concordance_queue.get_nowait())
+            except Empty:
+                break
+        failed = concordance.score_concordances(submissions, db_manager,
+                                                filemanager)
+        for submission in submissions:
+            if any(submission is f for f in failed):
+                continue
             if 'enqueue_time' in submission:
                 time_taken = datetime.now() - submission['enqueue_time']
                 logging.getLogger().info(
                     "Submission {} took {} to complete concordance".format(
                         submission['submission_id'], time_taken))
-
             concordance_queue.task_done()
-        except Exception:
-            logging.exception("Exception scoring concordance.")
 
 
 def create_logger():
@@ -114,10 +159,11 @@ def create_logger():
 
 def schedule_cleanup(filemanager):
     """
-    Tell the filemanager to clean up every day
+    Tell the disk cache of the filemanager to evict down to its budget every day,
+    on top of the eviction whenever something is written
     """
     # schedule a daily cleanup
-    schedule.every(1).days.do(filemanager.clean_up)
+    schedule.every(1).days.do(filemanager.disk_cache.evict)
 
     # run pending jobs every hour
     while 1:
@@ -125,6 +171,20 @@ def schedule_cleanup(filemanager):
         time.sleep(3600)
 
 
+def shutdown(signum, _frame):
+    """Write the buffered results before the server is stopped"""
+    logging.getLogger().info("Received signal {}, flushing results".format(signum))
+    status = 0
+    try:
+        common.get_write_buffer().close()
+    except Exception:
+        logging.exception("Could not flush buffered results on shutdown.")
+        status = 1
+    finally:
+        # Skips atexit, which would flush the closed buffer again
+        os._exit(status)
+
+
 def main():
     """
     The threading in this file works like this
@@ -134,12 +194,22 @@ def main():
     leaderboard/ the leaderboard reflects their most up to date submission.
 
     That method then enqueues the submission for concordance check.
+
+    The prefetcher downloads every submission as soon as it is queued, so the
+    workers find it in the submission cache.
     """
+    global prefetcher
     np.random.seed(1337)
 
     create_logger()
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
     db_manager = DatabaseManager()
+    if common.SCORE_ALL_TARGETS:
+        with db_manager.pool.connection() as postgres_db:
+            write_buffer.create_target_metrics_table(postgres_db)
     fm = FileManager('/tmp/', logging)
+    prefetcher = Prefetcher(fm)
     logging.getLogger().info("Creating servers")
 
     threading.Thread(target=run, kwargs=dict(host='0.0.0.0',
@@ -153,6 +223,10 @@ def main():
                      kwargs=dict(db_manager=db_manager,
                                  filemanager=fm)).start()
 
+    # drop the cached rounds when they change
+    threading.Thread(target=common.get_metadata_cache().listen,
+                     kwargs=dict(connect=common.connect_to_postgres)).start()
+
     # clean up the /tmp folder so we don't run out of disk space
     threading.Thread(target=schedule_cleanup,
                      kwargs=dict(filemanager=fm)).start()
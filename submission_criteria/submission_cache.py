@@ -0,0 +1,328 @@
+"""Memory and disk cache of parsed submissions shared by every scoring stage."""
+
+# System
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+import collections
+
+# Third Party
+import botocore.exceptions
+import numpy as np
+import pandas as pd
+
+# Bytes of parsed submissions kept in memory and on disk
+MAX_MEMORY_BYTES = int(os.environ.get("SUBMISSION_CACHE_MEMORY_MB",
+                                      "512")) * 2**20
+MAX_DISK_BYTES = int(os.environ.get("SUBMISSION_CACHE_DISK_MB",
+                                    "4096")) * 2**20
+# Seconds the ETag of a key is trusted before S3 is asked again
+ETAG_TTL = 300
+
+
+class SubmissionData():
+    """Ids and predictions of a parsed submission
+
+    Arrays aligned from the submission, e.g. the predictions of the validation
+    ids, are kept with it by get_aligned so that every stage aligning the same
+    way shares one array.
+    """
+
+    def __init__(self, ids, predictions):
+        self.ids = ids
+        self.predictions = predictions
+        self._aligned = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, data):
+        """Parse the id and the prediction column of a submission CSV
+
+        The prediction column is "probability", or the first column starting
+        with "prediction".
+        """
+        columns = [c for c in data if c == "probability"] or [
+            c for c in data if c.startswith("prediction")
+        ]
+        if "id" not in data or not columns:
+            raise ValueError("Submission has no id or prediction column")
+        return cls(data["id"].to_numpy(dtype=str),
+                   data[columns[0]].to_numpy(dtype=np.float64))
+
+    @property
+    def frame(self):
+        """DataFrame of the "id" and "probability" columns"""
+        return pd.DataFrame({"id": self.ids, "probability": self.predictions})
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            aligned = sum(a.nbytes for a in self._aligned.values())
+        return self.ids.nbytes + self.predictions.nbytes + aligned
+
+    def get_aligned(self, key, align):
+        """Return the array align(self.frame) computes, computed once per key
+
+        Parameters:
+        -----------
+        key : hashable
+            Name of the alignment, including everything it depends on such as
+            the dataset version
+
+        align : callable
+            Called with the frame of the submission, returns an ndarray
+        """
+        with self._lock:
+            if key in self._aligned:
+                return self._aligned[key]
+        values = align(self.frame)
+        with self._lock:
+            return self._aligned.setdefault(key, values)
+
+
+class SubmissionCache():
+    """Parsed submissions keyed by bucket, key and ETag
+
+    A submission is downloaded and parsed once, then read from memory, and
+    from disk once it was evicted from memory or the process restarted. Both
+    tiers evict the least recently used submissions past their byte budget.
+    The first read of a key is a single GET, its ETag is then asked for with
+    a HEAD every etag_ttl seconds while the submission is in memory.
+    """
+
+    def __init__(self, s3, local_dir, max_memory_bytes=MAX_MEMORY_BYTES,
+                 max_disk_bytes=MAX_DISK_BYTES, etag_ttl=ETAG_TTL):
+        """
+        Parameters:
+        -----------
+        s3 : S3.ServiceResource
+            boto3 S3 resource
+
+        local_dir : string
+            Directory of the disk tier
+
+        max_memory_bytes : int, optional, default: MAX_MEMORY_BYTES
+            Bytes of submissions kept in memory
+
+        max_disk_bytes : int, optional, default: MAX_DISK_BYTES
+            Bytes of submissions kept on disk
+
+        etag_ttl : float, optional, default: ETAG_TTL
+            Seconds the ETag of a key is trusted before it is asked for again
+        """
+        self.s3 = s3
+        self.local_dir = local_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.etag_ttl = etag_ttl
+        self._memory = collections.OrderedDict()
+        self._sizes = {}
+        self._memory_bytes = 0
+        # Bytes of the disk tier, None until it was scanned once
+        self._disk_bytes = None
+        self._etags = {}
+        self._lock = threading.Lock()
+        self._key_locks = collections.defaultdict(threading.Lock)
+        # Cache keys prefetched and not read since -> bytes
+        self._prefetched = {}
+        self._prefetched_bytes = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "downloads": 0}
+
+    def _get_etag(self, bucket, key):
+        """Return the known ETag of a key, asking S3 again once it expired
+
+        None when the key was not read yet, the ETag of the GET is used then.
+        """
+        with self._lock:
+            etag, checked = self._etags.get((bucket, key), (None, None))
+        if etag is not None and time.monotonic() - checked >= self.etag_ttl:
+            etag = self.s3.meta.client.head_object(Bucket=bucket,
+                                                   Key=key)["ETag"]
+            with self._lock:
+                self._etags[(bucket, key)] = (etag, time.monotonic())
+        return etag
+
+    def _get_path(self, bucket, key):
+        digest = hashlib.sha1("{}/{}".format(bucket, key).encode()).hexdigest()
+        return os.path.join(self.local_dir, digest + ".npz")
+
+    def get(self, bucket, key, prefetch=False):
+        """Return the SubmissionData of an S3 object
+
+        Parameters:
+        -----------
+        bucket : string
+            S3 bucket
+
+        key : string
+            Key of the submission CSV in bucket
+
+        prefetch : bool, optional, default: False
+            Whether the submission is read ahead of its use, it then counts
+            towards the prefetched bytes until it is read without prefetch or
+            evicted
+
+        Returns:
+        --------
+        submission : SubmissionData
+            Parsed submission, shared by every caller
+        """
+        etag = self._get_etag(bucket, key)
+        if etag is not None:
+            submission = self._get_memory((bucket, key, etag))
+            if submission is not None:
+                if not prefetch:
+                    self._consume((bucket, key, etag))
+                return submission
+
+        with self._lock:
+            key_lock = self._key_locks[(bucket, key)]
+        with key_lock:
+            submission = None
+            if etag is not None:
+                submission = self._get_memory((bucket, key, etag))
+            if submission is None:
+                submission, etag = self._fetch(bucket, key, etag)
+                self._put_memory((bucket, key, etag), submission, prefetch)
+        with self._lock:
+            self._key_locks.pop((bucket, key), None)
+        if not prefetch:
+            self._consume((bucket, key, etag))
+        return submission
+
+    def _fetch(self, bucket, key, etag):
+        """Read a submission from disk or S3, return it and its ETag
+
+        Without a known ETag the disk copy is only used when a GET conditional
+        on its ETag finds the object unchanged, one round trip either way.
+        """
+        cached = self._load(bucket, key)
+        if cached is not None:
+            submission, cached_etag = cached
+            if etag == cached_etag:
+                return self._disk_hit(bucket, key, submission, cached_etag)
+        kwargs = {"IfNoneMatch": cached[1]} if cached is not None else {}
+        try:
+            res = self.s3.meta.client.get_object(Bucket=bucket, Key=key,
+                                                 **kwargs)
+        except botocore.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("304",
+                                                               "NotModified"):
+                raise
+            return self._disk_hit(bucket, key, *cached)
+        submission = SubmissionData.from_frame(pd.read_csv(res["Body"]))
+        etag = res["ETag"]
+        with self._lock:
+            self._etags[(bucket, key)] = (etag, time.monotonic())
+            self._stats["downloads"] += 1
+        try:
+            self._save(self._get_path(bucket, key), submission, etag)
+        except OSError:
+            logging.exception("Could not cache submission {}".format(key))
+        return submission, etag
+
+    def _disk_hit(self, bucket, key, submission, etag):
+        os.utime(self._get_path(bucket, key))
+        with self._lock:
+            self._etags[(bucket, key)] = (etag, time.monotonic())
+            self._stats["disk_hits"] += 1
+        return submission, etag
+
+    def _consume(self, cache_key):
+        with self._lock:
+            self._prefetched_bytes -= self._prefetched.pop(cache_key, 0)
+
+    def _get_memory(self, cache_key):
+        with self._lock:
+            submission = self._memory.get(cache_key)
+            if submission is not None:
+                self._memory.move_to_end(cache_key)
+                self._stats["memory_hits"] += 1
+            return submission
+
+    def _put_memory(self, cache_key, submission, prefetch=False):
+        # Counted at insertion, arrays aligned later are not counted
+        nbytes = submission.nbytes
+        with self._lock:
+            if cache_key not in self._memory:
+                self._memory[cache_key] = submission
+                self._sizes[cache_key] = nbytes
+                self._memory_bytes += nbytes
+                if prefetch:
+                    self._prefetched[cache_key] = nbytes
+                    self._prefetched_bytes += nbytes
+            while (self._memory_bytes > self.max_memory_bytes and
+                   len(self._memory) > 1):
+                evicted, _ = self._memory.popitem(last=False)
+                self._memory_bytes -= self._sizes.pop(evicted)
+                self._prefetched_bytes -= self._prefetched.pop(evicted, 0)
+                # ETags are only kept for the submissions in memory
+                bucket_key = evicted[:2]
+                if self._etags.get(bucket_key, (None, ))[0] == evicted[2]:
+                    del self._etags[bucket_key]
+
+    def _load(self, bucket, key):
+        path = self._get_path(bucket, key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with np.load(path) as data:
+                return (SubmissionData(data["ids"], data["predictions"]),
+                        str(data["etag"]))
+        except Exception:
+            logging.exception("Could not read cached submission {}".format(path))
+            return None
+
+    def _save(self, path, submission, etag):
+        if not os.path.exists(self.local_dir):
+            os.makedirs(self.local_dir)
+        fd, temp_path = tempfile.mkstemp(dir=self.local_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, ids=submission.ids,
+                         predictions=submission.predictions, etag=etag)
+            size = os.path.getsize(temp_path)
+            replaced = os.path.getsize(path) if os.path.isfile(path) else 0
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += size - replaced
+            full = (self._disk_bytes is None or
+                    self._disk_bytes > self.max_disk_bytes)
+        if full:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Scan the disk tier and delete the oldest files past its budget"""
+        files = []
+        for entry in os.scandir(self.local_dir):
+            if entry.name.endswith(".npz"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self):
+        """Return the hits of both tiers, downloads, bytes in memory and prefetched, and known ETags"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_bytes"] = self._memory_bytes
+            stats["prefetched_bytes"] = self._prefetched_bytes
+            stats["submissions"] = len(self._memory)
+            stats["etags"] = len(self._etags)
+        return stats
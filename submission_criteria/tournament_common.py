@@ -2,18 +2,28 @@ import os
 import botocore
 import pandas as pd
 
+from submission_criteria import s3_download
+
 S3_INPUT_DATA_BUCKET = "numerai-tournament-data"
 
 
 def _download_file(s3, s3_bucket, s3_filepath, local_filepath):
     try:
-        s3.meta.client.download_file(s3_bucket, s3_filepath, local_filepath)
+        s3_download.download_file(s3.meta.client, s3_bucket, s3_filepath,
+                                  local_filepath)
     except (botocore.exceptions.ClientError,
-            botocore.exceptions.EndpointConnectionError) as e:
+            botocore.exceptions.EndpointConnectionError,
+            s3_download.DownloadError) as e:
         raise Exception(f"Error when downloading {s3_filepath}: {str(e)}")
 
 
-def get_file(s3, s3_bucket, s3_path, filename, local_path, download=True):
+def get_file(s3,
+             s3_bucket,
+             s3_path,
+             filename,
+             local_path,
+             download=True,
+             disk_cache=None):
     # make dir if it does not exist
     local_path = os.path.join(local_path, s3_path)
     if not os.path.isdir(local_path):
@@ -25,6 +35,10 @@ def get_file(s3, s3_bucket, s3_path, filename, local_path, download=True):
             f"Downloading file: s3://{s3_bucket}/{s3_filepath} to {local_filepath}"
         )
         _download_file(s3, s3_bucket, s3_filepath, local_filepath)
+        if disk_cache is not None:
+            disk_cache.add(local_filepath)
+    elif disk_cache is not None:
+        disk_cache.touch(local_filepath)
     print(f"Loading file: {local_filepath}")
     return pd.read_csv(local_filepath)
 
@@ -0,0 +1,230 @@
+"""Memory and disk cache of the validation data of every dataset version."""
+
+# System
+import os
+import logging
+import tempfile
+import threading
+import collections
+
+# Third Party
+import numpy as np
+import pandas as pd
+
+# First Party
+from submission_criteria import tournament_common as tc
+from submission_criteria.metrics import MetricsEngine
+from submission_criteria.rank_correlation import RankCorrelation
+
+# Bump whenever the contents of the cache files change
+CACHE_VERSION = 3
+# Dataset versions kept in memory
+MAX_VERSIONS = 2
+
+_versions = collections.OrderedDict()
+_versions_lock = threading.Lock()
+_version_locks = collections.defaultdict(threading.Lock)
+
+
+class ValidationData():
+    """Validation ids, eras and targets as arrays sharing one fixed id order"""
+
+    def __init__(self, ids, targets, era_names, era_codes):
+        self.ids = ids
+        self.targets = targets
+        self.target_names = tuple(sorted(targets))
+        self.era_names = era_names
+        self.era_codes = era_codes
+        self._correlations = {}
+        self._engines = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_frame(cls, data):
+        """Extract the ids, eras and every target column of validation_data.csv
+
+        Without an era column there are no eras, every era code is -1.
+        """
+        targets = {
+            c: data[c].values.astype(np.float64)
+            for c in data if c.startswith("target")
+        }
+        if "era" in data:
+            era_names, era_codes = np.unique(data["era"].to_numpy(dtype=str),
+                                             return_inverse=True)
+        else:
+            era_names, era_codes = np.array([], dtype=str), np.full(
+                len(data), -1)
+        return cls(data["id"].to_numpy(dtype=str), targets, era_names,
+                   era_codes.astype(np.int32))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get_target(self, target):
+        """Return one target column in id order"""
+        return self.targets[target]
+
+    def get_correlation(self, target):
+        """Return the RankCorrelation kernel of one target, built once
+
+        A tuple of target names gives one kernel scoring all of them at once,
+        with one column per target.
+        """
+        with self._lock:
+            if target not in self._correlations:
+                if isinstance(target, tuple):
+                    targets = np.column_stack([self.targets[t] for t in target])
+                else:
+                    targets = self.targets[target]
+                self._correlations[target] = RankCorrelation(targets)
+            return self._correlations[target]
+
+    def get_metrics_engine(self, targets):
+        """Return the MetricsEngine of a tuple of target names, built once
+
+        Raises:
+        -------
+        ValueError
+            If the validation data has no eras, which the era metrics need
+        """
+        if not len(self.era_names):
+            raise ValueError("Validation data has no eras")
+        with self._lock:
+            if targets not in self._engines:
+                self._engines[targets] = MetricsEngine(
+                    np.column_stack([self.targets[t] for t in targets]),
+                    self.era_codes, self.era_names)
+            return self._engines[targets]
+
+    def align(self, data, column="probability"):
+        """Return one column of data for every validation id in id order
+
+        Parameters:
+        -----------
+        data : DataFrame
+            Submission data holding an id column
+
+        column : string, optional, default: "probability"
+            Column to align
+
+        Returns:
+        --------
+        values : ndarray
+            Values of column ordered like the ids
+
+        Raises:
+        -------
+        IndexError
+            If data does not cover every validation id
+        """
+        positions = pd.Index(data["id"].values).get_indexer(self.ids)
+        missing = np.count_nonzero(positions < 0)
+        if missing:
+            raise IndexError("Data is missing {} of the {} validation ids".format(
+                missing, len(self.ids)))
+        return data[column].values[positions]
+
+
+def get_path(local_dir, dataset_version):
+    """Return the cache file of a dataset version"""
+    return os.path.join(local_dir, "validation_data",
+                        "{}-v{}.npz".format(dataset_version, CACHE_VERSION))
+
+
+def save(path, validation_data):
+    """Atomically write validation data to a cache file"""
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".npz.tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f,
+                     ids=validation_data.ids,
+                     era_names=validation_data.era_names,
+                     era_codes=validation_data.era_codes,
+                     **validation_data.targets)
+        os.replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def load(path):
+    """Read validation data from a cache file, None when there is no usable file"""
+    if not os.path.isfile(path):
+        return None
+    try:
+        with np.load(path) as data:
+            return ValidationData(
+                data["ids"], {
+                    key: data[key]
+                    for key in data.files if key.startswith("target")
+                }, data["era_names"], data["era_codes"])
+    except Exception:
+        logging.exception("Could not read validation cache {}".format(path))
+        return None
+
+
+def get_validation_data(filemanager, dataset_version):
+    """Return the validation data of a dataset version
+
+    The data is read from memory, then from the cache file under the local
+    directory of filemanager, and only then from S3, at most once per process
+    and dataset version.
+
+    Parameters:
+    -----------
+    filemanager : FileManager
+        S3 Bucket data access object, its local_dir holds the cache files
+
+    dataset_version : string
+        Dataset version of the round, see round_dataset.get_dataset_version
+
+    Returns:
+    --------
+    validation_data : ValidationData
+        Validation ids and targets of the dataset version
+    """
+    with _versions_lock:
+        if dataset_version in _versions:
+            _versions.move_to_end(dataset_version)
+            return _versions[dataset_version]
+        version_lock = _version_locks[dataset_version]
+
+    with version_lock:
+        with _versions_lock:
+            validation_data = _versions.get(dataset_version)
+        if validation_data is None:
+            path = get_path(filemanager.local_dir, dataset_version)
+            validation_data = load(path)
+            if validation_data is None:
+                validation_data = ValidationData.from_frame(
+                    tc.get_validation_data(filemanager.s3, dataset_version))
+                save(path, validation_data)
+                filemanager.disk_cache.add(path)
+            else:
+                filemanager.disk_cache.touch(path)
+            logging.getLogger().info(
+                "Loaded validation data of dataset version {}".format(
+                    dataset_version))
+
+    with _versions_lock:
+        _versions[dataset_version] = validation_data
+        _versions.move_to_end(dataset_version)
+        while len(_versions) > MAX_VERSIONS:
+            _versions.popitem(last=False)
+    return validation_data
+
+
+def invalidate(dataset_version=None):
+    """Drop the validation data of a dataset version from memory, of every one when None
+
+    The cache files are kept. Return the number of dataset versions dropped.
+    """
+    with _versions_lock:
+        keys = [k for k in _versions if dataset_version in (None, k)]
+        for key in keys:
+            del _versions[key]
+        return len(keys)
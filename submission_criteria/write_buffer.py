@@ -0,0 +1,403 @@
+"""Write-behind buffer batching the score and concordance writes of submissions."""
+
+# System
+import time
+import logging
+import threading
+import collections
+
+# Third Party
+import psycopg2.extras
+
+TARGET_METRICS_TABLE = "submission_target_metrics"
+# Metrics of every submission for every target, written when SCORE_ALL_TARGETS
+# is set, one column per metric of metrics.METRICS
+TARGET_METRICS_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    submission_id uuid NOT NULL REFERENCES submissions(id) ON DELETE CASCADE,
+    target text NOT NULL,
+    validation_correlation double precision,
+    consistency double precision,
+    sharpe double precision,
+    max_drawdown double precision,
+    PRIMARY KEY (submission_id, target)
+)
+""".format(table=TARGET_METRICS_TABLE)
+# Buffered results that trigger a flush
+MAX_RESULTS = 500
+# Seconds a result waits in the buffer at most
+MAX_DELAY = 1.0
+# Buffered results beyond which new results are refused
+MAX_PENDING = 50000
+# Failed writes of a result before it is moved to the dead letters
+MAX_ATTEMPTS = 5
+# Dead letters kept for inspection, the oldest are dropped
+MAX_DEAD_LETTERS = 1000
+# Kinds of results in the order they are written, the pending concordance rows
+# first as the concordances update them
+KINDS = ("pending_concordances", "submissions", "concordances",
+         "target_metrics")
+# Errors of the connection rather than of the results written
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+def create_target_metrics_table(postgres_db):
+    """Create TARGET_METRICS_TABLE and its key unless they exist
+
+    The primary key is the conflict target of the upserts of the metrics.
+    """
+    cursor = postgres_db.cursor()
+    cursor.execute(TARGET_METRICS_DDL)
+    postgres_db.commit()
+    cursor.close()
+
+
+class WriteBuffer():
+    """Collects submission results and writes them as a few bulk statements
+
+    Results are merged per submission, a later value of a column replacing an
+    earlier one, and flushed in one transaction once MAX_RESULTS are buffered,
+    every MAX_DELAY seconds and on close. Every kind of write is a single
+    execute_values statement however many submissions are flushed, so a round
+    close commits a few times per second instead of several times per
+    submission. Results buffered when the process dies are lost and the
+    submissions have to be rescored.
+
+    When a flush fails because of the results rather than the connection,
+    every kind of result is written in its own transaction and the kind that
+    failed one result at a time, so one bad result does not hold back the
+    others. A result failing max_attempts flushes is logged and moved to the
+    dead letters. The buffer holds max_pending results at most, further
+    results are refused with a RuntimeError once a flush did not make room.
+    """
+
+    def __init__(self, pool, max_results=MAX_RESULTS, max_delay=MAX_DELAY,
+                 max_pending=MAX_PENDING, max_attempts=MAX_ATTEMPTS):
+        """
+        Parameters:
+        -----------
+        pool : ConnectionPool
+            Pool the flushes check a connection out of
+
+        max_results : int, optional, default: MAX_RESULTS
+            Buffered results that trigger a flush, by the flush thread once
+            started and by the caller otherwise
+
+        max_delay : float, optional, default: MAX_DELAY
+            Seconds between flushes of the flush thread
+
+        max_pending : int, optional, default: MAX_PENDING
+            Buffered results beyond which new results are refused
+
+        max_attempts : int, optional, default: MAX_ATTEMPTS
+            Failed writes of a result before it is moved to the dead letters
+        """
+        self.pool = pool
+        self.max_results = max_results
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+        self._pending = self._empty()
+        # (kind, key) -> failed writes of the result
+        self._attempts = {}
+        self._dead_letters = collections.deque(maxlen=MAX_DEAD_LETTERS)
+        self._stats = {
+            "results": 0,
+            "written": 0,
+            "failed": 0,
+            "flushes": 0,
+            "flush_time": 0.0,
+        }
+
+    @staticmethod
+    def _empty():
+        return {
+            # submission id -> {column: value} of the submissions table
+            "submissions": {},
+            # (submission id, target) -> {column: value} of TARGET_METRICS_TABLE
+            "target_metrics": {},
+            # submission ids that get a pending concordance row
+            "pending_concordances": {},
+            # submission id -> concordance
+            "concordances": {},
+        }
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(p) for p in self._pending.values())
+
+    def _count(self):
+        return sum(len(p) for p in self._pending.values())
+
+    def _add(self, kind, key, values):
+        with self._lock:
+            full = self._count() >= self.max_pending
+        if full:
+            # Make room in the caller, the flush thread failed to
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("Could not flush the full write buffer.")
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Write buffer is closed")
+            pending = self._pending[kind]
+            if key not in pending and self._count() >= self.max_pending:
+                raise RuntimeError("Write buffer is full")
+            if isinstance(values, dict):
+                pending.setdefault(key, {}).update(values)
+            else:
+                pending[key] = values
+            self._stats["results"] += 1
+            full = self._count() >= self.max_results
+        if full:
+            if self._thread is None:
+                self.flush()
+            else:
+                self._wake.set()
+
+    def update_submission(self, submission_id, **values):
+        """Buffer columns of the submissions table, e.g. consistency=50.0"""
+        self._add("submissions", submission_id,
+                  {column: float(value) for column, value in values.items()})
+
+    def write_target_metrics(self, submission_id, targets, values):
+        """Buffer the metrics of a submission for many targets
+
+        Parameters:
+        -----------
+        submission_id : string
+            ID of the submission
+
+        targets : list
+            Target names
+
+        values : dictionary
+            Value of every target for every column of TARGET_METRICS_TABLE to
+            write, e.g. "validation_correlation"
+        """
+        for i, target in enumerate(targets):
+            self._add("target_metrics", (submission_id, target),
+                      {column: float(values[column][i]) for column in values})
+
+    def add_pending_concordance(self, submission_id):
+        """Buffer a pending concordance row, kept if the submission has one"""
+        self._add("pending_concordances", submission_id, True)
+
+    def write_concordance(self, submission_id, concordance):
+        """Buffer the concordance of a submission"""
+        self._add("concordances", submission_id, bool(concordance))
+
+    def flush(self):
+        """Write every buffered result, in one transaction unless some fail
+
+        Results that failed to write are put back into the buffer, behind the
+        ones buffered in the meantime, or moved to the dead letters after
+        max_attempts. A connection error is raised, keeping every result that
+        was not committed yet.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, self._empty()
+            if not any(pending.values()):
+                return
+            start = time.monotonic()
+            total = sum(len(p) for p in pending.values())
+            keys = {kind: list(entries) for kind, entries in pending.items()}
+            failed = {}
+            try:
+                with self.pool.connection() as postgres_db:
+                    self._write_all(postgres_db, pending, failed)
+            except Exception:
+                # pending and failed hold whatever was not committed
+                for kind, entries in failed.items():
+                    for key, (values, _) in entries.items():
+                        pending[kind][key] = values
+                self._requeue(pending)
+                raise
+            self._requeue(failed, count_attempt=True)
+            with self._lock:
+                if self._attempts:
+                    # Forget the failures of the results written this time
+                    for kind, entries in keys.items():
+                        for key in entries:
+                            if key not in failed.get(kind, {}):
+                                self._attempts.pop((kind, key), None)
+            written = total - sum(len(f) for f in failed.values())
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self._stats["flushes"] += 1
+                self._stats["flush_time"] += elapsed
+                self._stats["written"] += written
+            logging.getLogger().info(
+                "Flushed {} buffered results in {:.3f}s, {} failed".format(
+                    written, elapsed, sum(len(f) for f in failed.values())))
+
+    def _write_all(self, postgres_db, pending, failed):
+        """Write pending, moving what failed to write into failed
+
+        Results are removed from pending once committed, failed receives
+        kind -> {key: (values, error)} of the results that failed themselves.
+        """
+        if self._commit(postgres_db, pending) is None:
+            for entries in pending.values():
+                entries.clear()
+            return
+        for kind in KINDS:
+            entries = pending[kind]
+            if not entries or self._commit(postgres_db,
+                                           {kind: entries}) is None:
+                entries.clear()
+                continue
+            for key in list(entries):
+                error = self._commit(postgres_db, {kind: {key: entries[key]}})
+                if error is not None:
+                    failed.setdefault(kind, {})[key] = (entries[key], error)
+                del entries[key]
+
+    def _commit(self, postgres_db, pending):
+        """Write pending in one transaction, return the error if it failed
+
+        Connection errors are raised.
+        """
+        cursor = postgres_db.cursor()
+        try:
+            self._write(cursor, pending)
+            postgres_db.commit()
+            return None
+        except CONNECTION_ERRORS:
+            raise
+        except psycopg2.Error as e:
+            postgres_db.rollback()
+            return e
+        finally:
+            cursor.close()
+
+    def _requeue(self, pending, count_attempt=False):
+        """Put results back into the buffer, newer values taking precedence
+
+        With count_attempt, pending maps kind -> {key: (values, error)} of
+        results that failed to write themselves, and the attempt is counted.
+        """
+        with self._lock:
+            for kind, entries in pending.items():
+                for key, values in entries.items():
+                    if count_attempt:
+                        values, error = values
+                        attempts = self._attempts.get((kind, key), 0) + 1
+                        self._stats["failed"] += 1
+                        if attempts >= self.max_attempts:
+                            self._attempts.pop((kind, key), None)
+                            self._dead_letters.append(
+                                (kind, key, values, str(error)))
+                            logging.getLogger().error(
+                                "Giving up writing {} {}: {}".format(
+                                    kind, key, error))
+                            continue
+                        self._attempts[(kind, key)] = attempts
+                    newer = self._pending[kind].get(key)
+                    if isinstance(newer, dict):
+                        values = dict(values, **newer)
+                    elif newer is not None:
+                        values = newer
+                    self._pending[kind][key] = values
+
+    @staticmethod
+    def _write(cursor, pending):
+        # Pending rows go first, the concordances update them
+        if pending.get("pending_concordances"):
+            psycopg2.extras.execute_values(
+                cursor,
+                "INSERT INTO concordances(pending, submission_id) VALUES %s ON CONFLICT (submission_id) DO NOTHING",
+                [(submission_id, ) for submission_id in pending["pending_concordances"]],
+                template="(TRUE, %s::uuid)")
+        for columns, rows in _group_by_columns(pending.get("submissions", {})):
+            query = """
+                UPDATE submissions AS s SET {updates}
+                FROM (VALUES %s) AS v(id, {columns})
+                WHERE s.id = v.id::uuid
+                """.format(updates=", ".join("{0} = v.{0}".format(c)
+                                             for c in columns),
+                           columns=", ".join(columns))
+            psycopg2.extras.execute_values(cursor, query, rows)
+        if pending.get("concordances"):
+            psycopg2.extras.execute_values(
+                cursor, """
+                UPDATE concordances AS c SET pending = FALSE, value = v.value
+                FROM (VALUES %s) AS v(submission_id, value)
+                WHERE c.submission_id = v.submission_id::uuid
+                """, list(pending["concordances"].items()))
+        for columns, rows in _group_by_columns(
+                pending.get("target_metrics", {})):
+            query = """
+                INSERT INTO {table} (submission_id, target, {columns}) VALUES %s
+                ON CONFLICT (submission_id, target) DO UPDATE SET {updates}
+                """.format(table=TARGET_METRICS_TABLE,
+                           columns=", ".join(columns),
+                           updates=", ".join("{0} = EXCLUDED.{0}".format(c)
+                                             for c in columns))
+            psycopg2.extras.execute_values(cursor, query, rows)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.max_delay)
+            self._wake.clear()
+            with self._lock:
+                closed = self._closed
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("Could not flush buffered results.")
+            if closed:
+                return
+
+    def start(self):
+        """Start the thread flushing the buffer in the background"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return self
+
+    def close(self):
+        """Stop buffering and write what is left"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._wake.set()
+            thread.join()
+        self.flush()
+
+    def dead_letters(self):
+        """Return the (kind, key, values, error) of the results given up on"""
+        with self._lock:
+            return list(self._dead_letters)
+
+    def stats(self):
+        """Return the number of buffered, written and failed results, and flushes"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["pending"] = len(self)
+        stats["dead_letters"] = len(self.dead_letters())
+        return stats
+
+
+def _group_by_columns(entries):
+    """Group {key: {column: value}} into (columns, rows) of the same columns
+
+    Every row starts with the key, or with the items of a tuple key, followed
+    by the values of the columns.
+    """
+    groups = {}
+    for key, values in entries.items():
+        columns = tuple(sorted(values))
+        key = key if isinstance(key, tuple) else (key, )
+        groups.setdefault(columns, []).append(
+            key + tuple(values[c] for c in columns))
+    return list(groups.items())
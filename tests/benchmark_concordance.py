@@ -6,21 +6,50 @@ import bz2
 import os
 import time
 import random
+import statistics
 from multiprocessing import Pool
 
 # Third Party
 import pandas as pd
 import numpy as np
 import randomstate as rnd
+from scipy.stats import ks_2samp
 
 # First Party
 from benchmark_base import Benchmark
-from submission_criteria.concordance import get_competition_variables_from_df, has_concordance, get_sorted_split
+from submission_criteria.concordance import get_competition_variables_from_df, has_concordance
+from submission_criteria.id_index import IdIndex
 
 N_SAMPLES = 100 * 1000
 N_RUNS = 250
 
 
+def has_concordance_scipy(P1, P2, P3, c1, c2, c3, threshold=0.12):
+    """Reference implementation with one ks_2samp call per cluster and pair"""
+    ks = []
+    for i in set(c1):
+        ks_score = max(
+            ks_2samp(P1.reshape(-1)[c1 == i],
+                     P2.reshape(-1)[c2 == i])[0],
+            ks_2samp(P1.reshape(-1)[c1 == i],
+                     P3.reshape(-1)[c3 == i])[0],
+            ks_2samp(P3.reshape(-1)[c3 == i],
+                     P2.reshape(-1)[c2 == i])[0])
+        ks.append(ks_score)
+    return np.mean(ks) < threshold
+
+
+def scipy_concordance(p1, p2, p3, clusters):
+    c1, c2, c3 = clusters['cluster_1'], clusters['cluster_2'], clusters[
+        'cluster_3']
+    return has_concordance_scipy(p1, p2, p3, c1, c2, c3)
+
+
+def vectorized_concordance(p1, p2, p3, clusters):
+    layouts = clusters['layout_1'], clusters['layout_2'], clusters['layout_3']
+    return has_concordance(p1, p2, p3, *layouts)
+
+
 class BenchmarkConcordance(Benchmark):
     @staticmethod
     def load_data():
@@ -101,14 +130,10 @@ class BenchmarkConcordance(Benchmark):
         return new_df
 
     @staticmethod
-    def check_concordance(submission, clusters, ids):
+    def check_concordance(submission, clusters, id_index, concordance_fn=vectorized_concordance):
         t0 = time.time()
-        ids_valid, ids_test, ids_live = ids['valid'], ids['test'], ids['live']
-        p1, p2, p3 = get_sorted_split(submission, ids_valid, ids_test,
-                                      ids_live)
-        c1, c2, c3 = clusters['cluster_1'], clusters['cluster_2'], clusters[
-            'cluster_3']
-        has_concordance(p1, p2, p3, c1, c2, c3)
+        p1, p2, p3 = id_index.get_sorted_split(submission)
+        concordance_fn(p1, p2, p3, clusters)
         t1 = time.time()
         return (t1 - t0) * 1000
 
@@ -137,14 +162,22 @@ class BenchmarkConcordance(Benchmark):
         clusters = get_competition_variables_from_df(
             '1', train_data, predict_data, ids['valid'], ids['test'],
             ids['live'])
-
-        with Pool(pool_size) as pool:
-            times = pool.starmap(self.check_concordance,
-                                 [(submission_data, clusters, ids)
-                                  for _ in range(N_RUNS)])
-
-        self.log('benchmark finished in %.2fs' % (sum(times) / 1000))
-        self.log('[per iteration] %s' % self.format_stats(times, unit='ms'))
+        id_index = IdIndex(ids['valid'], ids['test'], ids['live'])
+
+        medians = dict()
+        for name, concordance_fn in [('scipy', scipy_concordance),
+                                     ('vectorized', vectorized_concordance)]:
+            with Pool(pool_size) as pool:
+                times = pool.starmap(self.check_concordance,
+                                     [(submission_data, clusters, id_index,
+                                       concordance_fn)
+                                      for _ in range(N_RUNS)])
+
+            medians[name] = statistics.median(times)
+            self.log('[%s] benchmark finished in %.2fs' % (name, sum(times) / 1000))
+            self.log('[%s] [per iteration] %s' % (name, self.format_stats(times, unit='ms')))
+
+        self.log('speedup of median: %.2fx' % (medians['scipy'] / medians['vectorized']))
 
 
 def main():
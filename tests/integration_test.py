@@ -31,9 +31,9 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(sys.argv[0])))
 from tests.testing_api import NumerAPI
 
 # the methods we're testing
-from submission_criteria.concordance import get_sorted_split
 from submission_criteria.concordance import has_concordance
 from submission_criteria.concordance import get_competition_variables_from_df
+from submission_criteria.id_index import IdIndex
 
 DATA_SET_PATH = 'tests/numerai_datasets'
 DATA_SET_FILE = 'numerai_dataset'
@@ -71,6 +71,7 @@ class NumeraiApiWrapper(NumerAPI):
         self.checked = set()
         self.cluster_ids = dict()
         self.clusters = dict()
+        self.id_index = None
         self.futures = dict()
 
     def set_data(self, tournament_data, training_data):
@@ -88,6 +89,9 @@ class NumeraiApiWrapper(NumerAPI):
         self.clusters = get_competition_variables_from_df(
             '1', training_data, tournament_data, self.cluster_ids['valid'],
             self.cluster_ids['test'], self.cluster_ids['live'])
+        self.id_index = IdIndex(self.cluster_ids['valid'],
+                                self.cluster_ids['test'],
+                                self.cluster_ids['live'])
 
     def upload_predictions(self, file_path):
         sub_id = str(uuid())
@@ -97,13 +101,10 @@ class NumeraiApiWrapper(NumerAPI):
 
     def check_concordance(self, submission_file_path):
         submission = pd.read_csv(submission_file_path)
-        ids_valid, ids_test, ids_live = self.cluster_ids[
-            'valid'], self.cluster_ids['test'], self.cluster_ids['live']
-        p1, p2, p3 = get_sorted_split(submission, ids_valid, ids_test,
-                                      ids_live)
-        c1, c2, c3 = self.clusters['cluster_1'], self.clusters[
-            'cluster_2'], self.clusters['cluster_3']
-        has_it = has_concordance(p1, p2, p3, c1, c2, c3)
+        p1, p2, p3 = self.id_index.get_sorted_split(submission)
+        layouts = self.clusters['layout_1'], self.clusters[
+            'layout_2'], self.clusters['layout_3']
+        has_it = has_concordance(p1, p2, p3, *layouts)
         # logger.info('submission %s has concordance? %s' % (submission_file_path, str(has_it)))
         return has_it
 
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+"""Concordance Unit Testing."""
+
+# System
+import os
+import tempfile
+from unittest import mock
+
+# Third Party
+import unittest
+import numpy as np
+import pandas as pd
+from scipy.stats import ks_2samp
+
+# First Party
+from submission_criteria.ks_statistic import ks_statistics, PAIRS
+from submission_criteria.concordance import make_cluster_layout, ks_score, batch_ks_scores
+from submission_criteria.concordance import get_competition_variables_from_csv
+from submission_criteria.concordance import get_competition_variables_from_quantized
+from submission_criteria.quantized import QuantizedMatrix
+from submission_criteria.id_index import IdIndex
+from submission_criteria import cluster_artifacts
+from submission_criteria import concordance
+
+
+class TestKSStatistics(unittest.TestCase):
+    n_clusters = 5
+
+    def random_splits(self, seed, decimals):
+        rng = np.random.RandomState(seed)
+        sizes = rng.randint(10, 2000, size=3)
+        samples = [np.round(rng.rand(n), decimals) for n in sizes]
+        labels = [rng.randint(0, self.n_clusters, size=n) for n in sizes]
+        return samples, labels
+
+    def assert_matches_scipy(self, samples, labels):
+        statistics = ks_statistics(samples, labels, self.n_clusters)
+        self.assertEqual(statistics.shape, (len(PAIRS), self.n_clusters))
+        for p, (a, b) in enumerate(PAIRS):
+            for i in range(self.n_clusters):
+                expected = ks_2samp(samples[a][labels[a] == i],
+                                    samples[b][labels[b] == i])[0]
+                self.assertAlmostEqual(statistics[p, i], expected, places=12)
+
+    def test_matches_scipy(self):
+        for seed in range(5):
+            self.assert_matches_scipy(*self.random_splits(seed, decimals=10))
+
+    def test_matches_scipy_with_ties(self):
+        for seed in range(5):
+            self.assert_matches_scipy(*self.random_splits(seed, decimals=2))
+
+    def test_empty_cluster(self):
+        samples, labels = self.random_splits(0, decimals=10)
+        labels[1][labels[1] == 3] = 2
+        statistics = ks_statistics(samples, labels, self.n_clusters)
+        self.assertTrue(np.isnan(statistics[0, 3]))
+        self.assertTrue(np.isnan(statistics[2, 3]))
+        self.assertFalse(np.isnan(statistics[1, 3]))
+
+
+class TestClusterLayout(unittest.TestCase):
+    def test_layout_groups_clusters(self):
+        rng = np.random.RandomState(0)
+        c = rng.randint(0, 5, size=1000)
+        layout = make_cluster_layout(c)
+        self.assertEqual(layout["order"].dtype, np.int32)
+        self.assertEqual(layout["labels"].dtype, np.uint8)
+        self.assertEqual(layout["offsets"].dtype, np.int32)
+        for i in range(5):
+            start, end = layout["offsets"][i], layout["offsets"][i + 1]
+            np.testing.assert_array_equal(
+                np.sort(layout["order"][start:end]), np.flatnonzero(c == i))
+
+    def test_ks_score_matches_unstructured(self):
+        rng = np.random.RandomState(1)
+        sizes = [900, 1100, 700]
+        samples = [rng.rand(n) for n in sizes]
+        labels = [rng.randint(0, 5, size=n) for n in sizes]
+        layouts = [make_cluster_layout(c) for c in labels]
+        expected = np.mean(ks_statistics(samples, labels, 5).max(axis=0))
+        self.assertAlmostEqual(ks_score(*samples, layouts), expected, places=12)
+
+    def test_batch_matches_single(self):
+        rng = np.random.RandomState(2)
+        sizes = [900, 1100, 700]
+        labels = [rng.randint(0, 5, size=n) for n in sizes]
+        layouts = [make_cluster_layout(c) for c in labels]
+        P1, P2, P3 = [np.round(rng.rand(6, n), 2) for n in sizes]
+        for max_values in [1, 10000, 1 << 20]:
+            scores = batch_ks_scores(P1, P2, P3, layouts, max_values=max_values)
+            for row, score in enumerate(scores):
+                self.assertAlmostEqual(
+                    score,
+                    ks_score(P1[row], P2[row], P3[row], layouts),
+                    places=12)
+
+    def test_has_concordance_takes_labels_or_layouts(self):
+        rng = np.random.RandomState(3)
+        sizes = [900, 1100, 700]
+        samples = [rng.rand(n) for n in sizes]
+        labels = [rng.randint(0, 5, size=n) for n in sizes]
+        layouts = [make_cluster_layout(c) for c in labels]
+        score = ks_score(*samples, layouts)
+        for threshold in [score - 1e-9, score + 1e-9]:
+            self.assertEqual(
+                concordance.has_concordance(*samples, *labels,
+                                            threshold=threshold),
+                score < threshold)
+            self.assertEqual(
+                concordance.has_concordance(*samples, *layouts,
+                                            threshold=threshold),
+                score < threshold)
+
+    def test_ks_score_rejects_misaligned_split(self):
+        c = np.zeros(10, dtype=int)
+        layouts = [make_cluster_layout(c)] * 3
+        with self.assertRaises(IndexError):
+            ks_score(np.zeros(9), np.zeros(10), np.zeros(10), layouts)
+
+
+class TestIdIndex(unittest.TestCase):
+    def make_data(self, seed):
+        rng = np.random.RandomState(seed)
+        ids = np.array(["n{:06d}".format(i) for i in rng.permutation(600)],
+                       dtype=object)
+        data_type = rng.choice(["validation", "test", "live"], size=len(ids))
+        data = pd.DataFrame({
+            "id": ids,
+            "data_type": data_type,
+            "probability": rng.rand(len(ids)),
+        })
+        split_ids = [ids[data_type == t] for t in ["validation", "test", "live"]]
+        return data, split_ids
+
+    def test_sorted_split_matches_sort_values(self):
+        data, split_ids = self.make_data(0)
+        id_index = IdIndex(*split_ids)
+        shuffled = data.sample(frac=1, random_state=1)
+        for split, ids in zip(id_index.get_sorted_split(shuffled), split_ids):
+            expected = data[data["id"].isin(ids)].sort_values("id")
+            np.testing.assert_array_equal(split,
+                                          expected[["probability"]].values)
+
+    def test_missing_ids(self):
+        data, split_ids = self.make_data(0)
+        id_index = IdIndex(*split_ids)
+        self.assertEqual(id_index.get_codes(["unknown"])[0], -1)
+        with self.assertRaises(IndexError):
+            id_index.get_sorted_split(data.iloc[1:])
+
+
+class TestClusterArtifacts(unittest.TestCase):
+    def test_round_trip(self):
+        rng = np.random.RandomState(0)
+        variables = {
+            "centroids": rng.rand(5, 10),
+            "cluster_1": rng.randint(0, 5, size=100),
+            "cluster_2": rng.randint(0, 5, size=200),
+            "cluster_3": rng.randint(0, 5, size=50),
+        }
+        with tempfile.TemporaryDirectory() as local_dir:
+            path = cluster_artifacts.get_path(local_dir, 8, 190, "abc123")
+            self.assertIsNone(cluster_artifacts.load(path))
+            cluster_artifacts.save(path, variables)
+            self.assertEqual(os.listdir(os.path.dirname(path)),
+                             [os.path.basename(path)])
+            artifact = cluster_artifacts.load(path)
+            for key, value in variables.items():
+                np.testing.assert_array_equal(artifact[key], value)
+
+
+class TestStreamingClusters(unittest.TestCase):
+    def make_data(self, rng, n, data_types):
+        data = pd.DataFrame({
+            "id": ["n{:06d}".format(i) for i in rng.permutation(n)],
+            "era": "era1",
+            "data_type": rng.choice(data_types, size=n),
+            "target": rng.randint(0, 2, size=n),
+        })
+        for i in range(10):
+            data["feature{}".format(i)] = rng.choice([0, 0.25, 0.5, 0.75, 1], size=n)
+        return data
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.training = self.make_data(rng, 3000, ["train"])
+        self.tournament = self.make_data(rng, 2000,
+                                         ["validation", "test", "live"])
+        self.id_index = IdIndex(*[
+            self.tournament["id"][self.tournament["data_type"] == t].values
+            for t in ["validation", "test", "live"]
+        ])
+
+    def assert_labels_follow_centroids(self, variables):
+        centroids = variables["centroids"]
+        for i, X in enumerate(self.id_index.get_sorted_split(self.tournament),
+                              1):
+            distances = ((X[:, None, :] - centroids[None]) ** 2).sum(axis=2)
+            np.testing.assert_array_equal(variables["cluster_{}".format(i)],
+                                          distances.argmin(axis=1))
+
+    def test_csv_labels_follow_centroids(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            training_path = os.path.join(data_dir, "training.csv")
+            tournament_path = os.path.join(data_dir, "tournament.csv")
+            self.training.to_csv(training_path, index=False)
+            self.tournament.to_csv(tournament_path, index=False)
+            variables = get_competition_variables_from_csv(
+                "1", training_path, tournament_path, self.id_index,
+                chunk_size=300)
+        self.assert_labels_follow_centroids(variables)
+
+    def test_quantized_labels_follow_centroids(self):
+        f = [c for c in self.tournament if "feature" in c]
+        training = QuantizedMatrix.from_values(self.training[f].values)
+        tournament = QuantizedMatrix.from_values(self.tournament[f].values)
+        for chunk_size in [0, 300]:
+            variables = get_competition_variables_from_quantized(
+                "1", training, tournament, self.tournament["id"].values,
+                self.id_index, chunk_size)
+            self.assert_labels_follow_centroids(variables)
+
+    def test_quantized_empty_tournament(self):
+        f = [c for c in self.tournament if "feature" in c]
+        training = QuantizedMatrix.from_values(self.training[f].values)
+        tournament = QuantizedMatrix.from_values(
+            self.tournament[f].values[:0])
+        variables = get_competition_variables_from_quantized(
+            "1", training, tournament, np.array([], dtype=object),
+            IdIndex([], [], []))
+        self.assertEqual(len(variables["cluster_1"]), 0)
+
+
+class TestSubmissionConcordance(unittest.TestCase):
+    def setUp(self):
+        self.db_manager = mock.Mock()
+        self.filemanager = mock.Mock()
+        self.context = {
+            "tournament": 8,
+            "round_number": 190,
+            "dataset_path": "20200101/numerai_datasets.zip",
+        }
+        for name, value in [
+            ("common.get_submission_context", self.context),
+            ("round_dataset.get_round_dataset", mock.Mock()),
+            ("round_dataset.invalidate", None),
+            ("get_round_clusters", mock.MagicMock()),
+            ("get_submission_pieces", (None, None, None)),
+        ]:
+            patcher = mock.patch("submission_criteria.concordance." + name,
+                                 return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def score(self, side_effect):
+        with mock.patch.object(concordance, "has_concordance",
+                               side_effect=side_effect) as has_concordance:
+            concordance.submission_concordance({"submission_id": "a"},
+                                               self.db_manager,
+                                               self.filemanager)
+        return has_concordance
+
+    def test_retry_after_round_restart(self):
+        self.filemanager.revalidate_dataset.return_value = False
+        has_concordance = self.score([IndexError(), True])
+        self.assertEqual(has_concordance.call_count, 2)
+        self.filemanager.revalidate_dataset.assert_called_once_with(
+            8, 190, force=True)
+        concordance.round_dataset.invalidate.assert_called_once_with(8, 190)
+        self.db_manager.write_concordance.assert_called_once_with("a", True)
+
+    def test_misaligned_submission(self):
+        self.filemanager.revalidate_dataset.return_value = True
+        with self.assertRaises(IndexError):
+            self.score(IndexError())
+        self.db_manager.write_concordance.assert_not_called()
+
+
+class TestBatchConcordance(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        ids = np.array(["n{:06d}".format(i) for i in range(300)], dtype=object)
+        self.id_index = IdIndex(ids[:100], ids[100:200], ids[200:])
+        self.layouts = tuple(
+            make_cluster_layout(rng.randint(0, 5, size=100)) for _ in range(3))
+        self.frames = {
+            "a.csv": pd.DataFrame({"id": ids, "probability": rng.rand(300)}),
+            "b.csv": pd.DataFrame({"id": ids, "probability": rng.rand(300)}),
+            "missing.csv": pd.DataFrame({"id": ids[1:],
+                                         "probability": rng.rand(299)}),
+        }
+        self.db_manager = mock.Mock()
+        self.filemanager = mock.Mock()
+        self.filemanager.read_submission.side_effect = lambda s3_file: (
+            mock.Mock(frame=self.frames[s3_file]))
+        dataset = mock.Mock(id_index=self.id_index)
+        for name, kwargs in [
+            ("common.get_submission_context",
+             dict(side_effect=self.get_submission_context)),
+            ("round_dataset.get_round_dataset", dict(return_value=dataset)),
+            ("get_round_clusters", dict(return_value={
+                "layout_{}".format(i + 1): layout
+                for i, layout in enumerate(self.layouts)
+            })),
+        ]:
+            patcher = mock.patch("submission_criteria.concordance." + name,
+                                 **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def get_submission_context(submission, _pool=None):
+        return {
+            "tournament": submission.get("tournament", 8),
+            "round_number": 190,
+            "dataset_path": "20200101/numerai_datasets.zip",
+            "s3_file": submission["submission_id"] + ".csv",
+        }
+
+    def test_batch_matches_single(self):
+        submissions = [{"submission_id": i} for i in ["a", "missing", "b"]]
+        scores, scored = concordance.batch_submission_concordance(
+            submissions, 8, 190, self.db_manager, self.filemanager,
+            batch_size=2)
+        np.testing.assert_array_equal(scored, [True, False, True])
+        self.assertTrue(np.isnan(scores[1]))
+        for row in [0, 2]:
+            P1, P2, P3 = self.id_index.get_sorted_split(
+                self.frames[submissions[row]["submission_id"] + ".csv"])
+            self.assertAlmostEqual(scores[row],
+                                   ks_score(P1, P2, P3, self.layouts))
+        submission_ids, _ = self.db_manager.write_concordances.call_args[0]
+        self.assertEqual(submission_ids, ["a", "b"])
+
+    def test_unaligned_submissions_scored_alone(self):
+        submissions = [{"submission_id": "a"}, {"submission_id": "missing"},
+                       {"submission_id": "b", "tournament": 9}]
+        with mock.patch.object(concordance, "submission_concordance",
+                               side_effect=[IndexError(), None]) as single:
+            failed = concordance.score_concordances(
+                submissions, self.db_manager, self.filemanager)
+        self.assertEqual([call[0][0] for call in single.call_args_list],
+                         submissions[1:])
+        self.assertEqual(failed, [submissions[1]])
+        submission_ids, _ = self.db_manager.write_concordances.call_args[0]
+        self.assertEqual(submission_ids, ["a"])
+
+    def test_nan_score_is_not_rescored(self):
+        submissions = [{"submission_id": "a"}, {"submission_id": "b"}]
+        with mock.patch.object(concordance, "submission_concordance") as single, \
+                mock.patch.object(concordance, "batch_ks_scores",
+                                  return_value=np.array([np.nan, 0.0])):
+            failed = concordance.score_concordances(
+                submissions, self.db_manager, self.filemanager)
+        single.assert_not_called()
+        self.assertEqual(failed, [])
+        self.db_manager.write_concordances.assert_called_once_with(
+            ["a", "b"], [False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""Disk Cache Unit Testing."""
+
+# System
+import os
+import tempfile
+from unittest import mock
+
+# Third Party
+import unittest
+import botocore
+
+# First Party
+from submission_criteria import disk_cache
+from submission_criteria import file_manager
+from submission_criteria.disk_cache import DiskCache
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.time = 1000.0
+        patcher = mock.patch("time.time", side_effect=lambda: self.time)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def write(self, path, size=100):
+        path = os.path.join(self.root.name, path)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(b"0" * size)
+        self.time += 1
+        return path
+
+    def test_lru_eviction(self):
+        cache = DiskCache(self.root.name, max_bytes=250)
+        a, b = self.write("a"), self.write("b")
+        cache.add(a)
+        cache.add(b)
+        self.time += 1
+        cache.touch(a)
+        cache.add(self.write("c"))
+        self.assertTrue(os.path.exists(a))
+        self.assertFalse(os.path.exists(b))
+        self.assertEqual(cache.usage()["bytes"], 200)
+
+    def test_directory_entry(self):
+        cache = DiskCache(self.root.name, max_bytes=250)
+        self.write("t8/190/numerai_datasets/data.columns/id.npy")
+        self.write("t8/190/numerai_datasets/data.columns/era.npy")
+        store = os.path.join(self.root.name, "t8/190/numerai_datasets/data.columns")
+        cache.add(store)
+        self.assertEqual(cache.usage()["bytes"], 200)
+        cache.add(self.write("b"))
+        self.assertFalse(os.path.exists(store))
+
+    def test_pinned_round(self):
+        cache = DiskCache(self.root.name, max_bytes=150)
+        zip_path = self.write("t8/190/numerai_datasets.zip")
+        cache.add(zip_path)
+        cache.pin(os.path.join(self.root.name, "t8/190"))
+        cache.add(self.write("b"))
+        self.assertTrue(os.path.exists(zip_path))
+        cache.unpin(os.path.join(self.root.name, "t8/190"))
+        cache.evict()
+        self.assertFalse(os.path.exists(zip_path))
+
+    def test_manifest_persists(self):
+        cache = DiskCache(self.root.name, max_bytes=250)
+        a = self.write("a")
+        cache.add(a)
+        cache.pin(a)
+        cache = DiskCache(self.root.name, max_bytes=50)
+        self.assertEqual(cache.usage()["entries"], 1)
+        cache.evict()
+        self.assertFalse(os.path.exists(a))
+
+    def test_accesses_saved_in_batches(self):
+        cache = DiskCache(self.root.name)
+        a = self.write("a")
+        cache.add(a)
+        manifest = os.path.join(self.root.name, disk_cache.MANIFEST)
+        saved = os.stat(manifest).st_mtime_ns
+        for _ in range(3):
+            self.time += 1
+            cache.touch(a)
+        self.assertEqual(os.stat(manifest).st_mtime_ns, saved)
+        self.assertLess(DiskCache(self.root.name).get(a)["last_access"],
+                        self.time)
+        self.time += disk_cache.SAVE_INTERVAL
+        cache.touch(a)
+        self.assertEqual(DiskCache(self.root.name).get(a)["last_access"],
+                         self.time)
+        self.time += 1
+        cache.touch(a)
+        cache.flush()
+        self.assertEqual(DiskCache(self.root.name).get(a)["last_access"],
+                         self.time)
+
+    def test_outside_root(self):
+        with tempfile.TemporaryDirectory() as other:
+            path = os.path.join(other, "artifact.npz")
+            with open(path, "wb"):
+                pass
+            cache = DiskCache(self.root.name)
+            cache.add(path)
+            self.assertEqual(cache.usage()["entries"], 0)
+
+    def test_metadata(self):
+        cache = DiskCache(self.root.name)
+        a = self.write("a")
+        cache.add(a, etag='"1"')
+        cache.update(a, validated=5)
+        cache.flush()
+        cache = DiskCache(self.root.name)
+        self.assertEqual(cache.get(a)["etag"], '"1"')
+        self.assertEqual(cache.get(a)["validated"], 5)
+        self.assertIsNone(cache.get(self.write("b")))
+
+    def test_remove_prefix(self):
+        cache = DiskCache(self.root.name)
+        zip_path = self.write("t8/190/numerai_datasets.zip")
+        other = self.write("t8/191/numerai_datasets.zip")
+        cache.add(zip_path)
+        cache.add(other)
+        cache.pin(os.path.join(self.root.name, "t8/190"))
+        cache.remove_prefix(os.path.join(self.root.name, "t8/190"))
+        self.assertFalse(os.path.exists(zip_path))
+        self.assertTrue(os.path.exists(other))
+        self.assertEqual(cache.usage()["entries"], 1)
+
+    def test_revalidate_dataset(self):
+        with mock.patch("boto3.resource"):
+            filemanager = file_manager.FileManager(self.root.name)
+        head_object = filemanager.s3.meta.client.head_object
+        head_object.return_value = {"ETag": '"1"'}
+        zip_path = self.write("t8/190/numerai_datasets.zip")
+        store = self.write("t8/190/numerai_datasets/data.columns/id.npy")
+        filemanager.disk_cache.add(zip_path, etag='"1"', validated=self.time)
+        filemanager.disk_cache.add(os.path.dirname(store))
+
+        self.assertTrue(filemanager.revalidate_dataset(8, 190))
+        head_object.assert_not_called()
+        self.assertTrue(filemanager.revalidate_dataset(8, 190, force=True))
+        self.assertEqual(head_object.call_count, 1)
+        self.time += file_manager.REVALIDATE_INTERVAL
+        self.assertTrue(filemanager.revalidate_dataset(8, 190))
+        self.assertEqual(head_object.call_count, 2)
+
+        head_object.return_value = {"ETag": '"2"'}
+        self.time += file_manager.REVALIDATE_INTERVAL
+        self.assertFalse(filemanager.revalidate_dataset(8, 190))
+        self.assertFalse(os.path.exists(zip_path))
+        self.assertFalse(os.path.exists(store))
+        self.assertTrue(filemanager.revalidate_dataset(8, 190))
+
+    def test_revalidate_without_s3(self):
+        with mock.patch("boto3.resource"):
+            filemanager = file_manager.FileManager(self.root.name)
+        head_object = filemanager.s3.meta.client.head_object
+        zip_path = self.write("t8/190/numerai_datasets.zip")
+        filemanager.disk_cache.add(zip_path, etag='"1"', validated=self.time)
+        self.time += file_manager.REVALIDATE_INTERVAL
+        for error in [
+                botocore.exceptions.EndpointConnectionError(
+                    endpoint_url="https://s3"),
+                botocore.exceptions.ClientError(
+                    {"Error": {"Code": "403"}}, "HeadObject"),
+        ]:
+            head_object.side_effect = error
+            self.assertTrue(filemanager.revalidate_dataset(8, 190))
+            self.assertTrue(os.path.exists(zip_path))
+        # Still due, the failed checks did not count
+        head_object.side_effect = None
+        head_object.return_value = {"ETag": '"2"'}
+        self.assertFalse(filemanager.revalidate_dataset(8, 190))
+        self.assertEqual(head_object.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""Metadata Cache Unit Testing."""
+
+# System
+from unittest import mock
+
+# Third Party
+import unittest
+
+# First Party
+from submission_criteria.metadata_cache import MetadataCache
+
+
+class FakeCursor():
+    def __init__(self, connection):
+        self.connection = connection
+        self.params = None
+
+    def execute(self, query, params=None):
+        self.connection.queries.append(query)
+        self.params = params
+
+    def fetchone(self):
+        username = self.connection.users.get(self.params[0])
+        return None if username is None else (username, )
+
+    def fetchall(self):
+        return list(self.connection.rounds)
+
+    def close(self):
+        pass
+
+
+class FakeConnection():  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.rounds = [("r1", 8, 170, "20190701/numerai_datasets.zip")]
+        self.users = {"u1": "alice", "u2": "bob", "u3": "carol"}
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class TestMetadataCache(unittest.TestCase):
+    def setUp(self):
+        self.postgres_db = FakeConnection()
+
+    def test_rounds_loaded_once(self):
+        cache = MetadataCache()
+        for _ in range(3):
+            self.assertEqual(cache.get_round(self.postgres_db, "r1"),
+                             (8, 170, "20190701/numerai_datasets.zip"))
+        self.assertEqual(len(self.postgres_db.queries), 1)
+
+    def test_new_round(self):
+        cache = MetadataCache()
+        cache.get_round(self.postgres_db, "r1")
+        self.postgres_db.rounds.append(("r2", 8, 171, None))
+        self.assertEqual(cache.get_round(self.postgres_db, "r2")[1], 171)
+        with self.assertRaises(KeyError):
+            cache.get_round(self.postgres_db, "r3")
+
+    def test_rounds_ttl(self):
+        cache = MetadataCache(rounds_ttl=10)
+        with mock.patch("time.monotonic", return_value=100.0):
+            cache.get_round(self.postgres_db, "r1")
+        self.postgres_db.rounds[0] = ("r1", 8, 170, "20190708/numerai_datasets.zip")
+        with mock.patch("time.monotonic", return_value=105.0):
+            self.assertEqual(cache.get_round(self.postgres_db, "r1")[2],
+                             "20190701/numerai_datasets.zip")
+        with mock.patch("time.monotonic", return_value=111.0):
+            self.assertEqual(cache.get_round(self.postgres_db, "r1")[2],
+                             "20190708/numerai_datasets.zip")
+
+    def test_invalidate_rounds(self):
+        cache = MetadataCache()
+        cache.get_round(self.postgres_db, "r1")
+        self.postgres_db.rounds[0] = ("r1", 8, 170, "20190708/numerai_datasets.zip")
+        cache.invalidate_rounds()
+        self.assertEqual(cache.get_round(self.postgres_db, "r1")[2],
+                         "20190708/numerai_datasets.zip")
+        self.assertEqual(cache.stats()["invalidations"], 1)
+
+    def test_users_lru(self):
+        cache = MetadataCache(max_users=2)
+        self.assertEqual(cache.get_username(self.postgres_db, "u1"), "alice")
+        cache.get_username(self.postgres_db, "u2")
+        cache.get_username(self.postgres_db, "u1")
+        cache.get_username(self.postgres_db, "u3")
+        self.assertEqual(len(self.postgres_db.queries), 3)
+        cache.get_username(self.postgres_db, "u1")
+        self.assertEqual(len(self.postgres_db.queries), 3)
+        cache.get_username(self.postgres_db, "u2")
+        self.assertEqual(len(self.postgres_db.queries), 4)
+        self.assertEqual(cache.stats()["users"], 2)
+
+    def test_invalidate_user(self):
+        cache = MetadataCache()
+        cache.get_username(self.postgres_db, "u1")
+        self.postgres_db.users["u1"] = "alicia"
+        cache.invalidate_users("u1")
+        self.assertEqual(cache.get_username(self.postgres_db, "u1"), "alicia")
+        with self.assertRaises(KeyError):
+            cache.get_username(self.postgres_db, "u4")
+
+    def test_listen_closes_lost_connections(self):
+        class Stop(BaseException):
+            pass
+
+        connections = []
+
+        def connect():
+            postgres_db = mock.Mock()
+            postgres_db.cursor.return_value.execute.side_effect = OSError()
+            connections.append(postgres_db)
+            return postgres_db
+
+        with mock.patch("time.sleep", side_effect=[None, Stop()]):
+            with self.assertRaises(Stop):
+                MetadataCache().listen(connect, timeout=0)
+        self.assertEqual(len(connections), 2)
+        for postgres_db in connections:
+            postgres_db.close.assert_called_once_with()
+
+
+if __name__ == '__main__':
+    unittest.main()
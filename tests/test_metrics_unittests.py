@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+"""Submission Metrics Unit Testing."""
+
+# System
+from unittest import mock
+
+# Third Party
+import unittest
+import numpy as np
+import pandas as pd
+
+# First Party
+from submission_criteria import common
+from submission_criteria import metrics
+from submission_criteria.submission_cache import SubmissionData
+from submission_criteria.validation_cache import ValidationData
+from submission_criteria.metrics import MetricsEngine, chronological_order
+from submission_criteria.rank_correlation import RankCorrelation
+
+
+def make_eras(seed, n_eras=12, decimals=2):
+    rng = np.random.RandomState(seed)
+    sizes = rng.randint(20, 200, size=n_eras)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    targets = rng.choice([0, 0.25, 0.5, 0.75, 1], size=offsets[-1])
+    predictions = np.round(rng.rand(offsets[-1]), decimals)
+    return targets, predictions, offsets
+
+
+def era_codes(offsets):
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+class TestEraCorrelations(unittest.TestCase):
+    def assert_matches_calc_correlation(self, targets, predictions, offsets):
+        correlations = common.calc_era_correlations(targets, predictions,
+                                                    offsets)
+        self.assertEqual(len(correlations), len(offsets) - 1)
+        for i, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+            expected = common.calc_correlation(
+                targets[start:end], pd.Series(predictions[start:end]))
+            if np.isnan(expected):
+                self.assertTrue(np.isnan(correlations[i]))
+            else:
+                self.assertAlmostEqual(correlations[i], expected, places=12)
+
+    def test_matches_calc_correlation(self):
+        for seed in range(3):
+            self.assert_matches_calc_correlation(*make_eras(seed, decimals=10))
+
+    def test_matches_calc_correlation_with_ties(self):
+        for seed in range(3):
+            self.assert_matches_calc_correlation(*make_eras(seed, decimals=1))
+
+    def test_any_number_of_eras(self):
+        self.assert_matches_calc_correlation(*make_eras(0, n_eras=1))
+        self.assert_matches_calc_correlation(*make_eras(1, n_eras=120))
+
+    def test_nan_prediction(self):
+        targets, predictions, offsets = make_eras(0)
+        predictions[offsets[3]] = np.nan
+        correlations = common.calc_era_correlations(targets, predictions,
+                                                    offsets)
+        self.assertTrue(np.isnan(correlations[3]))
+        self.assertEqual(np.count_nonzero(np.isnan(correlations)), 1)
+
+
+class TestRankCorrelation(unittest.TestCase):
+    def test_single_segment(self):
+        targets, predictions, _ = make_eras(0, decimals=2)
+        correlation = RankCorrelation(targets)
+        for p in [predictions, predictions[::-1].copy()]:
+            self.assertAlmostEqual(
+                correlation(p)[0],
+                common.calc_correlation(targets, pd.Series(p)),
+                places=12)
+
+    def test_kernel_is_reusable(self):
+        targets, predictions, offsets = make_eras(1)
+        correlation = RankCorrelation(targets, era_codes(offsets))
+        first = correlation(predictions)
+        correlation(np.random.RandomState(2).rand(len(predictions)))
+        np.testing.assert_array_equal(correlation(predictions), first)
+
+    def test_constant_target(self):
+        targets, predictions, offsets = make_eras(2)
+        targets[offsets[1]:offsets[2]] = 0.5
+        self.assertTrue(
+            np.isnan(RankCorrelation(targets, era_codes(offsets))(predictions)[1]))
+
+    def test_multiple_targets(self):
+        targets, predictions, offsets = make_eras(4, decimals=2)
+        rng = np.random.RandomState(5)
+        matrix = np.column_stack(
+            [targets, rng.rand(len(targets)), rng.rand(len(targets))])
+        for segments in [None, era_codes(offsets)]:
+            correlations = RankCorrelation(matrix, segments)(predictions)
+            self.assertEqual(correlations.shape[1], matrix.shape[1])
+            for i in range(matrix.shape[1]):
+                np.testing.assert_allclose(
+                    correlations[:, i],
+                    RankCorrelation(matrix[:, i], segments)(predictions),
+                    rtol=0, atol=1e-12)
+
+    def test_ungrouped_segments(self):
+        targets, predictions, offsets = make_eras(6, decimals=1)
+        shuffle = np.random.RandomState(7).permutation(len(targets))
+        targets, predictions = targets[shuffle], predictions[shuffle]
+        eras = era_codes(offsets)[shuffle]
+        correlations = RankCorrelation(targets, eras)(predictions)
+        for era in range(len(offsets) - 1):
+            self.assertAlmostEqual(
+                correlations[era],
+                common.calc_correlation(targets[eras == era],
+                                        pd.Series(predictions[eras == era])),
+                places=12)
+
+    def test_rejects_misaligned_predictions(self):
+        targets, predictions, offsets = make_eras(3)
+        with self.assertRaises(IndexError):
+            RankCorrelation(targets, era_codes(offsets))(predictions[1:])
+
+
+class TestMetricsEngine(unittest.TestCase):
+    def test_chronological_order(self):
+        names = np.array(["era10", "era2", "era1", "eraX"])
+        np.testing.assert_array_equal(names[chronological_order(names)],
+                                      ["eraX", "era1", "era2", "era10"])
+
+    def test_metrics_match_pandas(self):
+        targets, predictions, offsets = make_eras(8)
+        shuffle = np.random.RandomState(9).permutation(len(targets))
+        targets, predictions = targets[shuffle], predictions[shuffle]
+        names = np.array(["era{}".format(i) for i in range(1, 13)])
+        codes = era_codes(offsets)[shuffle]
+        scores = MetricsEngine(targets, codes, names).score(predictions)
+
+        self.assertAlmostEqual(
+            scores["validation_correlation"],
+            common.calc_correlation(targets, pd.Series(predictions)),
+            places=12)
+        data = pd.DataFrame({
+            "era": names[codes],
+            "target": targets,
+            "probability": predictions,
+        })
+        era_correlations = pd.Series({
+            int(era[3:]): common.calc_correlation(group["target"],
+                                                  group["probability"])
+            for era, group in data.groupby("era")
+        }).sort_index()
+        np.testing.assert_allclose(scores["era_correlations"],
+                                   era_correlations.values,
+                                   rtol=0,
+                                   atol=1e-12)
+        self.assertEqual(
+            scores["consistency"],
+            (era_correlations > 0.002).sum() / len(era_correlations) * 100)
+        self.assertAlmostEqual(
+            scores["sharpe"],
+            era_correlations.mean() / era_correlations.std(),
+            places=10)
+        cumulative = era_correlations.cumsum()
+        self.assertAlmostEqual(scores["max_drawdown"],
+                               (cumulative.cummax() - cumulative).max(),
+                               places=12)
+
+    def test_multiple_targets(self):
+        targets, predictions, offsets = make_eras(10)
+        matrix = np.column_stack(
+            [targets, np.random.RandomState(11).rand(len(targets))])
+        names = np.array(["era{}".format(i) for i in range(1, 13)])
+        scores = MetricsEngine(matrix, era_codes(offsets), names).score(
+            predictions)
+        for i in range(matrix.shape[1]):
+            single = MetricsEngine(matrix[:, i], era_codes(offsets),
+                                   names).score(predictions)
+            for metric in ["validation_correlation", "consistency", "sharpe",
+                           "max_drawdown"]:
+                self.assertAlmostEqual(scores[metric][i], single[metric],
+                                       places=12)
+
+
+class TestUpdateMetrics(unittest.TestCase):
+    def setUp(self):
+        targets, predictions, offsets = make_eras(12)
+        shuffle = np.random.RandomState(13).permutation(len(targets))
+        names = np.array(["era{}".format(i) for i in range(1, 13)])
+        self.data = pd.DataFrame({
+            "id": ["n{:06d}".format(i) for i in range(len(targets))],
+            "era": names[era_codes(offsets)][shuffle],
+            "target_kazutsugi": targets[shuffle],
+        })
+        self.submission = pd.DataFrame({
+            "id": self.data["id"],
+            "probability": predictions[shuffle],
+        }).sample(frac=1, random_state=14)
+        self.work_item = {
+            "submission_id": "a",
+            "context": {
+                "tournament": "kazutsugi",
+                "round_number": 170,
+                "dataset_path": "20190701/numerai_datasets.zip",
+                "s3_file": "alice/predictions.csv",
+            },
+        }
+        self.write_buffer = mock.Mock()
+
+    def update_metrics(self, data):
+        dataset = mock.Mock(validation_data=ValidationData.from_frame(data))
+        filemanager = mock.Mock()
+        filemanager.read_submission.return_value = SubmissionData.from_frame(
+            self.submission)
+        with mock.patch.object(common.round_dataset, "get_round_dataset",
+                               return_value=dataset), \
+                mock.patch.object(common, "get_write_buffer",
+                                  return_value=self.write_buffer):
+            common.update_metrics(self.work_item, filemanager)
+        filemanager.read_submission.assert_called_once_with(
+            "alice/predictions.csv")
+        self.write_buffer.update_submission.assert_called_once()
+        args, values = self.write_buffer.update_submission.call_args
+        self.assertEqual(args, ("a", ))
+        return values
+
+    def test_writes_every_metric(self):
+        values = self.update_metrics(self.data)
+        expected = MetricsEngine(
+            self.data["target_kazutsugi"].values,
+            np.unique(self.data["era"], return_inverse=True)[1],
+            np.unique(self.data["era"])).score(
+                self.submission.set_index("id").loc[self.data["id"],
+                                                    "probability"].values)
+        self.assertEqual(set(values), set(metrics.METRICS))
+        for metric in metrics.METRICS:
+            self.assertAlmostEqual(values[metric], expected[metric],
+                                   places=12)
+
+    def test_validation_correlation_without_eras(self):
+        values = self.update_metrics(self.data.drop(columns="era"))
+        self.assertEqual(list(values), ["validation_correlation"])
+        aligned = self.submission.set_index("id").loc[self.data["id"]]
+        self.assertAlmostEqual(
+            values["validation_correlation"],
+            common.calc_correlation(self.data["target_kazutsugi"].values,
+                                    aligned["probability"].reset_index(
+                                        drop=True)),
+            places=12)
+
+    def test_all_targets_from_the_same_validation_data(self):
+        self.data["target_bernie"] = np.random.RandomState(15).rand(
+            len(self.data))
+        with mock.patch.object(common, "SCORE_ALL_TARGETS", True):
+            values = self.update_metrics(self.data)
+        args, _ = self.write_buffer.write_target_metrics.call_args
+        submission_id, targets, scores = args
+        self.assertEqual(submission_id, "a")
+        self.assertEqual(targets, ("target_bernie", "target_kazutsugi"))
+        self.assertEqual(set(scores), set(metrics.METRICS))
+        for metric in metrics.METRICS:
+            self.assertEqual(scores[metric][1], values[metric])
+        aligned = self.submission.set_index("id").loc[self.data["id"],
+                                                      "probability"].values
+        validation_data = ValidationData.from_frame(self.data)
+        self.assertAlmostEqual(
+            scores["validation_correlation"][0],
+            validation_data.get_correlation("target_bernie")(aligned)[0],
+            places=12)
+
+
+if __name__ == '__main__':
+    unittest.main()
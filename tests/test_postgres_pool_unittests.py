@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+"""Postgres Connection Pool Unit Testing."""
+
+# System
+import threading
+
+# Third Party
+import unittest
+import psycopg2
+import psycopg2.extensions
+
+# First Party
+from submission_criteria.postgres_pool import ConnectionPool, PoolError
+
+
+class FakeCursor():
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, _query):
+        if self.connection.broken:
+            raise psycopg2.OperationalError("server closed the connection")
+
+    def close(self):
+        pass
+
+
+class FakeConnection():
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.connections = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.connections.append(connection)
+        return connection
+
+    def test_reuse(self):
+        pool = ConnectionPool(self.connect, min_size=1, max_size=2)
+        for _ in range(3):
+            with pool.connection() as connection:
+                self.assertIs(connection, self.connections[0])
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(pool.stats()["checkouts"], 3)
+
+    def test_max_size(self):
+        pool = ConnectionPool(self.connect, min_size=0, max_size=2,
+                              timeout=0.05)
+        with pool.connection() as first, pool.connection() as second:
+            self.assertIsNot(first, second)
+            with self.assertRaises(PoolError):
+                with pool.connection():
+                    pass
+        stats = pool.stats()
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["size"], 2)
+        self.assertEqual(stats["idle"], 2)
+
+    def test_blocked_checkout(self):
+        pool = ConnectionPool(self.connect, min_size=1, max_size=1, timeout=5)
+        checked_out = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            with pool.connection():
+                checked_out.set()
+                release.wait()
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        checked_out.wait()
+        threading.Timer(0.05, release.set).start()
+        with pool.connection() as connection:
+            self.assertIs(connection, self.connections[0])
+        thread.join()
+        self.assertGreater(pool.stats()["max_wait_time"], 0)
+
+    def test_open_transaction_rolled_back(self):
+        pool = ConnectionPool(self.connect, min_size=1, max_size=1)
+        with pool.connection() as connection:
+            connection.status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        self.assertEqual(connection.rollbacks, 1)
+
+    def test_broken_connection_replaced(self):
+        pool = ConnectionPool(self.connect, min_size=1, max_size=1)
+        with self.assertRaises(psycopg2.OperationalError):
+            with pool.connection():
+                raise psycopg2.OperationalError("server closed the connection")
+        self.assertTrue(self.connections[0].closed)
+        with pool.connection() as connection:
+            self.assertIs(connection, self.connections[1])
+
+    def test_health_check(self):
+        pool = ConnectionPool(self.connect, min_size=1, max_size=1,
+                              health_check_interval=0)
+        self.connections[0].broken = True
+        with pool.connection() as connection:
+            self.assertIs(connection, self.connections[1])
+        self.assertEqual(pool.stats()["replaced"], 1)
+
+    def test_close(self):
+        pool = ConnectionPool(self.connect, min_size=2, max_size=2)
+        pool.close()
+        self.assertTrue(all(c.closed for c in self.connections))
+        with self.assertRaises(PoolError):
+            with pool.connection():
+                pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""Submission Prefetch Unit Testing."""
+
+# System
+import threading
+from unittest import mock
+
+# Third Party
+import unittest
+
+# First Party
+from submission_criteria import prefetch
+from submission_criteria.prefetch import Prefetcher
+
+
+class FakeCache():  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.max_memory_bytes = 100
+        self.prefetched_bytes = 0
+
+    def stats(self):
+        return {"prefetched_bytes": self.prefetched_bytes}
+
+
+class FakeFileManager():  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.submissions = FakeCache()
+        self.read = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def read_submission(self, s3_file, **_kwargs):
+        self.release.wait()
+        if s3_file == "alice/broken.csv":
+            raise ValueError(s3_file)
+        self.read.append(s3_file)
+
+
+def get_submission_context(submission):
+    return {"s3_file": "alice/{}.csv".format(submission["submission_id"])}
+
+
+class TestPrefetcher(unittest.TestCase):
+    def setUp(self):
+        self.filemanager = FakeFileManager()
+        patcher = mock.patch.object(prefetch.common, "get_submission_context",
+                                    side_effect=get_submission_context)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_prefetch(self):
+        prefetcher = Prefetcher(self.filemanager)
+        for submission_id in ["a", "b", "broken"]:
+            self.assertTrue(prefetcher.submit({"submission_id": submission_id}))
+        prefetcher.close()
+        self.assertEqual(sorted(self.filemanager.read),
+                         ["alice/a.csv", "alice/b.csv"])
+        stats = prefetcher.stats()
+        self.assertEqual(stats["prefetched"], 2)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(stats["pending"], 0)
+
+    def test_max_pending(self):
+        self.filemanager.release.clear()
+        prefetcher = Prefetcher(self.filemanager, max_in_flight=1,
+                                max_pending=2)
+        started = [prefetcher.submit({"submission_id": i}) for i in "abc"]
+        self.assertEqual(started, [True, True, False])
+        self.filemanager.release.set()
+        prefetcher.close()
+        self.assertEqual(prefetcher.stats()["skipped"], 1)
+        self.assertFalse(prefetcher.submit({"submission_id": "d"}))
+
+    def test_memory_cap(self):
+        prefetcher = Prefetcher(self.filemanager)
+        self.assertEqual(prefetcher.max_memory_bytes, 50)
+        self.filemanager.submissions.prefetched_bytes = 50
+        self.assertFalse(prefetcher.submit({"submission_id": "a"}))
+        prefetcher.close()
+        self.assertEqual(self.filemanager.read, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
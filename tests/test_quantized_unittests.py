@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""Quantized Feature Storage Unit Testing."""
+
+# System
+import os
+import tempfile
+
+# Third Party
+import unittest
+import numpy as np
+import pandas as pd
+
+# First Party
+from submission_criteria import quantized
+from submission_criteria.quantized import QuantizedMatrix
+
+LEVELS = [0, 0.25, 0.5, 0.75, 1]
+
+
+class TestQuantizedMatrix(unittest.TestCase):
+    def test_round_trip(self):
+        rng = np.random.RandomState(0)
+        values = rng.choice(LEVELS, size=(100, 7))
+        matrix = QuantizedMatrix.from_values(values)
+        self.assertEqual(matrix.codes.dtype, np.uint8)
+        np.testing.assert_array_equal(matrix.to_float(dtype=np.float64), values)
+        np.testing.assert_array_equal(
+            np.concatenate(list(matrix.chunks(30))), values.astype(np.float32))
+
+    def test_concatenate_merges_tables(self):
+        first = np.array([[0, 0.5], [0.5, 0.5]])
+        second = np.array([[1, np.nan], [0.25, 0]])
+        matrix = QuantizedMatrix.concatenate([
+            QuantizedMatrix.from_values(first),
+            QuantizedMatrix.from_values(second)
+        ])
+        np.testing.assert_array_equal(matrix.to_float(dtype=np.float64),
+                                      np.concatenate([first, second]))
+        np.testing.assert_array_equal(matrix.dropna().to_float(dtype=np.float64),
+                                      np.concatenate([first, second[1:]]))
+
+    def test_too_many_levels(self):
+        with self.assertRaises(ValueError):
+            QuantizedMatrix.from_values(np.arange(300.0).reshape(-1, 1))
+
+    def test_read_csv(self):
+        rng = np.random.RandomState(1)
+        data = pd.DataFrame({"id": ["n{}".format(i) for i in range(250)]})
+        features = ["feature{}".format(i) for i in range(5)]
+        for feature in features:
+            data[feature] = rng.choice(LEVELS, size=len(data))
+        with tempfile.TemporaryDirectory() as data_dir:
+            path = os.path.join(data_dir, "data.csv")
+            data.to_csv(path, index=False)
+            matrix, ids = quantized.read_csv(path, features, 60, columns=["id"])
+        np.testing.assert_array_equal(matrix.to_float(dtype=np.float64),
+                                      data[features].values)
+        np.testing.assert_array_equal(ids["id"].values, data["id"].values)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""Round Dataset Unit Testing."""
+
+# System
+import os
+import tempfile
+from unittest import mock
+import threading
+
+# Third Party
+import unittest
+import numpy as np
+import pandas as pd
+
+# First Party
+from submission_criteria import round_dataset
+from submission_criteria import round_store
+
+
+class LocalFileManager():
+    """FileManager serving an already extracted dataset directory"""
+
+    def __init__(self, local_dir):
+        self.local_dir = local_dir
+        self.pinned = []
+        self.fresh = True
+
+    def dataset_store(self, _tournament, _round_number, filename):
+        return round_store.get_store(os.path.join(self.local_dir, filename))
+
+    def revalidate_dataset(self, _tournament, _round_number):
+        return self.fresh
+
+    def pin_round(self, tournament, round_number):
+        self.pinned.append((tournament, round_number))
+
+    def unpin_round(self, tournament, round_number):
+        self.pinned.remove((tournament, round_number))
+
+
+class TestRoundDataset(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        n = 600
+        self.data = pd.DataFrame({
+            "id": ["n{:06d}".format(i) for i in rng.permutation(n)],
+            "era": ["era{}".format(i) for i in rng.randint(1, 13, size=n)],
+            "data_type": rng.choice(["validation", "test", "live"], size=n),
+            "feature1": rng.rand(n),
+            "target_kazutsugi": rng.choice([0, 0.25, 0.5, 0.75, 1], size=n),
+        })
+        self.data_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.data.to_csv(os.path.join(self.data_dir.name,
+                                      round_dataset.TOURNAMENT_DATA),
+                         index=False)
+        self.filemanager = LocalFileManager(self.data_dir.name)
+        self.dataset = round_dataset.RoundDataset(self.filemanager, 8, 190)
+        self.validation = self.data[self.data["data_type"] ==
+                                    "validation"].sort_values("id")
+
+    def tearDown(self):
+        self.data_dir.cleanup()
+
+    def test_ids_per_split(self):
+        for ids, data_type in zip(self.dataset.get_ids(),
+                                  ["validation", "test", "live"]):
+            np.testing.assert_array_equal(
+                ids,
+                np.sort(self.data["id"][self.data["data_type"] == data_type]))
+
+    def test_eras_and_targets_follow_ids(self):
+        names, codes = self.dataset.eras
+        np.testing.assert_array_equal(names[codes], self.validation["era"])
+        np.testing.assert_array_equal(
+            self.dataset.get_targets("target_kazutsugi"),
+            self.validation["target_kazutsugi"])
+
+    def test_era_layout_groups_eras(self):
+        layout = self.dataset.era_layout
+        self.assertEqual(len(layout["names"]), 12)
+        era = self.validation["era"].values[layout["order"]]
+        for i, name in enumerate(layout["names"]):
+            start, end = layout["offsets"][i], layout["offsets"][i + 1]
+            self.assertTrue((era[start:end] == name).all())
+            self.assertTrue((np.diff(layout["order"][start:end]) > 0).all())
+
+    def test_validation_column(self):
+        submission = pd.DataFrame({
+            "id": self.data["id"],
+            "probability": np.arange(len(self.data), dtype=float),
+        }).sample(frac=1, random_state=1)
+        np.testing.assert_array_equal(
+            self.dataset.get_validation_column(submission),
+            self.validation.index.values)
+        with self.assertRaises(IndexError):
+            self.dataset.get_validation_column(
+                submission[submission["id"] != self.validation["id"].iloc[0]])
+
+    def test_artifacts_load_once(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return object()
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(self.dataset.get("x", loader)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_registry_shares_datasets(self):
+        first = round_dataset.get_round_dataset(self.filemanager, 8, 190, "v1")
+        self.assertIs(
+            round_dataset.get_round_dataset(self.filemanager, 8, 190, "v1"),
+            first)
+        self.assertEqual(self.filemanager.pinned, [(8, 190)])
+        round_dataset.invalidate(8, 190)
+        self.assertEqual(self.filemanager.pinned, [])
+        self.assertIsNot(
+            round_dataset.get_round_dataset(self.filemanager, 8, 190, "v1"),
+            first)
+        round_dataset.invalidate(8, 190)
+
+    def test_registry_drops_stale_datasets(self):
+        first = round_dataset.get_round_dataset(self.filemanager, 8, 190, "v1")
+        self.filemanager.fresh = False
+        second = round_dataset.get_round_dataset(self.filemanager, 8, 190, "v1")
+        self.assertIsNot(second, first)
+        self.assertEqual(self.filemanager.pinned, [(8, 190)])
+        round_dataset.invalidate(8, 190)
+
+    def test_registry_capacity_and_stats(self):
+        round_dataset.invalidate()
+        before = round_dataset.stats()
+        with mock.patch.object(round_dataset, "MAX_DATASETS", 2):
+            first = round_dataset.get_round_dataset(self.filemanager, 8, 190)
+            round_dataset.get_round_dataset(self.filemanager, 9, 190)
+            round_dataset.get_round_dataset(self.filemanager, 8, 190)
+            round_dataset.get_round_dataset(self.filemanager, 10, 190)
+            self.assertIs(
+                round_dataset.get_round_dataset(self.filemanager, 8, 190),
+                first)
+            self.assertEqual(sorted(self.filemanager.pinned), [(8, 190),
+                                                               (10, 190)])
+            self.assertEqual(round_dataset.invalidate(8), 1)
+            self.assertEqual(round_dataset.invalidate(), 1)
+        after = round_dataset.stats()
+        self.assertEqual(after["hits"] - before["hits"], 2)
+        self.assertEqual(after["misses"] - before["misses"], 3)
+        self.assertEqual(after["evictions"] - before["evictions"], 1)
+        self.assertEqual(after["invalidations"] - before["invalidations"], 2)
+        self.assertEqual(after["datasets"], 0)
+        self.assertEqual(self.filemanager.pinned, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""Round Store Unit Testing."""
+
+# System
+import os
+import zipfile
+import tempfile
+
+# Third Party
+import unittest
+import numpy as np
+import pandas as pd
+
+# First Party
+from submission_criteria import round_store
+from submission_criteria import quantized
+from submission_criteria.dataset_archive import ArchiveMember
+
+
+class TestRoundStore(unittest.TestCase):
+    def make_data(self, seed, n=250):
+        rng = np.random.RandomState(seed)
+        data = pd.DataFrame({
+            "id": ["n{:06d}".format(i) for i in rng.permutation(n)],
+            "era": ["era{}".format(i) for i in rng.randint(1, 13, size=n)],
+            "data_type": rng.choice(["validation", "test", "live"], size=n),
+        })
+        for i in range(5):
+            data["feature{}".format(i)] = rng.choice([0, 0.25, 0.5, 0.75, 1],
+                                                     size=n)
+        data["target"] = rng.randint(0, 2, size=n).astype(float)
+        data.loc[data["data_type"] == "live", "target"] = np.nan
+        return data
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.csv_path = os.path.join(self.data_dir.name, "data.csv")
+        self.data = self.make_data(0)
+        self.data.to_csv(self.csv_path, index=False)
+
+    def tearDown(self):
+        self.data_dir.cleanup()
+
+    def test_projection_matches_csv(self):
+        store = round_store.get_store(self.csv_path, chunk_size=60)
+        self.assertEqual(store.columns, list(self.data))
+        self.assertEqual(len(store), len(self.data))
+        self.assertEqual(store.get_column("feature0").dtype, np.float32)
+        columns = ["id", "era", "target"]
+        pd.testing.assert_frame_equal(store.read(columns), self.data[columns],
+                                      check_dtype=False)
+        f = [c for c in self.data if "feature" in c]
+        np.testing.assert_array_equal(store.read_matrix(f), self.data[f].values)
+
+    def test_column_turning_text_after_first_chunk(self):
+        self.data["era"] = [str(i) for i in range(len(self.data))]
+        self.data.loc[200, "era"] = "eraX"
+        self.data.to_csv(self.csv_path, index=False)
+        store = round_store.get_store(self.csv_path, chunk_size=60)
+        np.testing.assert_array_equal(store.get_column("era"),
+                                      self.data["era"].values)
+        np.testing.assert_array_equal(store.get_column("target"),
+                                      self.data["target"].values)
+
+    def test_rows_counted_too_high(self):
+        self.data["era"] = self.data["era"].astype(object)
+        self.data.loc[10, "era"] = "era\n1"
+        self.data.to_csv(self.csv_path, index=False)
+        with open(self.csv_path, "a") as f:
+            f.write("\n\n")
+        store = round_store.get_store(self.csv_path, chunk_size=60)
+        self.assertEqual(len(store), len(self.data))
+        np.testing.assert_array_equal(store.get_column("id"),
+                                      self.data["id"].values)
+        np.testing.assert_array_equal(store.get_column("feature0"),
+                                      self.data["feature0"].values)
+
+    def test_store_is_reused(self):
+        store = round_store.get_store(self.csv_path)
+        mtime = os.stat(os.path.join(store.path, "manifest.json")).st_mtime
+        store = round_store.get_store(self.csv_path)
+        self.assertEqual(
+            os.stat(os.path.join(store.path, "manifest.json")).st_mtime, mtime)
+        self.assertEqual(sorted(os.listdir(self.data_dir.name)),
+                         ["data.columns", "data.csv"])
+
+    def test_rebuilt_when_csv_changes(self):
+        round_store.get_store(self.csv_path)
+        data = self.make_data(1, n=100)
+        data.to_csv(self.csv_path, index=False)
+        store = round_store.get_store(self.csv_path)
+        np.testing.assert_array_equal(store.get_column("id"), data["id"].values)
+
+    def write_zip(self, data):
+        zip_path = os.path.join(self.data_dir.name, "numerai_datasets.zip")
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+            zip_ref.writestr("numerai_datasets/data.csv",
+                             data.to_csv(index=False))
+            zip_ref.writestr("numerai_datasets/example_predictions.csv", "")
+        return zip_path
+
+    def test_store_from_zip_member(self):
+        member = ArchiveMember(self.write_zip(self.data), "data.csv")
+        store_path = os.path.join(self.data_dir.name, "zipped.columns")
+        store = round_store.get_store(member, chunk_size=60,
+                                      store_path=store_path)
+        pd.testing.assert_frame_equal(store.read(), self.data,
+                                      check_dtype=False)
+        # Nothing is extracted
+        self.assertEqual(sorted(os.listdir(self.data_dir.name)),
+                         ["data.csv", "numerai_datasets.zip", "zipped.columns"])
+
+        data = self.make_data(1, n=100)
+        member = ArchiveMember(self.write_zip(data), "data.csv")
+        store = round_store.get_store(member, store_path=store_path)
+        np.testing.assert_array_equal(store.get_column("id"), data["id"].values)
+
+        with self.assertRaises(KeyError):
+            ArchiveMember(member.zip_path, "numerai_training_data.csv")
+
+    def test_quantized_from_zip_member(self):
+        member = ArchiveMember(self.write_zip(self.data), "data.csv")
+        f = [c for c in self.data if "feature" in c]
+        matrix, ids = quantized.read_csv(member, f, 60, columns=["id"])
+        np.testing.assert_array_equal(matrix.to_float(), self.data[f].values)
+        np.testing.assert_array_equal(ids["id"].values, self.data["id"].values)
+
+
+if __name__ == '__main__':
+    unittest.main()
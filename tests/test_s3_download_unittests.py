@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""Ranged S3 Download Unit Testing."""
+
+# System
+import io
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+# Third Party
+import unittest
+import numpy as np
+
+# First Party
+from submission_criteria import s3_download
+
+
+class FakeClient():
+    def __init__(self, body, etag=None):
+        self.body = body
+        self.etag = etag or '"{}"'.format(hashlib.md5(body).hexdigest())
+        self.ranges = []
+        self.fail_at = None
+
+    def head_object(self, Bucket, Key):  # pylint: disable=unused-argument
+        return {"ContentLength": len(self.body), "ETag": self.etag}
+
+    def get_object(self, Bucket, Key, IfMatch, Range):  # pylint: disable=unused-argument
+        assert IfMatch == self.etag
+        start, end = [int(b) for b in Range[len("bytes="):].split("-")]
+        if start == self.fail_at:
+            raise IOError("Connection reset")
+        self.ranges.append(start)
+        return {"Body": io.BytesIO(self.body[start:end + 1])}
+
+
+class TestDownloadFile(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.path = os.path.join(self.temp_dir.name, "numerai_datasets.zip")
+        self.body = np.random.RandomState(0).bytes(10000)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def read(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def listdir(self):
+        return os.listdir(self.temp_dir.name)
+
+    def test_download(self):
+        client = FakeClient(self.body)
+        etag = s3_download.download_file(client, "bucket", "key", self.path,
+                                         part_size=1000, max_concurrency=4)
+        self.assertEqual(etag, client.etag)
+        self.assertEqual(self.read(), self.body)
+        self.assertEqual(sorted(client.ranges), list(range(0, 10000, 1000)))
+        self.assertEqual(self.listdir(),
+                         ["numerai_datasets.zip"])
+
+    def test_concurrent_downloads(self):
+        client = FakeClient(self.body)
+        etags = []
+        threads = [
+            threading.Thread(target=lambda: etags.append(
+                s3_download.download_file(client, "bucket", "key", self.path,
+                                          part_size=1000, max_concurrency=2)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(etags, [client.etag] * 4)
+        self.assertEqual(self.read(), self.body)
+        self.assertEqual(sorted(client.ranges), list(range(0, 10000, 1000)))
+        # The lock file and the lock are dropped once nothing waits for them
+        self.assertEqual(self.listdir(), ["numerai_datasets.zip"])
+        self.assertEqual(s3_download._path_locks, {})  # pylint: disable=protected-access
+
+    def test_resume(self):
+        client = FakeClient(self.body)
+        client.fail_at = 5000
+        with self.assertRaises(IOError):
+            s3_download.download_file(client, "bucket", "key", self.path,
+                                      part_size=1000, max_concurrency=1)
+        self.assertFalse(os.path.exists(self.path))
+        with open(self.path + s3_download.STATE_SUFFIX) as f:
+            self.assertEqual(sorted(json.load(f)["done"]),
+                             [0, 1, 2, 3, 4, 6, 7, 8, 9])
+
+        client.fail_at = None
+        client.ranges = []
+        s3_download.download_file(client, "bucket", "key", self.path,
+                                  part_size=1000, max_concurrency=1)
+        self.assertEqual(self.read(), self.body)
+        self.assertEqual(client.ranges, [5000])
+
+    def test_changed_object(self):
+        client = FakeClient(self.body)
+        client.fail_at = 5000
+        with self.assertRaises(IOError):
+            s3_download.download_file(client, "bucket", "key", self.path,
+                                      part_size=1000, max_concurrency=1)
+        client = FakeClient(self.body[::-1])
+        s3_download.download_file(client, "bucket", "key", self.path,
+                                  part_size=1000, max_concurrency=1)
+        self.assertEqual(self.read(), self.body[::-1])
+        self.assertEqual(len(client.ranges), 10)
+
+    def test_md5_mismatch(self):
+        client = FakeClient(self.body, etag='"{}"'.format("0" * 32))
+        with self.assertRaises(s3_download.DownloadError):
+            s3_download.download_file(client, "bucket", "key", self.path,
+                                      part_size=1000)
+        self.assertEqual(self.listdir(), [])
+
+    def test_multipart_etag(self):
+        client = FakeClient(self.body, etag='"{}-2"'.format("0" * 32))
+        s3_download.download_file(client, "bucket", "key", self.path,
+                                  part_size=3000)
+        self.assertEqual(self.read(), self.body)
+
+
+if __name__ == '__main__':
+    unittest.main()
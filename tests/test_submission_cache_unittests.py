@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""Submission Cache Unit Testing."""
+
+# System
+import io
+import os
+import tempfile
+from unittest import mock
+
+# Third Party
+import unittest
+import botocore.exceptions
+import numpy as np
+import pandas as pd
+
+# First Party
+from submission_criteria.submission_cache import SubmissionCache, SubmissionData
+
+
+class FakeClient():
+    def __init__(self):
+        self.objects = {}
+        self.gets = 0
+        self.heads = 0
+
+    def put(self, key, data):
+        body = data.to_csv(index=False).encode()
+        self.objects[key] = (body, '"{}"'.format(hash(body)))
+
+    def head_object(self, Bucket, Key):  # pylint: disable=unused-argument
+        self.heads += 1
+        return {"ETag": self.objects[Key][1]}
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):  # pylint: disable=unused-argument
+        body, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise botocore.exceptions.ClientError(
+                {"Error": {"Code": "304"}}, "GetObject")
+        self.gets += 1
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+
+class TestSubmissionCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.client = FakeClient()
+        self.s3 = mock.Mock()
+        self.s3.meta.client = self.client
+        rng = np.random.RandomState(0)
+        self.data = pd.DataFrame({
+            "id": ["n{:06d}".format(i) for i in range(100)],
+            "prediction_kazutsugi": rng.uniform(size=100),
+        })
+        self.client.put("alice/predictions.csv", self.data)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def make_cache(self, **kwargs):
+        return SubmissionCache(self.s3, self.temp_dir.name, **kwargs)
+
+    def test_parsed(self):
+        submission = self.make_cache().get("bucket", "alice/predictions.csv")
+        np.testing.assert_array_equal(submission.ids, self.data["id"].values)
+        np.testing.assert_allclose(submission.predictions,
+                                   self.data["prediction_kazutsugi"].values)
+        self.assertEqual(list(submission.frame), ["id", "probability"])
+
+    def test_downloaded_once(self):
+        cache = self.make_cache()
+        first = cache.get("bucket", "alice/predictions.csv")
+        self.assertIs(cache.get("bucket", "alice/predictions.csv"), first)
+        self.assertEqual(self.client.gets, 1)
+        # The first read is a single GET
+        self.assertEqual(self.client.heads, 0)
+
+        # The disk tier survives a restart
+        submission = self.make_cache().get("bucket", "alice/predictions.csv")
+        np.testing.assert_array_equal(submission.predictions,
+                                      first.predictions)
+        self.assertEqual(self.client.gets, 1)
+
+        # Unless the object changed in the meantime
+        self.data["prediction_kazutsugi"] = 0.5
+        self.client.put("alice/predictions.csv", self.data)
+        submission = self.make_cache().get("bucket", "alice/predictions.csv")
+        self.assertTrue((submission.predictions == 0.5).all())
+        self.assertEqual(self.client.gets, 2)
+
+    def test_changed_etag(self):
+        cache = self.make_cache(etag_ttl=0)
+        cache.get("bucket", "alice/predictions.csv")
+        self.data["prediction_kazutsugi"] = 0.5
+        self.client.put("alice/predictions.csv", self.data)
+        submission = cache.get("bucket", "alice/predictions.csv")
+        self.assertTrue((submission.predictions == 0.5).all())
+        self.assertEqual(self.client.gets, 2)
+
+    def test_memory_budget(self):
+        for i in range(3):
+            self.client.put("alice/{}.csv".format(i), self.data)
+        nbytes = SubmissionData.from_frame(self.data).nbytes
+        cache = self.make_cache(max_memory_bytes=2 * nbytes)
+        for i in range(3):
+            cache.get("bucket", "alice/{}.csv".format(i))
+        stats = cache.stats()
+        self.assertEqual(stats["submissions"], 2)
+        # The ETags of evicted submissions are dropped with them
+        self.assertEqual(stats["etags"], 2)
+        self.assertLessEqual(stats["memory_bytes"], 2 * nbytes)
+
+    def test_prefetched_bytes(self):
+        for i in range(3):
+            self.client.put("alice/{}.csv".format(i), self.data)
+        nbytes = SubmissionData.from_frame(self.data).nbytes
+        cache = self.make_cache(max_memory_bytes=2 * nbytes)
+        cache.get("bucket", "alice/0.csv", prefetch=True)
+        cache.get("bucket", "alice/1.csv", prefetch=True)
+        self.assertEqual(cache.stats()["prefetched_bytes"], 2 * nbytes)
+        cache.get("bucket", "alice/1.csv")
+        self.assertEqual(cache.stats()["prefetched_bytes"], nbytes)
+        # Evicting the unread submission forgets it too
+        cache.get("bucket", "alice/2.csv")
+        self.assertEqual(cache.stats()["prefetched_bytes"], 0)
+
+    def test_disk_budget(self):
+        cache = self.make_cache(max_disk_bytes=1)
+        for i in range(3):
+            self.client.put("alice/{}.csv".format(i), self.data)
+            cache.get("bucket", "alice/{}.csv".format(i))
+        files = [f for f in os.listdir(self.temp_dir.name) if f.endswith(".npz")]
+        self.assertEqual(len(files), 0)
+
+    def test_disk_scanned_past_budget_only(self):
+        for i in range(4):
+            self.client.put("alice/{}.csv".format(i), self.data)
+        cache = self.make_cache()
+        with mock.patch("os.scandir", side_effect=os.scandir) as scandir:
+            for i in range(3):
+                cache.get("bucket", "alice/{}.csv".format(i))
+            # Scanned once to learn the size of the disk tier
+            self.assertEqual(scandir.call_count, 1)
+            cache.max_disk_bytes = sum(
+                os.path.getsize(os.path.join(self.temp_dir.name, f))
+                for f in os.listdir(self.temp_dir.name) if f.endswith(".npz"))
+            cache.get("bucket", "alice/3.csv")
+            self.assertEqual(scandir.call_count, 2)
+        files = [f for f in os.listdir(self.temp_dir.name) if f.endswith(".npz")]
+        self.assertEqual(len(files), 3)
+
+    def test_get_aligned(self):
+        submission = self.make_cache().get("bucket", "alice/predictions.csv")
+        align = mock.Mock(side_effect=lambda data: data["probability"].values[::-1])
+        first = submission.get_aligned("reversed", align)
+        self.assertIs(submission.get_aligned("reversed", align), first)
+        self.assertEqual(align.call_count, 1)
+        np.testing.assert_array_equal(first, submission.predictions[::-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Submission Context Unit Testing."""
+
+# System
+import contextlib
+
+# Third Party
+import unittest
+
+# First Party
+from submission_criteria import common
+
+
+class FakeCursor():
+    def __init__(self, connection):
+        self.connection = connection
+        self.query, self.params = None, None
+
+    def execute(self, query, params=None):
+        self.connection.queries.append((query, params))
+        self.query, self.params = query, params
+
+    def fetchone(self):
+        table = (self.connection.submissions if "submissions" in self.query
+                 else self.connection.users)
+        return table.get(self.params[0])
+
+    def fetchall(self):
+        return self.connection.rounds
+
+    def close(self):
+        pass
+
+
+class FakePool():
+    def __init__(self):
+        self.submissions = {"a": ("r1", "u1", "predictions.csv"),
+                            "b": ("r1", "u1", "predictions_2.csv")}
+        self.rounds = [("r1", 8, 170, "20190701/numerai_datasets.zip")]
+        self.users = {"u1": ("alice", )}
+        self.queries = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield self
+
+
+class TestSubmissionContext(unittest.TestCase):
+    def setUp(self):
+        self.pool = FakePool()
+        common.get_metadata_cache().invalidate()
+
+    def test_query(self):
+        context = common.query_submission_context(self.pool, "a")
+        self.assertEqual(context["tournament"], 8)
+        self.assertEqual(context["round_number"], 170)
+        self.assertEqual(context["dataset_path"],
+                         "20190701/numerai_datasets.zip")
+        self.assertEqual(context["s3_file"], "alice/predictions.csv")
+        self.assertEqual(self.pool.queries[0],
+                         (common.SUBMISSION_CONTEXT_QUERY, ["a"]))
+
+    def test_one_query_when_cached(self):
+        common.query_submission_context(self.pool, "a")
+        del self.pool.queries[:]
+        context = common.query_submission_context(self.pool, "b")
+        self.assertEqual(context["s3_file"], "alice/predictions_2.csv")
+        self.assertEqual(self.pool.queries,
+                         [(common.SUBMISSION_CONTEXT_QUERY, ["b"])])
+
+    def test_unknown_submission(self):
+        with self.assertRaises(ValueError):
+            common.query_submission_context(self.pool, "c")
+
+    def test_cached_on_work_item(self):
+        submission = {"submission_id": "a"}
+        context = common.get_submission_context(submission, self.pool)
+        self.assertIs(common.get_submission_context(submission, self.pool),
+                      context)
+        self.assertIs(submission["context"], context)
+        self.assertEqual(len(self.pool.queries), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""Validation Data Cache Unit Testing."""
+
+# System
+import os
+import tempfile
+from unittest import mock
+
+# Third Party
+import unittest
+import numpy as np
+import pandas as pd
+
+# First Party
+from submission_criteria import validation_cache
+from submission_criteria.disk_cache import DiskCache
+
+
+class LocalFileManager():  # pylint: disable=too-few-public-methods
+    def __init__(self, local_dir):
+        self.local_dir = local_dir
+        self.s3 = None
+        self.disk_cache = DiskCache(local_dir)
+
+
+class TestValidationCache(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        n = 300
+        self.data = pd.DataFrame({
+            "id": ["n{:06d}".format(i) for i in rng.permutation(n)],
+            "era": "era1",
+            "feature1": rng.rand(n),
+            "target_kazutsugi": rng.choice([0, 0.25, 0.5, 0.75, 1], size=n),
+        })
+        self.local_dir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.filemanager = LocalFileManager(self.local_dir.name)
+        validation_cache.invalidate()
+
+    def tearDown(self):
+        self.local_dir.cleanup()
+        validation_cache.invalidate()
+
+    def test_align(self):
+        validation_data = validation_cache.ValidationData.from_frame(self.data)
+        submission = pd.DataFrame({
+            "id": self.data["id"],
+            "probability": np.arange(len(self.data), dtype=float),
+        }).sample(frac=1, random_state=1)
+        np.testing.assert_array_equal(validation_data.align(submission),
+                                      np.arange(len(self.data)))
+        np.testing.assert_array_equal(
+            validation_data.get_target("target_kazutsugi"),
+            self.data["target_kazutsugi"])
+        with self.assertRaises(IndexError):
+            validation_data.align(submission.iloc[1:])
+
+    def test_no_eras(self):
+        validation_data = validation_cache.ValidationData.from_frame(
+            self.data.drop(columns="era"))
+        self.assertEqual(len(validation_data.era_names), 0)
+        with self.assertRaises(ValueError):
+            validation_data.get_metrics_engine(("target_kazutsugi", ))
+
+    def test_all_targets_at_once(self):
+        self.data["target_bernie"] = np.random.RandomState(1).rand(len(self.data))
+        validation_data = validation_cache.ValidationData.from_frame(self.data)
+        self.assertEqual(validation_data.target_names,
+                         ("target_bernie", "target_kazutsugi"))
+        probabilities = np.random.RandomState(2).rand(len(self.data))
+        correlations = validation_data.get_correlation(
+            validation_data.target_names)(probabilities)[0]
+        for target, correlation in zip(validation_data.target_names,
+                                       correlations):
+            self.assertAlmostEqual(
+                correlation,
+                validation_data.get_correlation(target)(probabilities)[0],
+                places=12)
+
+    def test_s3_is_read_once(self):
+        with mock.patch.object(validation_cache.tc, "get_validation_data",
+                               return_value=self.data) as get:
+            first = validation_cache.get_validation_data(self.filemanager, "v1")
+            self.assertIs(
+                validation_cache.get_validation_data(self.filemanager, "v1"),
+                first)
+            self.assertEqual(get.call_count, 1)
+
+            # A new process reads the cache file instead of S3
+            validation_cache.invalidate()
+            second = validation_cache.get_validation_data(self.filemanager, "v1")
+            self.assertEqual(get.call_count, 1)
+        self.assertTrue(
+            os.path.isfile(validation_cache.get_path(self.local_dir.name, "v1")))
+        np.testing.assert_array_equal(second.ids, first.ids)
+        np.testing.assert_array_equal(second.get_target("target_kazutsugi"),
+                                      first.get_target("target_kazutsugi"))
+        np.testing.assert_array_equal(second.era_names[second.era_codes],
+                                      self.data["era"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""Write-Behind Buffer Unit Testing."""
+
+# System
+import time
+import contextlib
+from unittest import mock
+
+# Third Party
+import unittest
+import psycopg2
+
+# First Party
+from submission_criteria import metrics
+from submission_criteria import write_buffer
+from submission_criteria.write_buffer import WriteBuffer
+
+
+class FakeConnection():
+    def __init__(self):
+        self.commits = 0
+
+    def cursor(self):
+        return mock.Mock()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class FakePool():  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.postgres_db = FakeConnection()
+
+    @contextlib.contextmanager
+    def connection(self):
+        yield self.postgres_db
+
+
+class TestWriteBuffer(unittest.TestCase):
+    def setUp(self):
+        self.pool = FakePool()
+        self.statements = []
+        patcher = mock.patch.object(write_buffer.psycopg2.extras,
+                                    "execute_values",
+                                    side_effect=self.execute_values)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def execute_values(self, _cursor, query, rows, **_kwargs):
+        self.statements.append((" ".join(query.split()), list(rows)))
+
+    def test_merged_per_submission(self):
+        buffer = WriteBuffer(self.pool, max_results=100)
+        buffer.update_submission("a", validation_correlation=0.1,
+                                 consistency=50)
+        buffer.update_submission("a", consistency=75)
+        buffer.update_submission("b", consistency=25)
+        self.assertEqual(len(buffer), 2)
+        buffer.flush()
+        self.assertEqual(self.pool.postgres_db.commits, 1)
+        rows = sorted(row for _, rows in self.statements for row in rows)
+        self.assertEqual(rows, [("a", 75.0, 0.1), ("b", 25.0)])
+        self.assertEqual(len(buffer), 0)
+
+    def test_statement_order(self):
+        buffer = WriteBuffer(self.pool, max_results=100)
+        buffer.write_concordance("a", True)
+        buffer.add_pending_concordance("a")
+        buffer.write_target_metrics("a", ["target_1", "target_2"], {
+            "consistency": [50, 75],
+        })
+        buffer.flush()
+        self.assertEqual(len(self.statements), 3)
+        self.assertTrue(self.statements[0][0].startswith(
+            "INSERT INTO concordances"))
+        self.assertTrue(self.statements[1][0].startswith(
+            "UPDATE concordances"))
+        self.assertEqual(self.statements[1][1], [("a", True)])
+        self.assertEqual(self.statements[2][1], [("a", "target_1", 50.0),
+                                                 ("a", "target_2", 75.0)])
+
+    def test_flush_on_max_results(self):
+        buffer = WriteBuffer(self.pool, max_results=3)
+        for submission_id in "abc":
+            buffer.write_concordance(submission_id, False)
+        self.assertEqual(len(self.statements), 1)
+        self.assertEqual(len(self.statements[0][1]), 3)
+        self.assertEqual(len(buffer), 0)
+
+    def test_failed_flush_kept(self):
+        buffer = WriteBuffer(self.pool, max_results=100)
+        buffer.update_submission("a", consistency=50)
+        with mock.patch.object(write_buffer.psycopg2.extras, "execute_values",
+                               side_effect=psycopg2.OperationalError()):
+            with self.assertRaises(psycopg2.OperationalError):
+                buffer.flush()
+        buffer.update_submission("a", validation_correlation=0.1)
+        buffer.flush()
+        self.assertEqual(self.statements[0][1], [("a", 50.0, 0.1)])
+
+    def test_failed_result_isolated(self):
+        buffer = WriteBuffer(self.pool, max_results=100, max_attempts=2)
+        buffer.write_concordance("a", True)
+        buffer.write_concordance("bad", True)
+        buffer.update_submission("c", consistency=50)
+
+        def execute_values(cursor, query, rows, **kwargs):
+            if any(row[0] == "bad" for row in rows):
+                raise psycopg2.DataError("invalid input syntax for uuid")
+            self.execute_values(cursor, query, rows, **kwargs)
+
+        with mock.patch.object(write_buffer.psycopg2.extras, "execute_values",
+                               side_effect=execute_values):
+            buffer.flush()
+            self.assertEqual(len(buffer), 1)
+            self.assertEqual(buffer.stats()["written"], 2)
+            buffer.flush()
+        # The statements of the rolled back transaction were executed too
+        rows = sorted(set(row for _, rows in self.statements for row in rows))
+        self.assertEqual(rows, [("a", True), ("c", 50.0)])
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual([letter[:2] for letter in buffer.dead_letters()],
+                         [("concordances", "bad")])
+        self.assertEqual(buffer.stats()["failed"], 2)
+
+    def test_full_buffer(self):
+        buffer = WriteBuffer(self.pool, max_results=100, max_pending=2)
+        buffer.write_concordance("a", True)
+        buffer.write_concordance("b", True)
+        with mock.patch.object(write_buffer.psycopg2.extras, "execute_values",
+                               side_effect=psycopg2.OperationalError()):
+            with self.assertRaises(RuntimeError):
+                buffer.write_concordance("c", True)
+            buffer.write_concordance("a", False)
+        buffer.write_concordance("c", True)
+        self.assertEqual(self.statements[0][1], [("a", False), ("b", True)])
+        self.assertEqual(len(buffer), 1)
+
+    def test_target_metrics_table(self):
+        cursor = mock.Mock()
+        postgres_db = mock.Mock()
+        postgres_db.cursor.return_value = cursor
+        write_buffer.create_target_metrics_table(postgres_db)
+        ddl = cursor.execute.call_args[0][0]
+        self.assertIn("PRIMARY KEY (submission_id, target)", ddl)
+        for metric in metrics.METRICS:
+            self.assertIn("{} double precision".format(metric), ddl)
+        postgres_db.commit.assert_called_once_with()
+
+    def test_close(self):
+        buffer = WriteBuffer(self.pool, max_results=100, max_delay=60).start()
+        buffer.write_concordance("a", True)
+        buffer.close()
+        self.assertEqual(self.statements[0][1], [("a", True)])
+        with self.assertRaises(RuntimeError):
+            buffer.write_concordance("b", True)
+
+    def test_background_flush(self):
+        buffer = WriteBuffer(self.pool, max_results=100,
+                             max_delay=0.01).start()
+        buffer.write_concordance("a", True)
+        for _ in range(500):
+            if self.statements:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.statements[0][1], [("a", True)])
+        buffer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()